@@ -7,22 +7,44 @@ Create Date: 2025-10-13
 
 from alembic import op
 import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
 
 
 # revision identifiers, used by Alembic.
-revision = '20251013_add_channel_context'
-down_revision = '001'
+revision = "20251013_add_channel_context"
+down_revision = "001"
 branch_labels = None
 depends_on = None
 
 
 def upgrade():
-    with op.batch_alter_table('conversations') as batch_op:
-        batch_op.add_column(sa.Column('channel_context', sa.JSON(), nullable=True))
+    # Adding a nullable column without a default is a metadata-only change on
+    # PostgreSQL 11+, so no table rewrite or long ACCESS EXCLUSIVE lock is needed.
+    op.add_column(
+        "conversations",
+        sa.Column(
+            "channel_context", postgresql.JSONB(astext_type=sa.Text()), nullable=True
+        ),
+        schema="tenant_template",
+    )
+    # Convert rows created before JSONB was adopted. The type change rewrites the
+    # table, so fail fast instead of queueing behind live traffic for the lock.
+    op.execute("SET LOCAL lock_timeout = '2s'")
+    op.alter_column(
+        "conversations",
+        "context",
+        type_=postgresql.JSONB(astext_type=sa.Text()),
+        postgresql_using="context::jsonb",
+        schema="tenant_template",
+    )
 
 
 def downgrade():
-    with op.batch_alter_table('conversations') as batch_op:
-        batch_op.drop_column('channel_context')
-
-
+    op.alter_column(
+        "conversations",
+        "context",
+        type_=sa.JSON(),
+        postgresql_using="context::json",
+        schema="tenant_template",
+    )
+    op.drop_column("conversations", "channel_context", schema="tenant_template")
@@ -0,0 +1,111 @@
+"""convert knowledge_chunks.embedding to pgvector
+
+Revision ID: 20251014_embedding_vector
+Revises: 20251013_add_channel_context
+Create Date: 2025-10-14
+
+Databases created before pgvector was adopted store embeddings as JSON-encoded
+strings. This migration adds a vector column, backfills it in batches by
+parsing the stored JSON, then swaps it in place of the string column.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+import orjson
+from pgvector.sqlalchemy import Vector
+
+
+# revision identifiers, used by Alembic.
+revision = "20251014_embedding_vector"
+down_revision = "20251013_add_channel_context"
+branch_labels = None
+depends_on = None
+
+SCHEMA = "tenant_template"
+EMBEDDING_DIM = 1536
+BATCH_SIZE = 1000
+
+
+def _embedding_is_vector(bind) -> bool:
+    columns = sa.inspect(bind).get_columns("knowledge_chunks", schema=SCHEMA)
+    for col in columns:
+        if col["name"] == "embedding":
+            return (
+                isinstance(col["type"], Vector) or "vector" in str(col["type"]).lower()
+            )
+    return False
+
+
+def upgrade():
+    bind = op.get_bind()
+    op.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    if not _embedding_is_vector(bind):
+        op.add_column(
+            "knowledge_chunks",
+            sa.Column("embedding_vec", Vector(EMBEDDING_DIM), nullable=True),
+            schema=SCHEMA,
+        )
+
+        with op.get_context().autocommit_block():
+            # Keyset pagination keeps each batch an index range scan; commits per batch
+            select_batch = sa.text(
+                f"SELECT id, embedding FROM {SCHEMA}.knowledge_chunks "
+                "WHERE embedding IS NOT NULL AND id > :last_id ORDER BY id LIMIT :limit"
+            )
+            update_row = sa.text(
+                f"UPDATE {SCHEMA}.knowledge_chunks "
+                "SET embedding_vec = CAST(:vec AS vector) WHERE id = :id"
+            )
+            last_id = "00000000-0000-0000-0000-000000000000"
+            while True:
+                rows = bind.execute(
+                    select_batch, {"last_id": last_id, "limit": BATCH_SIZE}
+                ).fetchall()
+                if not rows:
+                    break
+                params = []
+                for row_id, raw in rows:
+                    try:
+                        values = orjson.loads(raw)
+                    except orjson.JSONDecodeError:
+                        continue
+                    # Vectors of a different dimension (e.g. dev fallback embeddings)
+                    # cannot be stored
+                    if isinstance(values, list) and len(values) == EMBEDDING_DIM:
+                        params.append(
+                            {"id": row_id, "vec": orjson.dumps(values).decode("utf-8")}
+                        )
+                if params:
+                    bind.execute(update_row, params)
+                last_id = rows[-1][0]
+
+        op.drop_column("knowledge_chunks", "embedding", schema=SCHEMA)
+        op.alter_column(
+            "knowledge_chunks",
+            "embedding_vec",
+            new_column_name="embedding",
+            schema=SCHEMA,
+        )
+
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS "
+            "ix_tenant_template_knowledge_chunks_embedding_hnsw "
+            f"ON {SCHEMA}.knowledge_chunks USING hnsw (embedding vector_cosine_ops) "
+            "WITH (m = 16, ef_construction = 64)"
+        )
+
+
+def downgrade():
+    op.execute(
+        f"DROP INDEX IF EXISTS "
+        f"{SCHEMA}.ix_tenant_template_knowledge_chunks_embedding_hnsw"
+    )
+    # pgvector's text representation ("[1,2,3]") is valid JSON
+    op.alter_column(
+        "knowledge_chunks",
+        "embedding",
+        type_=sa.String(),
+        postgresql_using="embedding::text",
+        schema=SCHEMA,
+    )
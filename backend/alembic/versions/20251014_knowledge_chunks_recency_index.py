@@ -0,0 +1,62 @@
+"""index knowledge_chunks for the tenant corpus scan
+
+Revision ID: 20251014_chunks_recency_index
+Revises: 20251014_embedding_vector
+Create Date: 2025-10-14
+
+The query path loads a tenant's most recent chunks through
+knowledge_bases -> documents -> knowledge_chunks ordered by created_at. A
+composite (document_id, created_at DESC) index serves both the join probe and
+the ordering, and its leading column replaces the single-column document_id
+index.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20251014_chunks_recency_index"
+down_revision = "20251014_embedding_vector"
+branch_labels = None
+depends_on = None
+
+SCHEMA = "tenant_template"
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_tenant_template_knowledge_chunks_document_id_created_at",
+            "knowledge_chunks",
+            ["document_id", sa.text("created_at DESC")],
+            schema=SCHEMA,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            "ix_tenant_template_knowledge_chunks_document_id",
+            table_name="knowledge_chunks",
+            schema=SCHEMA,
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_tenant_template_knowledge_chunks_document_id",
+            "knowledge_chunks",
+            ["document_id"],
+            schema=SCHEMA,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            "ix_tenant_template_knowledge_chunks_document_id_created_at",
+            table_name="knowledge_chunks",
+            schema=SCHEMA,
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -0,0 +1,48 @@
+"""add full-text search column to knowledge_chunks
+
+Revision ID: 20251015_chunks_content_tsv
+Revises: 20251014_chunks_recency_index
+Create Date: 2025-10-15
+
+Person lookups in the query path can then find matching rows with an indexed
+full-text match instead of scanning the tenant's corpus in Python. The
+'simple' configuration avoids stemming and stop words, which would otherwise
+mangle personal names.
+"""
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "20251015_chunks_content_tsv"
+down_revision = "20251014_chunks_recency_index"
+branch_labels = None
+depends_on = None
+
+SCHEMA = "tenant_template"
+
+
+def upgrade():
+    # A stored generated column rewrites the table; fail fast rather than queue
+    # behind live traffic
+    op.execute("SET LOCAL lock_timeout = '2s'")
+    op.execute(
+        f"ALTER TABLE {SCHEMA}.knowledge_chunks "
+        "ADD COLUMN IF NOT EXISTS content_tsv tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('simple', content)) STORED"
+    )
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS "
+            "ix_tenant_template_knowledge_chunks_content_tsv "
+            f"ON {SCHEMA}.knowledge_chunks USING gin (content_tsv)"
+        )
+
+
+def downgrade():
+    op.execute(
+        f"DROP INDEX IF EXISTS {SCHEMA}.ix_tenant_template_knowledge_chunks_content_tsv"
+    )
+    op.execute(
+        f"ALTER TABLE {SCHEMA}.knowledge_chunks DROP COLUMN IF EXISTS content_tsv"
+    )
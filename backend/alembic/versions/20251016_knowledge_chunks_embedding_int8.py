@@ -0,0 +1,41 @@
+"""add int8-quantized embedding columns to knowledge_chunks
+
+Revision ID: 20251016_chunks_embedding_int8
+Revises: 20251015_chunks_content_tsv
+Create Date: 2025-10-16
+
+The query path can score a tenant's rows against int8 codes of their unit-length
+embeddings (one byte per dimension plus a per-row scale) instead of fetching the
+float32 vectors. Existing rows keep NULL codes and are quantized on load.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20251016_chunks_embedding_int8"
+down_revision = "20251015_chunks_content_tsv"
+branch_labels = None
+depends_on = None
+
+SCHEMA = "tenant_template"
+
+
+def upgrade():
+    # Nullable columns without defaults are metadata-only changes, no table rewrite
+    op.add_column(
+        "knowledge_chunks",
+        sa.Column("embedding_i8", sa.LargeBinary(), nullable=True),
+        schema=SCHEMA,
+    )
+    op.add_column(
+        "knowledge_chunks",
+        sa.Column("embedding_scale", sa.Float(), nullable=True),
+        schema=SCHEMA,
+    )
+
+
+def downgrade():
+    op.drop_column("knowledge_chunks", "embedding_scale", schema=SCHEMA)
+    op.drop_column("knowledge_chunks", "embedding_i8", schema=SCHEMA)
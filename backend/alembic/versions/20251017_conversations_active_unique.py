@@ -0,0 +1,65 @@
+"""unique ACTIVE conversation per tenant, user and channel
+
+Revision ID: 20251017_conversations_active_uq
+Revises: 20251016_chunks_embedding_int8
+Create Date: 2025-10-17
+
+get_or_create_conversation upserts against a partial unique index on
+(tenant_id, user_id, channel) WHERE status = 'ACTIVE', so a returning user is
+one INSERT ... ON CONFLICT round trip and concurrent webhooks cannot open
+duplicates. Duplicates left by the old SELECT-then-INSERT path are closed
+first: the most recently started ACTIVE conversation of each group is kept.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20251017_conversations_active_uq"
+down_revision = "20251016_chunks_embedding_int8"
+branch_labels = None
+depends_on = None
+
+SCHEMA = "tenant_template"
+
+
+def upgrade():
+    op.execute(
+        f"""
+        UPDATE {SCHEMA}.conversations AS c
+        SET status = 'COMPLETED', completed_at = COALESCE(c.completed_at, now())
+        FROM (
+            SELECT id, row_number() OVER (
+                PARTITION BY tenant_id, user_id, channel
+                ORDER BY started_at DESC NULLS LAST, id
+            ) AS rn
+            FROM {SCHEMA}.conversations
+            WHERE status = 'ACTIVE'
+        ) AS d
+        WHERE c.id = d.id AND d.rn > 1
+        """
+    )
+    # autocommit_block commits the update before building the index concurrently
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "uq_tenant_template_conversations_active",
+            "conversations",
+            ["tenant_id", "user_id", "channel"],
+            unique=True,
+            schema=SCHEMA,
+            postgresql_where=sa.text("status = 'ACTIVE'"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "uq_tenant_template_conversations_active",
+            table_name="conversations",
+            schema=SCHEMA,
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
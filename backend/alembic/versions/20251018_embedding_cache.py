@@ -0,0 +1,38 @@
+"""add embedding_cache for reusing chunk embeddings across ingests
+
+Revision ID: 20251018_embedding_cache
+Revises: 20251017_conversations_active_uq
+Create Date: 2025-10-18
+
+DocumentService.embed looks chunk vectors up by (model, SHA-256 of the text)
+before calling the embeddings API, so re-ingested or duplicated content is not
+embedded twice. The model is part of the key so vectors never cross models.
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20251018_embedding_cache"
+down_revision = "20251017_conversations_active_uq"
+branch_labels = None
+depends_on = None
+
+SCHEMA = "tenant_template"
+
+
+def upgrade():
+    op.create_table(
+        "embedding_cache",
+        sa.Column("model", sa.String(100), nullable=False),
+        sa.Column("content_sha256", sa.LargeBinary(32), nullable=False),
+        sa.Column("embedding", sa.LargeBinary(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("model", "content_sha256"),
+        schema=SCHEMA,
+    )
+
+
+def downgrade():
+    op.drop_table("embedding_cache", schema=SCHEMA)
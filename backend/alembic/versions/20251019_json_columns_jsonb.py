@@ -0,0 +1,58 @@
+"""convert the remaining JSON columns to JSONB
+
+Revision ID: 20251019_json_columns_jsonb
+Revises: 20251018_embedding_cache
+Create Date: 2025-10-19
+
+Revision 001 now declares JSONB, but that only reaches databases created after
+the change. Databases upgraded from the original 001 still have JSON for the
+columns below (20251013 converted only conversations.context). Columns that
+are already JSONB are skipped, so new databases are not rewritten.
+"""
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "20251019_json_columns_jsonb"
+down_revision = "20251018_embedding_cache"
+branch_labels = None
+depends_on = None
+
+SCHEMA = "tenant_template"
+
+COLUMNS = [
+    ("tenants", "settings"),
+    ("users", "preferences"),
+    ("messages", "metadata"),
+    ("documents", "metadata"),
+    ("knowledge_chunks", "metadata"),
+]
+
+
+def upgrade():
+    # Each type change rewrites its table; fail fast instead of queueing behind
+    # live traffic for the lock
+    op.execute("SET LOCAL lock_timeout = '2s'")
+    for table, column in COLUMNS:
+        op.execute(
+            f"""
+            DO $$
+            BEGIN
+                IF EXISTS (
+                    SELECT 1 FROM information_schema.columns
+                    WHERE table_schema = '{SCHEMA}' AND table_name = '{table}'
+                      AND column_name = '{column}' AND data_type = 'json'
+                ) THEN
+                    ALTER TABLE {SCHEMA}.{table}
+                        ALTER COLUMN {column} TYPE JSONB USING {column}::jsonb;
+                END IF;
+            END
+            $$
+            """
+        )
+
+
+def downgrade():
+    # 001 declares these columns JSONB, so JSONB is also the state before this revision
+    pass
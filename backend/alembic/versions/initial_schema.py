@@ -7,6 +7,8 @@ Create Date: 2025-10-13 14:47:00.000000
 """
 from alembic import op
 import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from pgvector.sqlalchemy import Vector
 
 # revision identifiers, used by Alembic.
 revision = '001'
@@ -17,6 +19,8 @@ depends_on = None
 def upgrade() -> None:
     # Create tenant template schema
     op.execute("CREATE SCHEMA IF NOT EXISTS tenant_template")
+    # pgvector stores embeddings as packed float32 arrays with ANN index support
+    op.execute("CREATE EXTENSION IF NOT EXISTS vector")
 
     # Create base tables in tenant_template
     op.create_table('tenants',
@@ -24,7 +28,7 @@ def upgrade() -> None:
         sa.Column('name', sa.String(255), nullable=False),
         sa.Column('domain', sa.String(255), nullable=False),
         sa.Column('subscription_tier', sa.String(50), nullable=True),
-        sa.Column('settings', sa.JSON(), nullable=True),
+        sa.Column('settings', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
         sa.Column('created_at', sa.DateTime(), nullable=True),
         sa.Column('updated_at', sa.DateTime(), nullable=True),
         sa.PrimaryKeyConstraint('id'),
@@ -39,7 +43,7 @@ def upgrade() -> None:
         sa.Column('external_id', sa.String(255), nullable=True),
         sa.Column('user_type', sa.String(50), nullable=False),
         sa.Column('role', sa.String(50), nullable=True),
-        sa.Column('preferences', sa.JSON(), nullable=True),
+        sa.Column('preferences', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
         sa.Column('last_active_at', sa.DateTime(), nullable=True),
         sa.Column('created_at', sa.DateTime(), nullable=True),
         sa.ForeignKeyConstraint(['tenant_id'], ['tenant_template.tenants.id'], ondelete='CASCADE'),
@@ -53,7 +57,7 @@ def upgrade() -> None:
         sa.Column('user_id', sa.UUID(), nullable=False),
         sa.Column('channel', sa.String(50), nullable=False),
         sa.Column('status', sa.String(50), nullable=True),
-        sa.Column('context', sa.JSON(), nullable=True),
+        sa.Column('context', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
         sa.Column('started_at', sa.DateTime(), nullable=True),
         sa.Column('last_message_at', sa.DateTime(), nullable=True),
         sa.Column('completed_at', sa.DateTime(), nullable=True),
@@ -69,7 +73,7 @@ def upgrade() -> None:
         sa.Column('sender_type', sa.String(50), nullable=False),
         sa.Column('content', sa.Text(), nullable=False),
         sa.Column('message_type', sa.String(50), nullable=True),
-        sa.Column('metadata', sa.JSON(), nullable=True),
+        sa.Column('metadata', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
         sa.Column('timestamp', sa.DateTime(), nullable=True),
         sa.Column('is_processed', sa.Boolean(), nullable=True),
         sa.ForeignKeyConstraint(['conversation_id'], ['tenant_template.conversations.id'], ondelete='CASCADE'),
@@ -97,7 +101,7 @@ def upgrade() -> None:
         sa.Column('title', sa.String(255), nullable=False),
         sa.Column('content', sa.Text(), nullable=False),
         sa.Column('source_url', sa.String(500), nullable=True),
-        sa.Column('metadata', sa.JSON(), nullable=True),
+        sa.Column('metadata', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
         sa.Column('status', sa.String(50), nullable=True),
         sa.Column('chunk_count', sa.Integer(), nullable=True),
         sa.Column('created_at', sa.DateTime(), nullable=True),
@@ -112,35 +116,68 @@ def upgrade() -> None:
         sa.Column('document_id', sa.UUID(), nullable=False),
         sa.Column('content', sa.Text(), nullable=False),
         sa.Column('chunk_index', sa.Integer(), nullable=False),
-        sa.Column('embedding', sa.String(), nullable=True),  # Vector data stored as JSON string
-        sa.Column('metadata', sa.JSON(), nullable=True),
+        sa.Column('embedding', Vector(1536), nullable=True),  # text-embedding-3-small dimension
+        sa.Column('metadata', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
         sa.Column('created_at', sa.DateTime(), nullable=True),
         sa.ForeignKeyConstraint(['document_id'], ['tenant_template.documents.id'], ondelete='CASCADE'),
         sa.PrimaryKeyConstraint('id'),
         schema='tenant_template'
     )
 
-    # Create indexes for performance
-    op.create_index('ix_tenant_template_users_tenant_id', 'users', ['tenant_id'], schema='tenant_template')
-    op.create_index('ix_tenant_template_conversations_tenant_id', 'conversations', ['tenant_id'], schema='tenant_template')
-    op.create_index('ix_tenant_template_conversations_user_id', 'conversations', ['user_id'], schema='tenant_template')
-    op.create_index('ix_tenant_template_conversations_status', 'conversations', ['status'], schema='tenant_template')
-    op.create_index('ix_tenant_template_messages_conversation_id', 'messages', ['conversation_id'], schema='tenant_template')
-    op.create_index('ix_tenant_template_messages_timestamp', 'messages', ['timestamp'], schema='tenant_template')
-    op.create_index('ix_tenant_template_documents_knowledge_base_id', 'documents', ['knowledge_base_id'], schema='tenant_template')
-    op.create_index('ix_tenant_template_knowledge_bases_tenant_id', 'knowledge_bases', ['tenant_id'], schema='tenant_template')
-    op.create_index('ix_tenant_template_knowledge_chunks_document_id', 'knowledge_chunks', ['document_id'], schema='tenant_template')
+    # Create indexes for performance. CREATE INDEX CONCURRENTLY cannot run inside a
+    # transaction, so the index builds happen in an autocommit block after the DDL
+    # above has committed; this avoids holding ACCESS EXCLUSIVE locks during builds.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_tenant_template_users_tenant_id', 'users', ['tenant_id'], schema='tenant_template', postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_tenant_template_conversations_user_id', 'conversations', ['user_id'], schema='tenant_template', postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_tenant_template_conversations_status', 'conversations', ['status'], schema='tenant_template', postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_tenant_template_messages_timestamp', 'messages', ['timestamp'], schema='tenant_template', postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_tenant_template_documents_knowledge_base_id', 'documents', ['knowledge_base_id'], schema='tenant_template', postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_tenant_template_knowledge_bases_tenant_id', 'knowledge_bases', ['tenant_id'], schema='tenant_template', postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_tenant_template_knowledge_chunks_document_id', 'knowledge_chunks', ['document_id'], schema='tenant_template', postgresql_concurrently=True, if_not_exists=True)
+
+        # Composite indexes matching hot-path predicates. Their leading columns also
+        # cover the FK lookups on messages.conversation_id and conversations.tenant_id.
+        op.create_index(
+            'ix_tenant_template_messages_conversation_id_timestamp', 'messages',
+            ['conversation_id', sa.text('timestamp DESC')],
+            schema='tenant_template', postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.create_index(
+            'ix_tenant_template_conversations_tenant_user_last_message', 'conversations',
+            ['tenant_id', 'user_id', sa.text('last_message_at DESC')],
+            schema='tenant_template', postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.create_index(
+            'ix_tenant_template_conversations_tenant_id_active', 'conversations',
+            ['tenant_id', 'status'],
+            schema='tenant_template', postgresql_where=sa.text("status = 'ACTIVE'"),
+            postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.create_index(
+            'ix_tenant_template_documents_knowledge_base_id_status', 'documents',
+            ['knowledge_base_id', 'status'],
+            schema='tenant_template', postgresql_concurrently=True, if_not_exists=True,
+        )
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tenant_template_knowledge_chunks_embedding_hnsw "
+            "ON tenant_template.knowledge_chunks USING hnsw (embedding vector_cosine_ops) "
+            "WITH (m = 16, ef_construction = 64)"
+        )
 
 def downgrade() -> None:
     # Drop indexes
+    op.execute("DROP INDEX IF EXISTS tenant_template.ix_tenant_template_knowledge_chunks_embedding_hnsw")
+    op.drop_index('ix_tenant_template_documents_knowledge_base_id_status', table_name='documents', schema='tenant_template')
+    op.drop_index('ix_tenant_template_conversations_tenant_id_active', table_name='conversations', schema='tenant_template')
+    op.drop_index('ix_tenant_template_conversations_tenant_user_last_message', table_name='conversations', schema='tenant_template')
+    op.drop_index('ix_tenant_template_messages_conversation_id_timestamp', table_name='messages', schema='tenant_template')
     op.drop_index('ix_tenant_template_knowledge_chunks_document_id', table_name='knowledge_chunks', schema='tenant_template')
     op.drop_index('ix_tenant_template_knowledge_bases_tenant_id', table_name='knowledge_bases', schema='tenant_template')
     op.drop_index('ix_tenant_template_documents_knowledge_base_id', table_name='documents', schema='tenant_template')
     op.drop_index('ix_tenant_template_messages_timestamp', table_name='messages', schema='tenant_template')
-    op.drop_index('ix_tenant_template_messages_conversation_id', table_name='messages', schema='tenant_template')
     op.drop_index('ix_tenant_template_conversations_status', table_name='conversations', schema='tenant_template')
     op.drop_index('ix_tenant_template_conversations_user_id', table_name='conversations', schema='tenant_template')
-    op.drop_index('ix_tenant_template_conversations_tenant_id', table_name='conversations', schema='tenant_template')
     op.drop_index('ix_tenant_template_users_tenant_id', table_name='users', schema='tenant_template')
 
     # Drop tables
@@ -4,42 +4,76 @@ Quick check of API key format
 import os
 from pathlib import Path
 
-# Load from .env
-from dotenv import load_dotenv
+# Read .env once; process environment takes precedence like load_dotenv
+from dotenv import dotenv_values
 env_file = Path(__file__).parent / ".env"
-load_dotenv(env_file)
-
-key = os.getenv("OPENAI_API_KEY", "")
-
-print("=" * 60)
-print("API Key Status Check")
-print("=" * 60)
-
-if not key:
-    print("❌ No API key found in environment!")
-else:
-    print(f"📏 Length: {len(key)} characters")
-    print(f"🔤 Starts with: {key[:10]}...")
-    print(f"🔤 Ends with: ...{key[-4:]}")
-    
-    if len(key) > 60:
-        print("\n❌ KEY IS TOO LONG!")
-        print("   OpenAI keys are ~51-56 characters")
-        print("   Your key appears to be corrupted or has extra characters")
-        print("\n🔧 TO FIX:")
-        print("   1. Get a fresh key from https://platform.openai.com/api-keys")
-        print("   2. Run: python update_key.py")
-    elif len(key) < 40:
-        print("\n❌ KEY IS TOO SHORT!")
-        print("   Make sure you copied the entire key")
-    elif not key.startswith("sk-"):
-        print("\n⚠️  Key doesn't start with 'sk-'")
-        print("   This doesn't look like a valid OpenAI key")
-    else:
-        print("\n✅ Key format looks correct!")
-        print("   If you still get errors, the key might be:")
-        print("   • Revoked or expired")
-        print("   • From a different account")
-        print("   • Missing billing setup")
-
-print("=" * 60)
\ No newline at end of file
+ENV_VALUES = dotenv_values(env_file)
+
+MISSING = "MISSING"
+TOO_LONG = "TOO_LONG"
+TOO_SHORT = "TOO_SHORT"
+BAD_PREFIX = "BAD_PREFIX"
+OK = "OK"
+
+MESSAGES = {
+    MISSING: "❌ No API key found in environment!",
+    TOO_LONG: (
+        "\n❌ KEY IS TOO LONG!\n"
+        "   OpenAI keys are ~51-56 characters\n"
+        "   Your key appears to be corrupted or has extra characters\n"
+        "\n🔧 TO FIX:\n"
+        "   1. Get a fresh key from https://platform.openai.com/api-keys\n"
+        "   2. Run: python update_key.py"
+    ),
+    TOO_SHORT: (
+        "\n❌ KEY IS TOO SHORT!\n"
+        "   Make sure you copied the entire key"
+    ),
+    BAD_PREFIX: (
+        "\n⚠️  Key doesn't start with 'sk-'\n"
+        "   This doesn't look like a valid OpenAI key"
+    ),
+    OK: (
+        "\n✅ Key format looks correct!\n"
+        "   If you still get errors, the key might be:\n"
+        "   • Revoked or expired\n"
+        "   • From a different account\n"
+        "   • Missing billing setup"
+    ),
+}
+
+
+def check_key_format(key: str) -> str:
+    """Return the format status of an API key without printing anything."""
+    if not key:
+        return MISSING
+    data = key.encode("utf-8")
+    n = len(data)
+    if n > 60:
+        return TOO_LONG
+    if n < 40:
+        return TOO_SHORT
+    if not data.startswith(b"sk-"):
+        return BAD_PREFIX
+    return OK
+
+
+def main() -> None:
+    key = os.getenv("OPENAI_API_KEY") or ENV_VALUES.get("OPENAI_API_KEY") or ""
+    status = check_key_format(key)
+
+    print("=" * 60)
+    print("API Key Status Check")
+    print("=" * 60)
+
+    if status != MISSING:
+        print(f"📏 Length: {len(key)} characters")
+        print(f"🔤 Starts with: {key[:10]}...")
+        print(f"🔤 Ends with: ...{key[-4:]}")
+    print(MESSAGES[status])
+
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
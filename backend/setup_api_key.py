@@ -1,18 +1,28 @@
 """
 Interactive script to set up and verify OpenAI API key.
 """
+import argparse
 import os
+import re
 import sys
 from pathlib import Path
 from getpass import getpass
+from dotenv import dotenv_values
 
-def setup_api_key():
+ENV_FILE = Path(__file__).parent / ".env"
+# Parsed once at import; process environment takes precedence
+ENV_VALUES = dotenv_values(ENV_FILE) if ENV_FILE.exists() else {}
+
+# Local format check used in offline mode (no network, no openai import)
+KEY_FORMAT = re.compile(r"sk-(proj-)?[A-Za-z0-9_-]{40,200}")
+
+def setup_api_key(offline: bool = False):
     """Interactive setup for OpenAI API key."""
     print("=" * 60)
     print("OpenAI API Key Setup for Omnichannel Chatbot")
     print("=" * 60)
     
-    env_file = Path(__file__).parent / ".env"
+    env_file = ENV_FILE
     
     print("\n📌 Important Information:")
     print("1. Your OpenAI API key should start with 'sk-'")
@@ -23,7 +33,7 @@ def setup_api_key():
     print("\n" + "-" * 40)
     
     # Check current key
-    current_key = os.getenv("OPENAI_API_KEY", "")
+    current_key = os.getenv("OPENAI_API_KEY") or ENV_VALUES.get("OPENAI_API_KEY") or ""
     if current_key:
         masked = current_key[:7] + "..." + current_key[-4:] if len(current_key) > 11 else "***"
         print(f"\n✓ Current API key found: {masked}")
@@ -66,51 +76,47 @@ def setup_api_key():
     print(f"  • Ends with: ...{new_key[-4:]}")
     
     # Test the key
-    print("\n🔄 Testing API key...")
-    try:
-        from openai import OpenAI
-        client = OpenAI(api_key=new_key)
-        
-        # Try to list models
-        response = client.models.list()
-        print("✓ Successfully connected to OpenAI API!")
-        
-        # Try embedding
-        test_embedding = client.embeddings.create(
-            model="text-embedding-3-small",
-            input="test"
-        )
-        print("✓ Embedding model access confirmed!")
-        
-    except Exception as e:
-        print(f"✗ Error testing API key: {e}")
-        print("\n⚠️ The API key appears to be invalid or lacks permissions.")
-        save_anyway = input("Save it anyway? (y/n): ").lower()
-        if save_anyway != 'y':
-            print("Setup cancelled.")
-            return
+    if offline:
+        print("\n🔄 Checking API key format (offline)...")
+        if KEY_FORMAT.fullmatch(new_key):
+            print("✓ Key format looks valid (not verified against the API)")
+        else:
+            print("✗ Key format does not match the expected OpenAI key pattern")
+            save_anyway = input("Save it anyway? (y/n): ").lower()
+            if save_anyway != 'y':
+                print("Setup cancelled.")
+                return
+    else:
+        print("\n🔄 Testing API key...")
+        try:
+            from openai import OpenAI
+            client = OpenAI(api_key=new_key)
+
+            # A single model lookup confirms the key and embedding model access
+            client.models.retrieve("text-embedding-3-small")
+            print("✓ Successfully connected to OpenAI API!")
+            print("✓ Embedding model access confirmed!")
+
+        except Exception as e:
+            print(f"✗ Error testing API key: {e}")
+            print("\n⚠️ The API key appears to be invalid or lacks permissions.")
+            save_anyway = input("Save it anyway? (y/n): ").lower()
+            if save_anyway != 'y':
+                print("Setup cancelled.")
+                return
     
     # Update .env file
     print("\n📝 Updating .env file...")
     
     if env_file.exists():
-        with open(env_file, 'r') as f:
-            lines = f.readlines()
-        
-        # Find and replace the OPENAI_API_KEY line
-        updated = False
-        for i, line in enumerate(lines):
-            if line.strip().startswith('OPENAI_API_KEY='):
-                lines[i] = f'OPENAI_API_KEY={new_key}\n'
-                updated = True
-                break
-        
-        if not updated:
+        # Substitute the key line in the whole file instead of rebuilding a line list
+        data = env_file.read_bytes()
+        key_line = f'OPENAI_API_KEY={new_key}'.encode()
+        updated, count = re.subn(rb'^[ \t]*OPENAI_API_KEY=[^\r\n]*', lambda _m: key_line, data, count=1, flags=re.M)
+        if not count:
             # Add the key if not found
-            lines.insert(0, f'OPENAI_API_KEY={new_key}\n')
-        
-        with open(env_file, 'w') as f:
-            f.writelines(lines)
+            updated = key_line + b'\n' + data
+        env_file.write_bytes(updated)
     else:
         # Create new .env file
         with open(env_file, 'w') as f:
@@ -139,4 +145,11 @@ def setup_api_key():
     print("=" * 60)
 
 if __name__ == "__main__":
-    setup_api_key()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Set up and verify the OpenAI API key.")
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="only validate the key format locally; skip the OpenAI API round-trip",
+    )
+    args = parser.parse_args()
+    setup_api_key(offline=args.offline)
\ No newline at end of file
@@ -1,46 +1,95 @@
 """
 Internal knowledge API with JWT-based RBAC.
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Header
+from fastapi import APIRouter, Depends, HTTPException, status, Header, Request
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
 from typing import Optional, Dict, Any, List
+from cachetools import TTLCache
+import hashlib
+import orjson
+import threading
+import time
 from shared.database.session import get_db
 from ai_core.services.internal_knowledge_service import InternalKnowledgeService
 from shared.security.jwt import JWTService
 
-router = APIRouter(prefix="/v1/internal", tags=["internal-knowledge"])
+router = APIRouter(prefix="/v1/internal", tags=["internal-knowledge"], default_response_class=ORJSONResponse)
 jwt_service = JWTService()
 
+# Verified token payloads keyed by the token's SHA-256, so raw bearer tokens are not held in
+# memory; skips signature checks for repeat callers. A revoked token keeps being accepted
+# until its entry expires, up to TOKEN_CACHE_TTL_SECONDS after revocation.
+TOKEN_CACHE_TTL_SECONDS = 60
+_token_cache: TTLCache = TTLCache(maxsize=10_000, ttl=TOKEN_CACHE_TTL_SECONDS)
+_token_cache_lock = threading.Lock()
+
 
 def parse_bearer(auth: Optional[str]) -> str:
     if not auth:
         raise HTTPException(status_code=401, detail="Authorization required")
-    parts = auth.split()
-    if len(parts) != 2 or parts[0].lower() != "bearer":
+    # Prefix check plus one slice; avoids split()'s list allocation on every request
+    # Like split(), any whitespace may separate the scheme from the token
+    if auth[:6].lower() != "bearer" or not auth[6:7].isspace():
+        raise HTTPException(status_code=401, detail="Invalid authorization header")
+    token = auth[6:].strip()
+    if not token or any(c.isspace() for c in token):
         raise HTTPException(status_code=401, detail="Invalid authorization header")
-    return parts[1]
+    return token
+
+
+def verify_token_cached(token: str) -> Optional[Dict[str, Any]]:
+    key = hashlib.sha256(token.encode()).digest()
+    with _token_cache_lock:
+        payload = _token_cache.get(key)
+    if payload is not None:
+        return payload
+    payload = jwt_service.verify_token(token)
+    # Only cache tokens that stay valid for longer than the cache entry lives
+    if payload and payload.get("exp", 0) > time.time() + TOKEN_CACHE_TTL_SECONDS:
+        with _token_cache_lock:
+            _token_cache[key] = payload
+    return payload
+
+
+async def orjson_body(request: Request) -> Dict[str, Any]:
+    """Parse the JSON request body with orjson instead of the stdlib decoder."""
+    try:
+        body = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="JSON body must be an object")
+    return body
+
+
+def get_internal_kb(db: Session = Depends(get_db)) -> InternalKnowledgeService:
+    return InternalKnowledgeService(db)
 
 
 @router.get("/knowledge/list")
-def list_knowledge(authorization: Optional[str] = Header(None), db: Session = Depends(get_db)) -> List[Dict[str, Any]]:
+def list_knowledge(
+    authorization: Optional[str] = Header(None), svc: InternalKnowledgeService = Depends(get_internal_kb)
+) -> List[Dict[str, Any]]:
     token = parse_bearer(authorization)
-    payload = jwt_service.verify_token(token)
+    payload = verify_token_cached(token)
     if not payload:
         raise HTTPException(status_code=401, detail="Invalid token")
     role = payload.get("role", "END_USER")
     tenant_id = payload.get("tenant_id")
     if not tenant_id:
         raise HTTPException(status_code=400, detail="tenant_id missing in token")
-    svc = InternalKnowledgeService(db)
     return svc.list_documents(tenant_id=tenant_id, role=role)
 
 
 @router.post("/knowledge/update")
 def update_knowledge(
-    body: Dict[str, Any], authorization: Optional[str] = Header(None), db: Session = Depends(get_db)
+    body: Dict[str, Any] = Depends(orjson_body),
+    authorization: Optional[str] = Header(None),
+    svc: InternalKnowledgeService = Depends(get_internal_kb),
 ) -> Dict[str, Any]:
     token = parse_bearer(authorization)
-    payload = jwt_service.verify_token(token)
+    payload = verify_token_cached(token)
     if not payload:
         raise HTTPException(status_code=401, detail="Invalid token")
     role = payload.get("role", "END_USER")
@@ -48,7 +97,6 @@ def update_knowledge(
     updates = body.get("updates", {})
     if not doc_id:
         raise HTTPException(status_code=400, detail="Missing id")
-    svc = InternalKnowledgeService(db)
     try:
         return svc.update_document(role=role, document_id=doc_id, updates=updates)
     except PermissionError as e:
@@ -1,257 +1,657 @@
 """
 Query API router integrating conversation and RAG services.
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
-from ai_core.models.message import QueryRequest, QueryResponse
-from ai_core.services.conversation_service import ConversationService
+from typing import Optional
+from ai_core.models.message import Citation, QueryRequest, QueryResponse
+from ai_core.services.conversation_service import conversation_service
 from ai_core.services.rag_service import RAGService
-from ai_core.services.document_service import DocumentService
+from ai_core.services.embedding_batcher import EmbeddingBatcher
+from ai_core.services.message_batcher import MessageBatcher
+from ai_core.services.semantic_cache import semantic_cache
+from ai_core.services.tenant_corpus import (
+    column_index,
+    corpus_fingerprint,
+    find_rows_by_name,
+    get_tenant_corpus,
+    has_content_tsv,
+    norm_col,
+    norm_name,
+    parse_csv_row,
+    peek_tenant_corpus,
+    row_name_keys,
+)
 from shared.database.session import get_db
-from shared.database.models import KnowledgeChunk, Document, KnowledgeBase
-import csv, io
+import anyio
+import asyncio
+import os
+from contextlib import closing
+from functools import partial
 import uuid
-import numpy as np
 import re
 
-router = APIRouter(prefix="/v1", tags=["query"])
+router = APIRouter(prefix="/v1", tags=["query"], default_response_class=ORJSONResponse)
 
 rag_service = RAGService()
+# Concurrent queries share one embeddings request
+embedding_batcher = EmbeddingBatcher(rag_service.embed_queries)
+# Reply log rows from concurrent requests share one INSERT and commit
+message_batcher = MessageBatcher(conversation_service.write_messages)
+
+# Patterns used by the request helpers, compiled once at import
+_DIGIT_RE = re.compile(r"\d")
+_NEXT_CHAPTER_RE = re.compile(r"next\s+chapter\s+after\s+chapter\s+(\d+)")
+_CHAPTER_HEADING_RE = re.compile(r"^chapter\s+(\d+)\s*[\.:\-]?\s*(.*)$", re.IGNORECASE)
+_LIST_FIRST_RE = re.compile(r"\b(first|top)\s+(\d+)\b.*?(?:of|in)\s+(.+)$")
+_LIST_NEXT_RE = re.compile(r"\b(next|subsequent)\s+(\d+)\b(?:.*?(?:of|in)\s+(.+))?")
+_LIST_ITEM_RE = re.compile(r"^(?:[-*•]\s+|\d+[\.)]\s+)")
+_PERSON_RE = re.compile(r"(?:of|for)\s+([^?]+)", re.IGNORECASE)
+# Re-rank RAG candidates by embedding similarity (otherwise lexical hybrid only)
+USE_EMBEDDING_RERANK = os.getenv("RAG_EMBEDDING_RERANK", "true").lower() == "true"
+# Exact-name rows to collect from a streamed SQL lookup before stopping
+MAX_PERSON_MATCHES = 5
+# Worker threads reserved for query handling, separate from the shared default pool
+QUERY_WORKER_THREADS = int(os.getenv("QUERY_WORKER_THREADS", "40"))
+_query_limiter: Optional[anyio.CapacityLimiter] = None
+_query_limiter_loop: Optional[asyncio.AbstractEventLoop] = None
+
+try:
+    import ahocorasick
+except ImportError:  # optional; plain substring checks are used instead
+    ahocorasick = None
+
+# Protected attributes: word stems plus inflections ("races", "religious",
+# "ethnicities"), anchored at word starts so "racehorse" or "trace" don't trip the guard
+_SENSITIVE_RE = re.compile(
+    r"\b(?:ethnic\w*|races?|racial|hispanics?|religio\w*|sexual\s+orientations?)\b",
+    re.IGNORECASE,
+)
+# Requested-field keywords; on multiple hits the earlier key wins
+_FIELD_TERMS = {
+    "salary": [
+        "salary",
+        "annualsalary",
+        "salaryamount",
+        "pay",
+        "compensation",
+        "wage",
+        "earning",
+    ],
+    "department": ["department", "dept", "division", "team", "unit"],
+    "manager": [
+        "manager",
+        "managername",
+        "supervisor",
+        "boss",
+        "reports to",
+        "reporting manager",
+    ],
+    "employmentstatus": [
+        "employmentstatus",
+        "status",
+        "employment status",
+        "work status",
+    ],
+    "position": ["position", "title", "job title", "role", "designation"],
+    "location": ["location", "office", "site", "workplace", "based in"],
+}
+_FIELD_KEYS = list(_FIELD_TERMS)
+# Topics that mean a captured "of ..." phrase is not a person's name
+_NON_PERSON_TERMS = [
+    "chapter",
+    "program",
+    "project",
+    "management",
+    "roles",
+    "responsibilities",
+    "governance",
+    "policy",
+    "process",
+    "procedure",
+    "guideline",
+]
+
+
+def _build_automaton(values: dict):
+    """Aho-Corasick automaton mapping terms to values; None without pyahocorasick."""
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for term, value in values.items():
+        automaton.add_word(term, value)
+    automaton.make_automaton()
+    return automaton
+
+
+def _field_term_ranks() -> dict:
+    # A term may belong to several fields; keep the best-ranked one
+    ranks: dict[str, int] = {}
+    for rank, key in enumerate(_FIELD_KEYS):
+        for term in _FIELD_TERMS[key]:
+            ranks.setdefault(term, rank)
+    return ranks
+
+
+_TERM_AUTOMATON = _build_automaton(_field_term_ranks())
+_NON_PERSON_AUTOMATON = _build_automaton({term: term for term in _NON_PERSON_TERMS})
+
+
+def extract_person_phrase(message: str, lower_q: Optional[str] = None) -> Optional[str]:
+    """Text after the first standalone "of"/"for", up to a "?"; None if absent."""
+    low = " " + (message.lower() if lower_q is None else lower_q)
+    if len(low) != len(message) + 1:
+        # Lowercasing changed the length (rare Unicode), so offsets would not line up
+        m = _PERSON_RE.search(message)
+        return m.group(1).strip() if m else None
+    start = -1
+    for prep in (" of ", " for "):
+        idx = low.find(prep)
+        if idx != -1 and (start == -1 or idx + len(prep) - 1 < start):
+            start = idx + len(prep) - 1
+    if start == -1:
+        return None
+    phrase = message[start:].split("?", 1)[0].strip()
+    return phrase or None
+
+
+def is_sensitive_query(message: str) -> bool:
+    """True if the message asks about a protected characteristic."""
+    return _SENSITIVE_RE.search(message) is not None
+
+
+def detect_requested_field(ql: str) -> Optional[str]:
+    """Requested field key for a lowercased query, or None."""
+    if _TERM_AUTOMATON is None:
+        for key in _FIELD_KEYS:
+            if any(t in ql for t in _FIELD_TERMS[key]):
+                return key
+        return None
+    best: Optional[int] = None
+    for _end, rank in _TERM_AUTOMATON.iter(ql):
+        if best is None or rank < best:
+            best = rank
+    return _FIELD_KEYS[best] if best is not None else None
+
+
+def name_variants(raw: str):
+    n = norm_name(raw)
+    variants = {n}
+    if "," in raw:
+        parts2 = [p.strip() for p in raw.replace("\ufeff", "").split(",")]
+        if len(parts2) >= 2:
+            variants.add(norm_name(f"{parts2[1]} {parts2[0]}"))
+    else:
+        # "First Last" also matches names stored as "Last, First"
+        words = n.split()
+        if len(words) >= 2:
+            variants.add(f"{words[-1]}, {' '.join(words[:-1])}")
+    return variants
+
+
+def looks_like_person(raw: str) -> bool:
+    if not raw:
+        return False
+    s = raw.strip()
+    sl = s.lower()
+    # Exclude obvious non-person topics
+    if _NON_PERSON_AUTOMATON is not None:
+        if next(_NON_PERSON_AUTOMATON.iter(sl), None) is not None:
+            return False
+    elif any(k in sl for k in _NON_PERSON_TERMS):
+        return False
+    # Disallow digits-heavy strings
+    if _DIGIT_RE.search(s):
+        return False
+    # Accept formats: "Last, First" or "First Last [Middle]?"
+    if "," in s:
+        return True
+    return 2 <= len(s.split()) <= 4
+
+
+def detect_next_chapter_request(ql: str):
+    # Literal prefilter: most queries never mention a chapter, skip the regex
+    if "chapter" not in ql:
+        return None
+    m = _NEXT_CHAPTER_RE.search(ql)
+    if m:
+        try:
+            return int(m.group(1))
+        except Exception:
+            return None
+    return None
+
+
+def extract_chapters(texts: list[str]) -> dict[int, str]:
+    found: dict[int, str] = {}
+    for t in texts:
+        # Headings need the word itself; most texts (e.g. CSV rows) are skipped without
+        # a line split
+        if "chapter" not in t.lower():
+            continue
+        for line in t.splitlines():
+            s = line.strip()
+            if not s:
+                continue
+            m = _CHAPTER_HEADING_RE.match(s)
+            if m:
+                try:
+                    num = int(m.group(1))
+                    title = m.group(2).strip()
+                    if num not in found and title:
+                        found[num] = title
+                except Exception:
+                    continue
+    return found
+
+
+def detect_list_request(ql: str):
+    # Both patterns need a count; one digit scan rules out most queries
+    if not _DIGIT_RE.search(ql):
+        return None
+    ql = ql.strip()
+    # Patterns: "first 3 ... of <topic>", "top 3 ... in <topic>", "next 5", "subsequent
+    # 5 ... of <topic>"
+    m_first = _LIST_FIRST_RE.search(ql)
+    if m_first:
+        n = int(m_first.group(2))
+        topic = m_first.group(3).strip().rstrip("?").strip()
+        return {"mode": "first", "n": n, "topic": topic}
+    m_next = _LIST_NEXT_RE.search(ql)
+    if m_next:
+        n = int(m_next.group(2))
+        topic = m_next.group(3).strip().rstrip("?").strip() if m_next.group(3) else None
+        return {"mode": "next", "n": n, "topic": topic}
+    return None
+
+
+def extract_ordered_items(texts: list[str]) -> list[str]:
+    items: list[str] = []
+    seen: set[str] = set()
+    for t in texts:
+        for line in t.splitlines():
+            s = line.strip()
+            if not s:
+                continue
+            prefix = _LIST_ITEM_RE.match(s)
+            if prefix:
+                # Remove bullet/number prefix
+                s = s[prefix.end() :].strip()
+                if s and s not in seen:
+                    seen.add(s)
+                    items.append(s)
+    return items
+
+
+# Column aliases per requested field, tried in order against normalized headers
+_FIELD_ALIASES = {
+    "salary": [
+        "salary",
+        "annualsalary",
+        "salaryamount",
+        "pay",
+        "basepay",
+        "base_salary",
+        "compensation",
+        "wage",
+        "earning",
+    ],
+    "department": ["department", "dept", "division", "team", "unit"],
+    "manager": ["manager", "managername", "supervisor", "boss", "reporting_manager"],
+    "employmentstatus": [
+        "employmentstatus",
+        "status",
+        "employment_status",
+        "work_status",
+    ],
+    "position": ["position", "title", "job_title", "role", "designation", "jobtitle"],
+    "location": ["location", "office", "site", "workplace", "state", "city"],
+}
+
+
+# Columns holding a display name, tried in order when remembering the matched person
+_NAME_COLUMNS = [
+    "employee_name",
+    "name",
+    "employee",
+    "empname",
+    "full_name",
+    "employee_full_name",
+]
+
+
+def row_cell(values: list[str], col_index: dict, key: str) -> str:
+    # Columns past the end of a short row read as empty, as in the old column dict
+    j = col_index.get(key)
+    return values[j] if j is not None and j < len(values) else ""
+
+
+def lazy_row_cell(row_text: str, col_index: dict):
+    """row_cell over a raw CSV row that is parsed on the first lookup, if any."""
+    parsed: list[list[str]] = []
+
+    def cell(key: str) -> str:
+        if not parsed:
+            parsed.append(parse_csv_row(row_text))
+        return row_cell(parsed[0], col_index, key)
+
+    return cell
+
+
+def format_field_answer(
+    requested: str, person_display_name: str, best_value: str
+) -> str:
+    """Human-readable sentence for a field value extracted from a matched row."""
+    if requested == "salary":
+        # Format salary with currency symbol and thousands separator
+        try:
+            salary_num = float(best_value.replace(",", "").replace("$", ""))
+            formatted_salary = f"${salary_num:,.0f}"
+            response_text = (
+                f"The salary of {person_display_name} is {formatted_salary}."
+            )
+        except ValueError:
+            # Fallback if salary is not a number
+            response_text = f"The salary of {person_display_name} is {best_value}."
+    elif requested == "department":
+        response_text = f"The department of {person_display_name} is {best_value}."
+    elif requested == "manager":
+        response_text = f"The manager of {person_display_name} is {best_value}."
+    elif requested == "employmentstatus":
+        response_text = (
+            f"The employment status of {person_display_name} is {best_value}."
+        )
+    elif requested == "position":
+        response_text = f"{person_display_name} works as a {best_value}."
+    elif requested == "location":
+        response_text = f"{person_display_name} is located in {best_value}."
+    else:
+        # Generic format for other fields
+        field_display = requested.replace("_", " ").title()
+        response_text = (
+            f"The {field_display.lower()} of {person_display_name} is {best_value}."
+        )
+    return response_text
+
+
+def build_query_response(payload: dict) -> QueryResponse:
+    """Wrap a server-built response dict without re-validating it.
+
+    FastAPI still validates the returned model against response_model on the way out.
+    """
+    return QueryResponse.model_construct(
+        # Construction skips str_strip_whitespace, so strip here
+        response=payload["response"].strip(),
+        citations=[
+            Citation.model_construct(**c) for c in payload.get("citations") or []
+        ],
+        confidence=payload["confidence"],
+        requires_human=payload["requiresHuman"],
+    )
 
 
 @router.post("/query", response_model=QueryResponse)
-def post_query(payload: QueryRequest, db: Session = Depends(get_db)) -> QueryResponse:
+async def post_query(
+    payload: QueryRequest,
+    db: Session = Depends(get_db),
+    background: BackgroundTasks = None,
+) -> QueryResponse:
     if not payload.tenant_id or not payload.message or not payload.channel:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Missing required fields: tenantId, message, channel",
         )
 
-    # Validate/convert UUIDs for DB compatibility
-    try:
-        tenant_uuid = uuid.UUID(str(payload.tenant_id))
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid tenantId UUID")
-
-    user_uuid = None
-    if payload.user_id:
-        try:
-            user_uuid = uuid.UUID(str(payload.user_id))
-        except Exception:
-            raise HTTPException(status_code=400, detail="Invalid userId UUID")
-    else:
-        user_uuid = uuid.uuid4()
+    # QueryRequest already parsed the IDs to UUIDs; anonymous requests get a fresh one
+    tenant_uuid = payload.tenant_id
+    user_uuid = payload.user_id or uuid.uuid4()
 
     # Sensitive attribute inference guard
-    lower_q = payload.message.lower()
-    sensitive_terms = ["ethnic", "ethnicity", "race", "hispanic", "religion", "sexual orientation"]
-    if any(term in lower_q for term in sensitive_terms):
+    if is_sensitive_query(payload.message):
         safe = {
-            "response": "I can’t determine or infer a person’s protected characteristics. Please consult appropriate, consented records or escalate to a human agent.",
+            "response": (
+                "I can’t determine or infer a person’s protected characteristics. "
+                "Please consult appropriate, consented records or escalate to a human "
+                "agent."
+            ),
             "citations": [],
             "confidence": 0.0,
             "requiresHuman": True,
         }
-        return QueryResponse(**safe)
+        return build_query_response(safe)
+
+    lower_q = payload.message.lower()
+    requested_field = detect_requested_field(lower_q)
+
+    # Validation above is CPU-only; the rest issues blocking DB and OpenAI calls. It
+    # runs under its own thread limit so slow LLM calls can't exhaust the pool other
+    # sync routes use.
+    loop = asyncio.get_running_loop()
+    return await anyio.to_thread.run_sync(
+        partial(
+            _answer_query,
+            payload,
+            db,
+            background,
+            tenant_uuid,
+            user_uuid,
+            lower_q,
+            requested_field,
+            loop,
+        ),
+        limiter=_get_query_limiter(),
+    )
+
 
-    conversation_service = ConversationService(db)
-    # Ensure UUID types where required by DB models: use deterministic UUIDs for test if missing
+def _get_query_limiter() -> anyio.CapacityLimiter:
+    # Limiters belong to an event loop, so one is created per loop on first use
+    global _query_limiter, _query_limiter_loop
+    loop = asyncio.get_running_loop()
+    if _query_limiter is None or _query_limiter_loop is not loop:
+        _query_limiter = anyio.CapacityLimiter(QUERY_WORKER_THREADS)
+        _query_limiter_loop = loop
+    return _query_limiter
+
+
+def _answer_query(
+    payload: QueryRequest,
+    db: Session,
+    background: Optional[BackgroundTasks],
+    tenant_uuid: uuid.UUID,
+    user_uuid: uuid.UUID,
+    lower_q: str,
+    requested_field: Optional[str],
+    loop: asyncio.AbstractEventLoop,
+) -> QueryResponse:
+    """Answer the query and commit its conversation writes in one transaction.
+
+    Those writes are the user, message and context. The SYSTEM reply is queued on
+    message_batcher by a background task once the response is sent.
+    """
+    try:
+        response = _build_answer(
+            payload,
+            db,
+            background,
+            tenant_uuid,
+            user_uuid,
+            lower_q,
+            requested_field,
+            loop,
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return response
+
+
+def _build_answer(
+    payload: QueryRequest,
+    db: Session,
+    background: Optional[BackgroundTasks],
+    tenant_uuid: uuid.UUID,
+    user_uuid: uuid.UUID,
+    lower_q: str,
+    requested_field: Optional[str],
+    loop: asyncio.AbstractEventLoop,
+) -> QueryResponse:
+    # Ensure UUID types where required by DB models: deterministic test UUIDs if missing
     conversation = conversation_service.get_or_create_conversation(
+        db,
         tenant_id=tenant_uuid,
         user_id=user_uuid,
         channel=payload.channel,
         context=payload.context,
     )
-    conversation_service.add_message(conversation, sender_type="USER", content=payload.message)
-    # Load mutable conversation context (persist short-term memory like last person asked)
+    conversation_service.add_message(
+        db, conversation, sender_type="USER", content=payload.message
+    )
+
+    def add_reply(content: str) -> None:
+        # The reply log is off the critical path; written inline without BackgroundTasks
+        if background is None:
+            conversation_service.add_message(
+                db, conversation, sender_type="SYSTEM", content=content
+            )
+        else:
+            background.add_task(message_batcher.add, conversation.id, "SYSTEM", content)
+
+    # Load mutable conversation context (short-term memory like last person asked)
     convo_ctx = dict(conversation.context or {})
 
-    # Helpers for normalization and matching
-    def norm_col(s: str) -> str:
-        s = s.strip().lower().replace('\ufeff', '')
-        s = re.sub(r"[^a-z0-9]+", "_", s)
-        return s.strip('_')
-
-    def norm_name(s: str) -> str:
-        return re.sub(r"\s+", " ", s.strip().lower().replace('\ufeff',''))
-
-    def name_variants(raw: str):
-        n = norm_name(raw)
-        variants = {n}
-        if "," in raw:
-            parts2 = [p.strip() for p in raw.replace('\ufeff','').split(',')]
-            if len(parts2) >= 2:
-                variants.add(norm_name(f"{parts2[1]} {parts2[0]}"))
-        return variants
-
-    def looks_like_person(raw: str) -> bool:
-        if not raw:
-            return False
-        s = raw.strip()
-        sl = s.lower()
-        # Exclude obvious non-person topics
-        non_person_keywords = [
-            'chapter', 'program', 'project', 'management', 'roles', 'responsibilities',
-            'governance', 'policy', 'process', 'procedure', 'guideline'
-        ]
-        if any(k in sl for k in non_person_keywords):
-            return False
-        # Disallow digits-heavy strings
-        if re.search(r"\d", s):
-            return False
-        # Accept formats: "Last, First" or "First Last [Middle]?"
-        if "," in s and len(s.split(",")) >= 2:
-            return True
-        tokens = [t for t in s.split() if t]
-        return 2 <= len(tokens) <= 4
-
-    # Build tenant-specific corpus with associated columns metadata when available
-    rows = (
-        db.query(KnowledgeChunk.content, KnowledgeChunk.embedding, Document.meta)
-        .join(Document, KnowledgeChunk.document_id == Document.id)
-        .join(KnowledgeBase, Document.knowledge_base_id == KnowledgeBase.id)
-        .filter(KnowledgeBase.tenant_id == tenant_uuid)
-        .order_by(KnowledgeChunk.created_at.desc())
-        .limit(2000)
-        .all()
-    )
-    corpus = [content for (content, _emb, _meta) in rows]
-    row_embeddings = [emb for (_content, emb, _meta) in rows]
-    corpus_columns = []
-    for (_content, _emb, meta) in rows:
-        cols = None
-        if isinstance(meta, dict) and 'columns' in meta and isinstance(meta['columns'], list):
-            cols = [norm_col(str(c)) for c in meta['columns']]
-        corpus_columns.append(cols)
-
-    if not corpus:
+    # Emptiness comes from the cheap fingerprint; the corpus itself is loaded on first
+    # use so a person lookup on a cold cache can use the full-text index instead
+    fingerprint = corpus_fingerprint(db, tenant_uuid)
+    if not fingerprint[0]:
         no_knowledge = {
-            "response": "No tenant knowledge available yet to answer this question. Please upload documents or escalate to a human agent.",
+            "response": (
+                "No tenant knowledge available yet to answer this question. Please "
+                "upload documents or escalate to a human agent."
+            ),
             "citations": [],
             "confidence": 0.0,
             "requiresHuman": True,
         }
-        conversation_service.add_message(conversation, sender_type="SYSTEM", content=no_knowledge["response"])
-        return QueryResponse(**no_knowledge)
-
-    # Index and retrieve candidates
-    rag_service.retriever.index(corpus)
-    candidates = rag_service.retriever.retrieve(payload.message, top_k=10)
+        add_reply(no_knowledge["response"])
+        return build_query_response(no_knowledge)
+
+    tenant_corpus = peek_tenant_corpus(tenant_uuid, fingerprint)
+    candidates = None
+
+    def load_corpus() -> None:
+        """The tenant corpus, plus candidate row indices from its index."""
+        nonlocal tenant_corpus, candidates
+        if tenant_corpus is None:
+            tenant_corpus = get_tenant_corpus(db, tenant_uuid, fingerprint)
+        if candidates is None:
+            candidates = tenant_corpus.retriever.retrieve_indices(
+                payload.message, top_k=10
+            )
+
+    def rag_answer(**answer_kwargs) -> dict:
+        """RAG answer over the top candidates, re-ranked and cached by embedding."""
+        qvec = (
+            embedding_batcher.embed_threadsafe(payload.message, loop)
+            if rag_service.openai_client
+            else None
+        )
+        if qvec is not None:
+            cached = semantic_cache.get(tenant_uuid, fingerprint, requested_field, qvec)
+            if cached is not None:
+                return cached
+        load_corpus()
+        rag_candidates = candidates
+        ranking = (
+            tenant_corpus.dense_top_k(db, qvec, 10)
+            if qvec is not None and USE_EMBEDDING_RERANK
+            else None
+        )
+        if ranking is not None:
+            rag_candidates = tenant_corpus.retriever.retrieve_indices(
+                payload.message, top_k=10, dense_ranking=ranking
+            )
+        result = rag_service.answer(
+            payload.message,
+            preselected_contexts=[
+                tenant_corpus.contents[i] for i in rag_candidates[:6]
+            ],
+            retriever=tenant_corpus.retriever,
+            query_embedding=qvec,
+            **answer_kwargs,
+        )
+        if qvec is not None:
+            semantic_cache.put(tenant_uuid, fingerprint, requested_field, qvec, result)
+        return result
 
     # Chapter navigation: answer "next chapter after chapter N"
-    def detect_next_chapter_request(q: str):
-        ql = q.lower()
-        m = re.search(r"next\s+chapter\s+after\s+chapter\s+(\d+)", ql)
-        if m:
-            try:
-                return int(m.group(1))
-            except Exception:
-                return None
-        return None
-
-    def extract_chapters(texts: list[str]) -> dict[int, str]:
-        found: dict[int, str] = {}
-        for t in texts:
-            for line in t.splitlines():
-                s = line.strip()
-                if not s:
-                    continue
-                m = re.match(r"^chapter\s+(\d+)\s*[\.:\-]?\s*(.*)$", s, flags=re.IGNORECASE)
-                if m:
-                    try:
-                        num = int(m.group(1))
-                        title = m.group(2).strip()
-                        if num not in found and title:
-                            found[num] = title
-                    except Exception:
-                        continue
-        return found
-
-    base_ch = detect_next_chapter_request(payload.message)
+    base_ch = detect_next_chapter_request(lower_q)
     if base_ch is not None:
+        load_corpus()
+        corpus = tenant_corpus.contents
         top_texts = [corpus[i] for i in (candidates[:8] if candidates else [])]
         chapters = extract_chapters(top_texts if top_texts else corpus)
         if (base_ch + 1) in chapters:
             next_num = base_ch + 1
             next_title = chapters[next_num]
             # Persist simple chapter memory
-            try:
-                convo_ctx['last_chapter'] = next_num
-                convo_ctx['last_chapter_title'] = next_title
-                conversation.context = convo_ctx
-                db.add(conversation)
-                db.commit()
-                db.refresh(conversation)
-            except Exception:
-                db.rollback()
+            convo_ctx["last_chapter"] = next_num
+            convo_ctx["last_chapter_title"] = next_title
+            conversation.context = convo_ctx
             reply = {
                 "response": f"The next chapter is Chapter {next_num}: {next_title}.",
                 "citations": [],
                 "confidence": 0.9,
                 "requiresHuman": False,
             }
-            conversation_service.add_message(conversation, sender_type="SYSTEM", content=reply["response"])
-            return QueryResponse(**reply)
+            add_reply(reply["response"])
+            return build_query_response(reply)
         else:
             no_next = {
-                "response": "I couldn’t find the next chapter title in the uploaded content.",
+                "response": (
+                    "I couldn’t find the next chapter title in the uploaded content."
+                ),
                 "citations": [],
                 "confidence": 0.0,
                 "requiresHuman": True,
             }
-            conversation_service.add_message(conversation, sender_type="SYSTEM", content=no_next["response"])
-            return QueryResponse(**no_next)
+            add_reply(no_next["response"])
+            return build_query_response(no_next)
 
     # Ordered-list extraction and follow-up memory (e.g., project management processes)
-    def detect_list_request(q: str):
-        ql = q.lower().strip()
-        # Patterns: "first 3 ... of <topic>", "top 3 ... in <topic>", "next 5", "subsequent 5 ... of <topic>"
-        m_first = re.search(r"\b(first|top)\s+(\d+)\b.*?(?:of|in)\s+(.+)$", ql)
-        if m_first:
-            n = int(m_first.group(2))
-            topic = m_first.group(3).strip().rstrip('?').strip()
-            return {"mode": "first", "n": n, "topic": topic}
-        m_next = re.search(r"\b(next|subsequent)\s+(\d+)\b(?:.*?(?:of|in)\s+(.+))?", ql)
-        if m_next:
-            n = int(m_next.group(2))
-            topic = m_next.group(3).strip().rstrip('?').strip() if m_next.group(3) else None
-            return {"mode": "next", "n": n, "topic": topic}
-        return None
-
-    def extract_ordered_items(texts: list[str]) -> list[str]:
-        items: list[str] = []
-        for t in texts:
-            for line in t.splitlines():
-                s = line.strip()
-                if not s:
-                    continue
-                if re.match(r"^(?:[-*•]\s+|\d+[\.)]\s+)", s):
-                    # Remove bullet/number prefix
-                    s = re.sub(r"^(?:[-*•]\s+|\d+[\.)]\s+)", "", s).strip()
-                    if s and s not in items:
-                        items.append(s)
-        return items
-
-    list_req = detect_list_request(payload.message)
+    list_req = detect_list_request(lower_q)
     if list_req:
         topic = list_req.get("topic") or convo_ctx.get("last_list_topic")
         if not topic:
             no_topic = {
-                "response": "Which topic are you referring to? For example: ‘first 3 processes of project management’.",
+                "response": (
+                    "Which topic are you referring to? For example: ‘first 3 processes "
+                    "of project management’."
+                ),
                 "citations": [],
                 "confidence": 0.0,
                 "requiresHuman": False,
             }
-            conversation_service.add_message(conversation, sender_type="SYSTEM", content=no_topic["response"])
-            return QueryResponse(**no_topic)
+            add_reply(no_topic["response"])
+            return build_query_response(no_topic)
 
         # Gather top candidate texts as source for list extraction
-        top_texts = [corpus[i] for i in (candidates[:6] if candidates else [])]
+        load_corpus()
+        top_texts = [
+            tenant_corpus.contents[i] for i in (candidates[:6] if candidates else [])
+        ]
         items = extract_ordered_items(top_texts)
 
         # If we had a previous list and same topic, reuse items as source of truth
-        if convo_ctx.get("last_list_topic") == topic and isinstance(convo_ctx.get("last_list_items"), list):
-            prev_items = [it for it in convo_ctx.get("last_list_items") if isinstance(it, str) and it]
+        if convo_ctx.get("last_list_topic") == topic and isinstance(
+            convo_ctx.get("last_list_items"), list
+        ):
+            prev_items = [
+                it
+                for it in convo_ctx.get("last_list_items")
+                if isinstance(it, str) and it
+            ]
             # Prefer the longer list between prev and freshly extracted
             if len(prev_items) > len(items):
                 items = prev_items
@@ -263,231 +663,201 @@ def post_query(payload: QueryRequest, db: Session = Depends(get_db)) -> QueryRes
                 "confidence": 0.0,
                 "requiresHuman": True,
             }
-            conversation_service.add_message(conversation, sender_type="SYSTEM", content=no_items["response"])
-            return QueryResponse(**no_items)
+            add_reply(no_items["response"])
+            return build_query_response(no_items)
 
         n = max(1, int(list_req.get("n", 1)))
         mode = list_req.get("mode")
         start_index = 0
         if mode == "next":
             # Continue from prior index if same topic
-            if convo_ctx.get("last_list_topic") == topic and isinstance(convo_ctx.get("last_list_index"), int):
+            if convo_ctx.get("last_list_topic") == topic and isinstance(
+                convo_ctx.get("last_list_index"), int
+            ):
                 start_index = max(0, int(convo_ctx["last_list_index"]))
 
         end_index = min(len(items), start_index + n)
         slice_items = items[start_index:end_index]
 
         # Persist list memory
-        try:
-            convo_ctx["last_list_topic"] = topic
-            convo_ctx["last_list_items"] = items
-            convo_ctx["last_list_index"] = end_index
-            conversation.context = convo_ctx
-            db.add(conversation)
-            db.commit()
-            db.refresh(conversation)
-        except Exception:
-            db.rollback()
+        convo_ctx["last_list_topic"] = topic
+        convo_ctx["last_list_items"] = items
+        convo_ctx["last_list_index"] = end_index
+        conversation.context = convo_ctx
 
-        numbered = [f"{i+1}. {it}" for i, it in enumerate(slice_items, start=start_index)]
-        response_text = f"Here are the {'next' if mode=='next' else 'first'} {len(slice_items)} items for {topic}:\n" + "\n".join(numbered)
+        numbered = [
+            f"{i+1}. {it}" for i, it in enumerate(slice_items, start=start_index)
+        ]
+        response_text = (
+            f"Here are the {'next' if mode=='next' else 'first'} "
+            f"{len(slice_items)} items for {topic}:\n" + "\n".join(numbered)
+        )
         payload_out = {
             "response": response_text,
             "citations": [],
             "confidence": 0.8,
             "requiresHuman": False,
         }
-        conversation_service.add_message(conversation, sender_type="SYSTEM", content=payload_out["response"])
-        return QueryResponse(**payload_out)
+        add_reply(payload_out["response"])
+        return build_query_response(payload_out)
 
     # Schema-aware extraction for tabular rows
-    def detect_requested_field(q: str):
-        ql = q.lower()
-        mapping = {
-            'salary': ['salary', 'annualsalary', 'salaryamount', 'pay', 'compensation', 'wage', 'earning'],
-            'department': ['department', 'dept', 'division', 'team', 'unit'],
-            'manager': ['manager', 'managername', 'supervisor', 'boss', 'reports to', 'reporting manager'],
-            'employmentstatus': ['employmentstatus', 'status', 'employment status', 'work status'],
-            'position': ['position', 'title', 'job title', 'role', 'designation'],
-            'location': ['location', 'office', 'site', 'workplace', 'based in'],
-        }
-        for key, terms in mapping.items():
-            if any(t in ql for t in terms):
-                return key
-        return None
-
-    def parse_csv_row(row_text: str):
-        reader = csv.reader(io.StringIO(row_text))
-        return next(reader)
-
-    requested = detect_requested_field(payload.message)
+    requested = requested_field
     if requested:
-        person_match = re.search(r"(?:of|for)\s+([^?]+)", payload.message, flags=re.IGNORECASE)
-        candidate = person_match.group(1).strip() if person_match else None
+        candidate = extract_person_phrase(payload.message, lower_q)
         pronoun_ref = any(p in lower_q for p in ["his", "her", "their", "him", "them"])
-        # Determine person context: either pronoun referring to memory, or the captured phrase looks like a person
-        person_context = (pronoun_ref and 'last_person' in convo_ctx) or (candidate and looks_like_person(candidate))
+        # Determine person context: either pronoun referring to memory, or the captured
+        # phrase looks like a person
+        person_context = (pronoun_ref and "last_person" in convo_ctx) or (
+            candidate and looks_like_person(candidate)
+        )
         if not person_context:
             # Not a person-specific query; answer via generic RAG/policy and return
-            preselected_np = candidates[:6] if candidates else []
-            result_np = rag_service.answer(payload.message, preselected_contexts=preselected_np)
-            conversation_service.add_message(conversation, sender_type="SYSTEM", content=result_np["response"])
-            return QueryResponse(**result_np)
+            result_np = rag_answer()
+            add_reply(result_np["response"])
+            return build_query_response(result_np)
         else:
-            person_name_raw = candidate if candidate else convo_ctx.get('last_person')
+            person_name_raw = candidate if candidate else convo_ctx.get("last_person")
             if not person_name_raw:
                 no_person = {
-                    "response": "Who are you asking about? Please include the person’s name (e.g., ‘What is the position of Jane Doe?’).",
+                    "response": (
+                        "Who are you asking about? Please include the person’s name "
+                        "(e.g., ‘What is the position of Jane Doe?’)."
+                    ),
                     "citations": [],
                     "confidence": 0.0,
                     "requiresHuman": False,
                 }
-                conversation_service.add_message(conversation, sender_type="SYSTEM", content=no_person["response"]) 
-                return QueryResponse(**no_person)
-            person_name_raw = person_name_raw.strip().strip('?')
+                add_reply(no_person["response"])
+                return build_query_response(no_person)
+            person_name_raw = person_name_raw.strip().strip("?")
             person_names = name_variants(person_name_raw)
 
-        field_aliases = {
-            'salary': ['salary', 'annualsalary', 'salaryamount', 'pay', 'basepay', 'base_salary', 'compensation', 'wage', 'earning'],
-            'department': ['department', 'dept', 'division', 'team', 'unit'],
-            'manager': ['manager', 'managername', 'supervisor', 'boss', 'reporting_manager'],
-            'employmentstatus': ['employmentstatus', 'status', 'employment_status', 'work_status'],
-            'position': ['position', 'title', 'job_title', 'role', 'designation', 'jobtitle'],
-            'location': ['location', 'office', 'site', 'workplace', 'state', 'city'],
-        }
-
-        # First pass: find exact name matches
+        # First pass: rows with a cell equal to one of the name variants, kept as (text,
+        # cell lookup by normalized column) so no per-row column->value dict is built
         matching_rows = []
-        for i, cand in enumerate(corpus):
-            cols = corpus_columns[i]
-            if not cols:
-                continue
-            values = parse_csv_row(cand)
-            col_to_val = {cols[j]: values[j] if j < len(values) else '' for j in range(len(cols))}
-            
-            # Determine row name
-            name_cols = ['employee_name', 'name', 'employee', 'empname', 'full_name', 'employee_full_name']
-            row_name = None
-            for nc in name_cols:
-                if nc in col_to_val and str(col_to_val[nc]).strip() != '':
-                    row_name = norm_name(str(col_to_val[nc]))
-                    break
-            
-            # Check if this row matches the requested person
-            is_match = False
-            if row_name:
-                # Check against all name variants
-                for variant in person_names:
-                    if row_name == norm_name(variant):
-                        is_match = True
-                        break
-            
-            if not is_match:
-                # Fallback: check if any cell contains the exact name
-                person_norms = {norm_name(v) for v in person_names}
-                for v in values:
-                    if norm_name(str(v)) in person_norms:
-                        is_match = True
-                        break
-            
-            if is_match:
-                matching_rows.append((i, cand, col_to_val))
-        
+        if tenant_corpus is None and has_content_tsv(db):
+            # Cold cache: prefilter with the full-text index rather than loading the
+            # whole corpus, and stop streaming once a few exact matches are in hand
+            # A cell equal to a (quote-free) name also appears verbatim in the
+            # normalized row text, so rows without any name as a substring are skipped
+            substring_check = not any('"' in n for n in person_names)
+            with closing(find_rows_by_name(db, tenant_uuid, person_name_raw)) as found:
+                for row_text, cols in found:
+                    if not cols:
+                        continue
+                    if substring_check:
+                        norm_row = norm_name(row_text)
+                        if not any(n in norm_row for n in person_names):
+                            continue
+                    if not person_names.isdisjoint(row_name_keys(row_text)):
+                        # The field pass usually stops at the first row, so later
+                        # matches stay unparsed
+                        matching_rows.append(
+                            (row_text, lazy_row_cell(row_text, column_index(cols)))
+                        )
+                        if len(matching_rows) >= MAX_PERSON_MATCHES:
+                            break
+        else:
+            load_corpus()
+            for i in tenant_corpus.rows_matching_names(person_names):
+                # Warm corpus: cells come from per-column arrays shared across queries
+                matching_rows.append(
+                    (tenant_corpus.contents[i], partial(tenant_corpus.cell, i))
+                )
+
         # If no exact matches found, return error
         if not matching_rows:
             no_match = {
-                "response": f"I couldn't find any records for {person_name_raw}. Please verify the name spelling or check if this person exists in the employee database.",
+                "response": (
+                    f"I couldn't find any records for {person_name_raw}. Please verify "
+                    "the name spelling or check if this person exists in the employee "
+                    "database."
+                ),
                 "citations": [],
                 "confidence": 0.0,
                 "requiresHuman": True,
             }
-            conversation_service.add_message(conversation, sender_type="SYSTEM", content=no_match["response"])
-            return QueryResponse(**no_match)
-        
+            add_reply(no_match["response"])
+            return build_query_response(no_match)
+
         # Second pass: extract the requested field from matching rows
         best_value = None
         best_row_text = None
         best_score = -1.0
-        
+
         canonical_name_for_memory = None
-        for row_idx, row_text, col_to_val in matching_rows:
+        alias_keys = [
+            norm_col(key) for key in _FIELD_ALIASES.get(requested, [requested])
+        ]
+        name_keys = _NAME_COLUMNS
+        if tenant_corpus is not None:
+            # Aliases absent from every header in the corpus can never match, so drop
+            # them up front
+            alias_keys = tenant_corpus.present_columns(alias_keys)
+            name_keys = tenant_corpus.present_columns(name_keys)
+        for row_text, cell in matching_rows:
             # Look for the requested field
-            for key in field_aliases.get(requested, [requested]):
-                k = norm_col(key)
-                if k in col_to_val and str(col_to_val[k]).strip() != '':
+            for k in alias_keys:
+                field_value = str(cell(k)).strip()
+                if field_value != "":
                     # Use a simple scoring based on field presence (1.0 for exact match)
                     score = 1.0
                     if score > best_score:
                         best_score = score
-                        best_value = str(col_to_val[k]).strip()
+                        best_value = field_value
                         best_row_text = row_text
-                        # Capture a canonical display name from known name columns for memory
-                        for nc in ['employee_name', 'name', 'employee', 'empname', 'full_name', 'employee_full_name']:
-                            if nc in col_to_val and str(col_to_val[nc]).strip() != '':
-                                canonical_name_for_memory = str(col_to_val[nc]).strip()
+                        # Remember a canonical display name from known name columns
+                        for nc in name_keys:
+                            name_value = str(cell(nc)).strip()
+                            if name_value != "":
+                                canonical_name_for_memory = name_value
                     break
+            # Presence scores 1.0 at most, so no later row can replace the first hit
+            if best_value is not None:
+                break
         if best_value:
             # Format the response in a human-readable way
             person_display_name = canonical_name_for_memory or person_name_raw
-            
-            # Format response based on the field type
-            if requested == 'salary':
-                # Format salary with currency symbol and thousands separator
-                try:
-                    salary_num = float(best_value.replace(',', '').replace('$', ''))
-                    formatted_salary = f"${salary_num:,.0f}"
-                    response_text = f"The salary of {person_display_name} is {formatted_salary}."
-                except:
-                    # Fallback if salary is not a number
-                    response_text = f"The salary of {person_display_name} is {best_value}."
-            elif requested == 'department':
-                response_text = f"The department of {person_display_name} is {best_value}."
-            elif requested == 'manager':
-                response_text = f"The manager of {person_display_name} is {best_value}."
-            elif requested == 'employmentstatus':
-                response_text = f"The employment status of {person_display_name} is {best_value}."
-            elif requested == 'position':
-                response_text = f"{person_display_name} works as a {best_value}."
-            elif requested == 'location':
-                response_text = f"{person_display_name} is located in {best_value}."
-            else:
-                # Generic format for other fields
-                field_display = requested.replace('_', ' ').title()
-                response_text = f"The {field_display.lower()} of {person_display_name} is {best_value}."
-            
+            response_text = format_field_answer(
+                requested, person_display_name, best_value
+            )
+
             response_payload = {
                 "response": response_text,
-                "citations": [{"source": "row", "title": "Matched record", "relevance": 0.99, "snippet": best_row_text[:160]}],
+                "citations": [
+                    {
+                        "source": "row",
+                        "title": "Matched record",
+                        "relevance": 0.99,
+                        "snippet": best_row_text[:160],
+                    }
+                ],
                 "confidence": 0.9,
                 "requiresHuman": False,
             }
             # Persist short-term memory of last referenced person
-            try:
-                convo_ctx['last_person'] = person_display_name
-                conversation.context = convo_ctx
-                db.add(conversation)
-                db.commit()
-                db.refresh(conversation)
-            except Exception:
-                db.rollback()
-            conversation_service.add_message(conversation, sender_type="SYSTEM", content=response_payload["response"])            
-            return QueryResponse(**response_payload)
-        # Avoid falling back to generic RAG when a specific field was requested but not found
-        field_display = requested.replace('_', ' ').title()
+            convo_ctx["last_person"] = person_display_name
+            conversation.context = convo_ctx
+            add_reply(response_payload["response"])
+            return build_query_response(response_payload)
+        # Don't fall back to generic RAG when a requested field was not found
+        field_display = requested.replace("_", " ").title()
         no_match = {
-            "response": f"I found {person_name_raw} in the database, but their {field_display.lower()} information is not available or empty in the records.",
+            "response": (
+                f"I found {person_name_raw} in the database, but their "
+                f"{field_display.lower()} information is not available or empty in the "
+                "records."
+            ),
             "citations": [],
             "confidence": 0.0,
             "requiresHuman": True,
         }
-        conversation_service.add_message(conversation, sender_type="SYSTEM", content=no_match["response"])
-        return QueryResponse(**no_match)
+        add_reply(no_match["response"])
+        return build_query_response(no_match)
 
     # Fallback to generic RAG answer if no structured match
     # Use the previously retrieved candidates and limit to 6 (aligns with sample)
-    preselected = candidates[:6] if candidates else []
-    result = rag_service.answer(payload.message, preselected_contexts=preselected, tenant_id=str(tenant_uuid), db=db)
-    conversation_service.add_message(conversation, sender_type="SYSTEM", content=result["response"])
-    return QueryResponse(**result)
-
-
+    result = rag_answer(tenant_id=str(tenant_uuid), db=db)
+    add_reply(result["response"])
+    return build_query_response(result)
@@ -1,6 +1,7 @@
 """
 Tenant document upload API.
 """
+import os
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
 from sqlalchemy.orm import Session
 from ai_core.models.knowledge import DocumentUploadRequest, DocumentUploadResponse
@@ -9,6 +10,9 @@ from shared.database.session import get_db
 
 router = APIRouter(prefix="/v1/tenant", tags=["tenant"])
 
+# Largest accepted file upload in bytes (0 = no limit here)
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", "0"))
+
 
 @router.post("/upload", response_model=DocumentUploadResponse)
 def upload_document(body: DocumentUploadRequest, db: Session = Depends(get_db)) -> DocumentUploadResponse:
@@ -20,8 +24,9 @@ def upload_document(body: DocumentUploadRequest, db: Session = Depends(get_db))
     return DocumentUploadResponse(documentId=doc_id, chunkCount=chunk_count, status="INDEXED")
 
 
+# Sync, so FastAPI runs extraction, embedding and the commit in its threadpool, off the event loop
 @router.post("/upload_file", response_model=DocumentUploadResponse)
-async def upload_document_file(
+def upload_document_file(
     tenantId: str = Form(...),
     title: str = Form(...),
     knowledgeBaseId: str = Form("00000000-0000-0000-0000-000000000000"),
@@ -44,12 +49,18 @@ async def upload_document_file(
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid tenantId format, must be a valid UUID")
         
-        # Read file data (FastAPI will stream to memory/disk depending on server config)
-        data = await file.read()
-        if not data:
+        # Starlette has already spooled the upload to a temp file (on disk past 1 MB);
+        # the extractors parse straight from it instead of a full in-memory copy
+        data = file.file
+        data.seek(0, os.SEEK_END)
+        size = data.tell()
+        data.seek(0)
+        if not size:
             raise HTTPException(status_code=400, detail="File is empty")
         
-        # No hard file size limit enforced here; rely on infrastructure (reverse proxy/app server) limits
+        # Optional cap on top of infrastructure (reverse proxy/app server) limits
+        if UPLOAD_MAX_BYTES and size > UPLOAD_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"File exceeds {UPLOAD_MAX_BYTES} bytes")
         
         svc = DocumentService(db)
         name = file.filename.lower() if file.filename else ""
@@ -2,24 +2,38 @@
 Telegram webhook handler.
 """
 from fastapi import APIRouter, Request, HTTPException, status
+from fastapi.responses import ORJSONResponse
 from typing import Dict, Any
-from shared.services.session_service import SessionService
-from shared.utils.channel_adapter import ChannelAdapter
+import uuid
+import orjson
+from shared.services.session_service import session_service
+from shared.utils.channel_adapter import channel_adapter
 
-router = APIRouter(prefix="/webhooks", tags=["webhooks"])
-session_service = SessionService()
-adapter = ChannelAdapter()
+router = APIRouter(prefix="/webhooks", tags=["webhooks"], default_response_class=ORJSONResponse)
+# Resolved once; the handler makes one direct call per update
+_extract_identifier = channel_adapter.extractor("telegram")
 
 
 @router.post("/telegram")
 async def telegram_webhook(request: Request) -> Dict[str, Any]:
-    payload = await request.json()
-    tenant_id = payload.get("tenantId") or "00000000-0000-0000-0000-000000000000"
-    user_identifier = adapter.extract_identifier("telegram", payload)
+    try:
+        payload = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="Invalid Telegram payload")
+    raw_tenant_id = payload.get("tenantId") or "00000000-0000-0000-0000-000000000000"
+    # uuid.UUID raises AttributeError/TypeError (a 500) for numbers, lists or objects
+    if not isinstance(raw_tenant_id, str):
+        raise HTTPException(status_code=400, detail="Invalid tenantId format, must be a valid UUID")
+    try:
+        tenant_id = uuid.UUID(raw_tenant_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid tenantId format, must be a valid UUID")
+    user_identifier = _extract_identifier(payload)
     if not user_identifier:
         raise HTTPException(status_code=400, detail="Invalid Telegram payload")
-    session_id = session_service.get_or_create_session(tenant_id, user_identifier)
-    session_service.set_channel_mapping(tenant_id, session_id, "telegram", user_identifier)
+    session_id = session_service.get_or_create_and_map(tenant_id, "telegram", user_identifier)
     return {"status": "accepted", "sessionId": session_id}
 
 
@@ -2,31 +2,41 @@
 WhatsApp webhook handler with basic HMAC validation hook.
 """
 from fastapi import APIRouter, Request, HTTPException, status
+from fastapi.responses import ORJSONResponse
 from typing import Dict, Any
 import hmac
-import hashlib
+import orjson
 import os
 from shared.utils.message_utils import normalize_whatsapp
 
-router = APIRouter(prefix="/webhooks", tags=["webhooks"])
+router = APIRouter(prefix="/webhooks", tags=["webhooks"], default_response_class=ORJSONResponse)
 
+# Read and encoded once at import rather than on every webhook
+WHATSAPP_APP_SECRET = os.getenv("WHATSAPP_APP_SECRET", "").encode("utf-8")
 
-def verify_signature(body: bytes, signature: str, secret: str) -> bool:
-    mac = hmac.new(secret.encode("utf-8"), msg=body, digestmod=hashlib.sha256)
-    expected = mac.hexdigest()
-    return hmac.compare_digest(expected, signature.replace("sha256=", ""))
+
+def verify_signature(body: bytes, signature: str, secret: bytes) -> bool:
+    # Compare raw digests: one-shot C HMAC, and half the bytes of the hex form
+    try:
+        provided = bytes.fromhex(signature.removeprefix("sha256="))
+    except ValueError:
+        return False
+    return hmac.compare_digest(hmac.digest(secret, body, "sha256"), provided)
 
 
 @router.post("/whatsapp")
 async def whatsapp_webhook(request: Request) -> Dict[str, Any]:
-    secret = os.getenv("WHATSAPP_APP_SECRET", "")
     signature = request.headers.get("X-Hub-Signature-256", "")
     body = await request.body()
-    if secret:
-        if not signature or not verify_signature(body, signature, secret):
+    if WHATSAPP_APP_SECRET:
+        if not signature or not verify_signature(body, signature, WHATSAPP_APP_SECRET):
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid signature")
 
-    payload = await request.json()
+    # Parse the bytes already read for the signature rather than reading the body again
+    try:
+        payload = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
     normalized = normalize_whatsapp(payload)
     return {"status": "accepted", "normalized": normalized}
 
@@ -2,11 +2,16 @@
 FastAPI application for AI Core - RAG-powered conversational AI service.
 """
 from fastapi import FastAPI, HTTPException, status, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.exception_handlers import request_validation_exception_handler
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from contextlib import asynccontextmanager
+import asyncio
+import gzip
 import logging
 import os
+import time
 from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
 from fastapi import Response
 from ai_core.api.v1.query import router as query_router
@@ -15,7 +20,7 @@ from ai_core.api.webhooks.teams import router as teams_router
 from ai_core.api.webhooks.telegram import router as telegram_router
 from ai_core.api.v1.internal import router as internal_router
 from ai_core.api.v1.tenant import router as tenant_router
-from shared.database.session import create_tables, SessionLocal
+from shared.database.session import create_tables, SessionLocal, MIGRATION_MODE
 from shared.database.models import Tenant
 import uuid
 
@@ -30,11 +35,27 @@ class ColorFormatter(logging.Formatter):
     }
     RESET = '\x1b[0m'
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # (whole second, formatted timestamp without milliseconds) of the last record
+        self._time_cache = (None, "")
+
+    def formatTime(self, record: logging.LogRecord, datefmt=None) -> str:
+        # localtime + strftime run once per second instead of once per record
+        second = int(record.created)
+        cached_second, stamp = self._time_cache
+        if second != cached_second:
+            stamp = time.strftime(datefmt or self.default_time_format, self.converter(record.created))
+            self._time_cache = (second, stamp)
+        if datefmt:
+            return stamp
+        return self.default_msec_format % (stamp, record.msecs)
+
     def format(self, record: logging.LogRecord) -> str:
-        level_color = self.COLORS.get(record.levelname, '')
+        level_color = self.COLORS.get(record.levelname)
         msg = super().format(record)
         if level_color:
-            return f"{level_color}{msg}{self.RESET}"
+            return level_color + msg + self.RESET
         return msg
 
 handler = logging.StreamHandler()
@@ -49,35 +70,65 @@ app_logger = logging.getLogger(__name__)
 REQUEST_COUNT = Counter('ai_core_requests_total', 'Total HTTP requests', ['method', 'endpoint', 'status'])
 REQUEST_LATENCY = Histogram('ai_core_request_latency_seconds', 'Request latency', ['endpoint'])
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    """Application lifespan context manager."""
-    app_logger.info("Starting AI Core service...")
+# Schema initialization state reported by /healthz: pending, running, complete, failed, skipped
+MIGRATION_STATUS = "pending"
+
+
+def _initialize_database() -> None:
+    """Create tables and seed the default tenant; blocking, safe to run in a thread."""
+    global MIGRATION_STATUS
+    MIGRATION_STATUS = "running"
     # Initialize database tables (dev/test SQLite); in production use Alembic
     try:
         create_tables()
+        MIGRATION_STATUS = "complete"
     except Exception as e:
+        MIGRATION_STATUS = "failed"
         app_logger.warning(f"DB initialization skipped/failed: {e}")
     # Seed default tenant for development/staging to avoid FK violations
     try:
-        default_tenant_id = uuid.UUID("00000000-0000-0000-0000-000000000001")
         db = SessionLocal()
         try:
-            existing = db.get(Tenant, default_tenant_id)
-            if not existing:
-                tenant = Tenant(
-                    id=default_tenant_id,
-                    name="Global Tenant",
-                    domain="global",
-                    subscription_tier="BASIC",
-                    settings={},
-                )
-                db.add(tenant)
-                db.commit()
+            _seed_default_tenant(db)
         finally:
             db.close()
     except Exception as e:
         app_logger.warning(f"Default tenant seeding failed or skipped: {e}")
+
+
+DEFAULT_TENANT_ID = uuid.UUID("00000000-0000-0000-0000-000000000001")
+
+
+def _seed_default_tenant(db) -> None:
+    """Insert the default tenant unless it exists, in one statement that concurrent workers can race."""
+    values = dict(id=DEFAULT_TENANT_ID, name="Global Tenant", domain="global", subscription_tier="BASIC", settings={})
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        if db.get(Tenant, DEFAULT_TENANT_ID) is None:
+            db.add(Tenant(**values))
+            db.commit()
+        return
+    db.execute(insert(Tenant).values(**values).on_conflict_do_nothing())
+    db.commit()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application lifespan context manager."""
+    global MIGRATION_STATUS
+    app_logger.info("Starting AI Core service...")
+    if MIGRATION_MODE == "skip":
+        MIGRATION_STATUS = "skipped"
+    elif MIGRATION_MODE == "async":
+        # Serve traffic immediately; readiness is reported via /healthz
+        app.state.migration_task = asyncio.create_task(asyncio.to_thread(_initialize_database))
+    else:
+        # Still finishes before serving, but off the event loop
+        await asyncio.to_thread(_initialize_database)
     yield
     app_logger.info("Shutting down AI Core service...")
     # Cleanup logic here
@@ -87,13 +138,30 @@ app = FastAPI(
     title="Omnichannel RAG Chatbot - AI Core",
     description="Enterprise-grade RAG-powered conversational AI service",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
+# Browser origins allowed to call the API, comma-separated; empty disables cross-origin access
+CORS_ORIGINS = [o.strip() for o in os.getenv("CORS_ORIGINS", "").split(",") if o.strip()]
+# Server-to-server paths that browsers never call cross-origin
+CORS_EXEMPT_PREFIXES = ("/webhooks/", "/metrics")
+
+
+class ScopedCORSMiddleware(CORSMiddleware):
+    """CORSMiddleware that passes exempt paths straight through to the app."""
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "http" and scope["path"].startswith(CORS_EXEMPT_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
 # Add CORS middleware
 app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Configure appropriately for production
+    ScopedCORSMiddleware,
+    allow_origins=CORS_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -103,21 +171,34 @@ app.add_middleware(
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     logger.error(f"Unhandled exception: {exc}", exc_info=True)
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={"detail": f"Internal server error: {str(exc)}"}
     )
 
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={"detail": exc.detail}
     )
 
+# Body fields whose malformed UUIDs are answered with 400, as the query handler did before
+# the request model parsed them; every other validation error keeps FastAPI's 422
+UUID_BODY_FIELDS = ("tenantId", "userId")
+
+
+@app.exception_handler(RequestValidationError)
+async def request_validation_handler(request: Request, exc: RequestValidationError):
+    for error in exc.errors():
+        loc = error.get("loc", ())
+        if len(loc) == 2 and loc[0] == "body" and loc[1] in UUID_BODY_FIELDS and error["type"].startswith("uuid"):
+            return ORJSONResponse(status_code=400, content={"detail": f"Invalid {loc[1]} UUID"})
+    return await request_validation_exception_handler(request, exc)
+
 @app.exception_handler(ValueError)
 async def value_error_handler(request: Request, exc: ValueError):
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=400,
         content={"detail": str(exc)}
     )
@@ -132,9 +213,60 @@ async def health_check():
         "timestamp": "2025-01-01T00:00:00Z"
     }
 
+@app.get("/healthz")
+async def readiness_check():
+    """Readiness probe: 503 until schema initialization has finished."""
+    # Sync mode initializes before serving and, like the startup log, tolerates a failed
+    # create_tables; only async initialization can still be in progress here
+    ready = MIGRATION_MODE == "sync" or MIGRATION_STATUS in ("complete", "skipped")
+    return ORJSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not_ready", "migrations": MIGRATION_STATUS},
+    )
+
+# Scrapes within this many seconds share one rendered snapshot
+METRICS_CACHE_SECONDS = float(os.getenv("METRICS_CACHE_SECONDS", "1"))
+# (rendered at, exposition text, gzip of it)
+_metrics_cache = (float("-inf"), b"", b"")
+
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an Accept-Encoding header allows gzip: named with q > 0, or covered by "*" with q > 0."""
+    wildcard = None
+    for token in accept_encoding.split(","):
+        coding, _, params = token.partition(";")
+        coding = coding.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding in ("gzip", "x-gzip"):
+            return q > 0
+        if coding == "*":
+            wildcard = q > 0
+    return bool(wildcard)
+
+
 @app.get("/metrics")
-async def metrics():
-    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+async def metrics(request: Request):
+    global _metrics_cache
+    rendered_at, body, compressed = _metrics_cache
+    now = time.monotonic()
+    if now - rendered_at >= METRICS_CACHE_SECONDS:
+        body = generate_latest()
+        compressed = gzip.compress(body, 1)
+        _metrics_cache = (now, body, compressed)
+    if _accepts_gzip(request.headers.get("accept-encoding", "")):
+        return Response(
+            compressed,
+            media_type=CONTENT_TYPE_LATEST,
+            headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"},
+        )
+    return Response(body, media_type=CONTENT_TYPE_LATEST, headers={"Vary": "Accept-Encoding"})
 
 app.include_router(query_router)
 app.include_router(whatsapp_router)
@@ -146,10 +278,13 @@ app.include_router(tenant_router)
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
+    # Reload and per-request access lines are opt-in so production runs skip the file watcher and log lock
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=port,
-        reload=True,
-        log_level="info"
+        reload=os.getenv("UVICORN_RELOAD", "0") == "1",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        log_level=os.getenv("UVICORN_LOG_LEVEL", "warning"),
+        access_log=os.getenv("ACCESS_LOG", "0") == "1",
     )
@@ -1,11 +1,13 @@
 """
 Pydantic models for AI Core messaging and query API.
 """
-from pydantic import BaseModel, Field, constr
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from typing import List, Dict, Any, Optional
+import uuid
 
 
-ChannelName = constr(strip_whitespace=True, to_lower=True)
+# Shared by every model here: whitespace is stripped by pydantic-core in the same pass as validation
+_MODEL_CONFIG = ConfigDict(populate_by_name=True, str_strip_whitespace=True, extra="ignore")
 
 
 class Citation(BaseModel):
@@ -14,14 +16,33 @@ class Citation(BaseModel):
     relevance: float = Field(ge=0.0, le=1.0)
     snippet: Optional[str] = None
 
+    model_config = _MODEL_CONFIG
+
 
 class QueryRequest(BaseModel):
-    tenant_id: str = Field(..., alias="tenantId")
-    user_id: Optional[str] = Field(None, alias="userId")
-    channel: ChannelName
+    # Parsed to UUID by pydantic-core; invalid ids are rejected (400, see main) before the handler runs
+    tenant_id: uuid.UUID = Field(..., alias="tenantId")
+    user_id: Optional[uuid.UUID] = Field(None, alias="userId")
+    channel: str
     message: str
     context: Dict[str, Any] = Field(default_factory=dict)
 
+    model_config = _MODEL_CONFIG
+
+    @field_validator("channel", mode="before")
+    @classmethod
+    def _lower_channel(cls, v: Any) -> Any:
+        return v.strip().lower() if isinstance(v, str) else v
+
+    @field_validator("tenant_id", "user_id", mode="before")
+    @classmethod
+    def _strip_id(cls, v: Any) -> Any:
+        # An empty userId means anonymous; surrounding whitespace was tolerated before typing
+        if isinstance(v, str):
+            v = v.strip()
+            return v or None
+        return v
+
 
 class QueryResponse(BaseModel):
     response: str
@@ -29,18 +50,20 @@ class QueryResponse(BaseModel):
     confidence: float = Field(ge=0.0, le=1.0)
     requires_human: bool = Field(alias="requiresHuman")
 
-    model_config = {
-        "populate_by_name": True,
-        "str_strip_whitespace": True,
-    }
+    model_config = _MODEL_CONFIG
 
 
 class NormalizedMessage(BaseModel):
-    channel: ChannelName
+    channel: str
     tenant_id: str
     user_id: str
     text: str
     message_type: str = "text"
     metadata: Dict[str, Any] = Field(default_factory=dict)
 
+    model_config = _MODEL_CONFIG
 
+    @field_validator("channel", mode="before")
+    @classmethod
+    def _lower_channel(cls, v: Any) -> Any:
+        return v.strip().lower() if isinstance(v, str) else v
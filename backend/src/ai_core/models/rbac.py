@@ -2,7 +2,7 @@
 RBAC roles, permissions, and helpers.
 """
 from enum import Enum
-from typing import Set, Dict
+from typing import Dict, FrozenSet
 
 
 class Role(str, Enum):
@@ -20,32 +20,34 @@ class Permission(str, Enum):
     ANALYTICS_VIEW = "ANALYTICS_VIEW"
 
 
-ROLE_PERMISSIONS: Dict[Role, Set[Permission]] = {
-    Role.ADMIN: {
+ROLE_PERMISSIONS: Dict[Role, FrozenSet[Permission]] = {
+    Role.ADMIN: frozenset({
         Permission.KB_VIEW,
         Permission.KB_EDIT,
         Permission.KB_PUBLISH,
         Permission.USER_MANAGE,
         Permission.ANALYTICS_VIEW,
-    },
-    Role.MANAGER: {
+    }),
+    Role.MANAGER: frozenset({
         Permission.KB_VIEW,
         Permission.KB_EDIT,
         Permission.KB_PUBLISH,
         Permission.ANALYTICS_VIEW,
-    },
-    Role.AGENT: {
+    }),
+    Role.AGENT: frozenset({
         Permission.KB_VIEW,
-    },
-    Role.END_USER: set(),
+    }),
+    Role.END_USER: frozenset(),
 }
 
 
+# Keyed by the raw role string so checks skip Role() construction (and its exception on bad input);
+# str-valued Role members hash and compare like their values, so they look up the same entries
+_ROLE_PERMS_BY_STR: Dict[str, FrozenSet[Permission]] = {r.value: perms for r, perms in ROLE_PERMISSIONS.items()}
+_NO_PERMISSIONS: FrozenSet[Permission] = frozenset()
+
+
 def has_permission(role: str, permission: Permission) -> bool:
-    try:
-        r = Role(role)
-    except Exception:
-        return False
-    return permission in ROLE_PERMISSIONS.get(r, set())
+    return permission in _ROLE_PERMS_BY_STR.get(role, _NO_PERMISSIONS)
 
 
@@ -2,36 +2,110 @@
 Conversation context management backed by SQLAlchemy models.
 """
 from typing import Optional, Dict, Any, List
-from sqlalchemy.orm import Session
-from sqlalchemy import select
+import logging
+import time
+from sqlalchemy.orm import Session, load_only
+from sqlalchemy import func, insert, inspect, select, text
+from sqlalchemy.dialects import postgresql, sqlite
 from shared.database.models import Conversation, Message, User
+from shared.database.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Dialects with INSERT ... ON CONFLICT; others use the SELECT-then-INSERT path
+_UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+# ON CONFLICT needs the partial unique index as its arbiter. Until a migration creates it,
+# conversations take the SELECT-then-INSERT path and the check is repeated this often.
+ACTIVE_INDEX_RECHECK_SECONDS = 60
+_ACTIVE_INDEX_COLUMNS = {"tenant_id", "user_id", "channel"}
+# engine -> (index present, monotonic time of the check)
+_active_index_checks: Dict[Any, tuple] = {}
+
+# What the query path reads; channel_context and the timestamps stay unloaded (deferred)
+_CONVERSATION_COLUMNS = load_only(
+    Conversation.id, Conversation.tenant_id, Conversation.user_id, Conversation.channel, Conversation.status, Conversation.context
+)
+_MESSAGE_COLUMNS = load_only(Message.id, Message.sender_type, Message.content, Message.timestamp)
+
+# Customer-facing channels; users first seen on these are external customers
+_EXTERNAL_CHANNELS = frozenset({"web", "whatsapp", "telegram", "teams"})
+
+
+def _has_active_conversation_index(db: Session) -> bool:
+    """Whether conversations has a unique index on (tenant_id, user_id, channel) WHERE status = 'ACTIVE'."""
+    bind = db.get_bind()
+    checked = _active_index_checks.get(bind)
+    if checked is not None and (checked[0] or time.monotonic() - checked[1] < ACTIVE_INDEX_RECHECK_SECONDS):
+        return checked[0]
+    try:
+        # Reflects the schema the session's unqualified table names resolve to
+        found = any(
+            ix["unique"] and set(ix["column_names"]) == _ACTIVE_INDEX_COLUMNS
+            and any(key.endswith("_where") for key in ix.get("dialect_options", {}))
+            for ix in inspect(db.connection()).get_indexes(Conversation.__tablename__)
+        )
+    except Exception as e:
+        logger.warning(f"Could not inspect conversation indexes: {e}")
+        found = False
+    if not found and checked is None:
+        logger.warning("uq_conversations_active is missing; run migrations to enable the conversation upsert")
+    _active_index_checks[bind] = (found, time.monotonic())
+    return found
 
 
 class ConversationService:
-    def __init__(self, db: Session):
-        self.db = db
+    """Stateless; the request's session is passed to each call so one instance can be shared.
+
+    Writes are only added (or flushed) to the session; the caller commits once per request.
+    write_messages is the exception: it commits batched log rows with a session of its own.
+    """
 
     def get_or_create_conversation(
-        self, tenant_id: str, user_id: str, channel: str, context: Optional[Dict[str, Any]] = None, channel_ctx: Optional[Dict[str, Any]] = None
+        self, db: Session, tenant_id: str, user_id: str, channel: str, context: Optional[Dict[str, Any]] = None, channel_ctx: Optional[Dict[str, Any]] = None
     ) -> Conversation:
-        # Ensure the user exists to satisfy FK constraints (PostgreSQL)
-        user = self.db.get(User, user_id)
+        # Default new users to END_USER role; infer type from channel
+        inferred_type = "EXTERNAL_CUSTOMER" if channel.lower() in _EXTERNAL_CHANNELS else "EXTERNAL_CUSTOMER"
+        upsert = _UPSERT_INSERTS.get(db.get_bind().dialect.name)
+        if upsert is not None and _has_active_conversation_index(db):
+            # Ensure the user exists to satisfy FK constraints, without a SELECT first
+            db.execute(upsert(User).values(id=user_id, tenant_id=tenant_id, user_type=inferred_type).on_conflict_do_nothing())
+            # One round trip whether or not the conversation exists; the partial unique index
+            # (uq_conversations_active) also keeps concurrent first messages from opening two
+            stmt = (
+                upsert(Conversation)
+                .values(
+                    tenant_id=tenant_id,
+                    user_id=user_id,
+                    channel=channel,
+                    context=context or {},
+                    channel_context=channel_ctx or {},
+                )
+                .on_conflict_do_update(
+                    index_elements=[Conversation.tenant_id, Conversation.user_id, Conversation.channel],
+                    index_where=text("status = 'ACTIVE'"),
+                    set_={"last_message_at": func.now()},
+                )
+                .returning(Conversation)
+                .options(_CONVERSATION_COLUMNS)
+                .execution_options(populate_existing=True)
+            )
+            return db.execute(stmt).scalar_one()
+
+        user = db.get(User, user_id)
         if not user:
-            # Default new users to END_USER role; infer type from channel
-            inferred_type = "EXTERNAL_CUSTOMER" if channel.lower() in {"web", "whatsapp", "telegram", "teams"} else "EXTERNAL_CUSTOMER"
             user = User(id=user_id, tenant_id=tenant_id, user_type=inferred_type)
-            self.db.add(user)
-            self.db.commit()
-            self.db.refresh(user)
+            db.add(user)
 
         stmt = (
             select(Conversation)
+            .options(_CONVERSATION_COLUMNS)
             .where(Conversation.tenant_id == tenant_id)
             .where(Conversation.user_id == user_id)
             .where(Conversation.channel == channel)
             .where(Conversation.status == "ACTIVE")
         )
-        existing = self.db.execute(stmt).scalars().first()
+        existing = db.execute(stmt).scalars().first()
         if existing:
             return existing
 
@@ -42,13 +116,14 @@ class ConversationService:
             context=context or {},
             channel_context=channel_ctx or {},
         )
-        self.db.add(convo)
-        self.db.commit()
-        self.db.refresh(convo)
+        db.add(convo)
+        # Assigns the id that messages reference
+        db.flush()
         return convo
 
     def add_message(
         self,
+        db: Session,
         conversation: Conversation,
         sender_type: str,
         content: str,
@@ -62,18 +137,35 @@ class ConversationService:
             message_type=message_type,
             meta=metadata or {},
         )
-        self.db.add(msg)
-        self.db.commit()
-        self.db.refresh(msg)
+        db.add(msg)
         return msg
 
-    def get_recent_messages(self, conversation: Conversation, limit: int = 10) -> List[Message]:
+    def bulk_add_messages(self, db: Session, rows: List[Dict[str, Any]]) -> None:
+        """Insert message rows (Message attribute names as keys) in one multi-row INSERT; the caller commits."""
+        if rows:
+            db.execute(insert(Message), rows)
+
+    def write_messages(self, rows: List[Dict[str, Any]]) -> None:
+        """Commit message rows with a session of its own; used by MessageBatcher after the response is sent."""
+        db = SessionLocal()
+        try:
+            self.bulk_add_messages(db, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def get_recent_messages(self, db: Session, conversation: Conversation, limit: int = 10) -> List[Message]:
         stmt = (
             select(Message)
+            .options(_MESSAGE_COLUMNS)
             .where(Message.conversation_id == conversation.id)
             .order_by(Message.timestamp.desc())
             .limit(limit)
         )
-        return list(self.db.execute(stmt).scalars().all())
+        return list(db.execute(stmt).scalars().all())
 
 
+conversation_service = ConversationService()
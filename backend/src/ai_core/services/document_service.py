@@ -1,45 +1,119 @@
 """
 Document processing: chunking and embedding using OpenAI.
 """
-from typing import List, Tuple, Dict, Any
+from typing import List, Tuple, Dict, Any, Optional, BinaryIO, Union
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
-from shared.database.models import Document, KnowledgeChunk, KnowledgeBase, Tenant
+from shared.database.models import EMBEDDING_DIM, Document, KnowledgeChunk, KnowledgeBase, Tenant
 from shared.utils.storage import write_metadata
 from openai import OpenAI
-import os, hashlib, struct, random
+import os, hashlib, struct
+import uuid
 import io
 import csv
-from docx import Document as DocxDocument
-from pptx import Presentation
-from openpyxl import load_workbook
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import threading
+from cachetools import TTLCache
 from shared.vector.qdrant import qdrant_service
+from ai_core.services.tenant_corpus import invalidate_tenant_corpus, quantize_embedding
+from ai_core.services.semantic_cache import semantic_cache
+from ai_core.services.text_extraction import extract_rows, extract_text
+from ai_core.services.embedding_cache import content_key, load_cached_embeddings, store_embeddings
 import logging
 import re
 
+_WHITESPACE_RE = re.compile(r"\s+")
+_SENTENCE_BOUNDARY_RE = re.compile(r"(?<=[\.!?])\s+(?=[A-Z(\[])")
+_PAGE_MARKER_RE = re.compile(r"\[\[PAGE:(\d+)\]\]")
+# Matched against stripped lines
+_CHAPTER_HEADING_RE = re.compile(r"^chapter\s+(\d+)\s*[\.:\-]?\s*(.*)$", re.IGNORECASE)
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+# Embedding requests in flight at once when an ingest spans several batches
+EMBED_CONCURRENCY = max(1, int(os.getenv("EMBED_CONCURRENCY", "8")))
+# OpenAI embeddings limits: tokens per input, inputs and tokens per request (kept a little under 300k)
+EMBED_MAX_INPUT_TOKENS = 8191
+EMBED_MAX_BATCH_INPUTS = 2048
+EMBED_MAX_BATCH_TOKENS = 290_000
+# Per-request timeout and retries for the shared client; the SDK's connection pool
+# (100 keep-alive connections) already covers EMBED_CONCURRENCY requests in flight
+EMBED_TIMEOUT_SECONDS = 60.0
+EMBED_MAX_RETRIES = 3
+# Chunks embedded and inserted per ingest step; bounds peak memory to two batches of vectors
+EMBED_STREAM_BATCH = 2048
+
+# Resolved knowledge base ids by (tenant id, requested KB id)
+KB_CACHE_TTL_SECONDS = 300
+_kb_cache: TTLCache = TTLCache(maxsize=1024, ttl=KB_CACHE_TTL_SECONDS)
+_kb_cache_lock = threading.Lock()
+
+
+def _remember_kb(key: Tuple[str, str], kb_id: str) -> str:
+    with _kb_cache_lock:
+        _kb_cache[key] = kb_id
+    return kb_id
+
+
+_embedding_encoding: Any = None
+_embedding_encoding_loaded = False
+
+
+def _get_embedding_encoding() -> Any:
+    """The cl100k_base tokenizer used by text-embedding-3-small, or None if tiktoken can't load it."""
+    global _embedding_encoding, _embedding_encoding_loaded
+    if not _embedding_encoding_loaded:
+        try:
+            import tiktoken
+            # First use fetches the BPE ranks unless TIKTOKEN_CACHE_DIR already has them
+            _embedding_encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"tiktoken unavailable, estimating embedding tokens: {e}")
+            _embedding_encoding = None
+        _embedding_encoding_loaded = True
+    return _embedding_encoding
+
 
 def chunk_text(text: str, chunk_size: int = 700, overlap: int = 100) -> List[str]:
-    chunks: List[str] = []
-    start = 0
-    while start < len(text):
-        end = min(len(text), start + chunk_size)
-        chunks.append(text[start:end])
-        if end == len(text):
-            break
-        start = max(0, end - overlap)
-    return chunks
+    n = len(text)
+    if not n:
+        return []
+    step = chunk_size - overlap
+    if step <= 0:
+        raise ValueError("overlap must be smaller than chunk_size")
+    # Windows start every step characters; the last is the first that reaches the end
+    # (ceil((n - chunk_size) / step) steps in). Slicing clamps that one to the text
+    last = max(0, -(-(n - chunk_size) // step))
+    return [text[i * step:i * step + chunk_size] for i in range(last + 1)]
+
+
+_openai_client: Optional[OpenAI] = None
+_openai_client_lock = threading.Lock()
+
+
+def _get_openai_client() -> OpenAI:
+    """One client per process, so its HTTP connection pool (and TLS sessions) are reused across requests."""
+    global _openai_client
+    with _openai_client_lock:
+        if _openai_client is None:
+            # The SDK's default 600s read timeout would stall an ingest on one hung batch
+            _openai_client = OpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"), timeout=EMBED_TIMEOUT_SECONDS, max_retries=EMBED_MAX_RETRIES
+            )
+        return _openai_client
 
 
 class DocumentService:
     def __init__(self, db: Session):
         self.db = db
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.client = _get_openai_client()
 
     @staticmethod
     def _split_sentences(text: str) -> List[str]:
         # Lightweight sentence splitter using punctuation and line breaks
         # Avoid breaking on common abbreviations by a simple heuristic
-        text = re.sub(r"\s+", " ", text)
-        candidates = re.split(r"(?<=[\.!?])\s+(?=[A-Z(\[])", text)
+        text = _WHITESPACE_RE.sub(" ", text)
+        candidates = _SENTENCE_BOUNDARY_RE.split(text)
         sentences: List[str] = []
         for s in candidates:
             s = s.strip()
@@ -59,7 +133,7 @@ class DocumentService:
         """
         # Detect simple page markers
         pages: List[Tuple[int, str]] = []
-        page_matches = list(re.finditer(r"\[\[PAGE:(\d+)\]\]", text))
+        page_matches = list(_PAGE_MARKER_RE.finditer(text))
         if page_matches:
             last_idx = 0
             current_page = 1
@@ -87,7 +161,7 @@ class DocumentService:
         for page_num, page_text in pages:
             # Identify chapter heading at start of page or within first lines
             for line in page_text.splitlines()[:6]:
-                m = re.match(r"^\s*chapter\s+(\d+)\s*[\.:\-]?\s*(.*)$", line.strip(), flags=re.IGNORECASE)
+                m = _CHAPTER_HEADING_RE.match(line.strip())
                 if m:
                     try:
                         current_chapter_num = int(m.group(1))
@@ -145,10 +219,9 @@ class DocumentService:
         - "Chapter 4: Governance"
         """
         try:
-            import re
             lines = [l.strip() for l in text.splitlines() if l.strip()]
             for line in lines[:5]:  # inspect only early lines of the chunk
-                m = re.match(r"^chapter\s+(\d+)\s*[\.:\-]?\s*(.*)$", line, flags=re.IGNORECASE)
+                m = _CHAPTER_HEADING_RE.match(line)
                 if m:
                     num = int(m.group(1))
                     title = (m.group(2) or "").strip()
@@ -157,170 +230,258 @@ class DocumentService:
             pass
         return {}
 
-    def embed(self, inputs: List[str]) -> List[List[float]]:
-        api_key = os.getenv("OPENAI_API_KEY")
-        if api_key:
-            # Batch requests to respect OpenAI per-request token limits
-            def estimate_tokens(text: str) -> int:
-                # Rough heuristic: 4 chars per token
-                return max(1, len(text) // 4)
-
-            MAX_TOKENS_PER_REQUEST = 280_000  # keep below 300k limit
-            embeddings: List[List[float]] = []
-            batch: List[str] = []
-            tokens_in_batch = 0
-            for t in inputs:
-                t_tokens = estimate_tokens(t)
-                if batch and tokens_in_batch + t_tokens > MAX_TOKENS_PER_REQUEST:
-                    resp = self.client.embeddings.create(
-                        model="text-embedding-3-small",
-                        input=batch,
-                    )
-                    embeddings.extend([d.embedding for d in resp.data])
-                    batch = []
-                    tokens_in_batch = 0
-                batch.append(t)
-                tokens_in_batch += t_tokens
-
-            if batch:
-                resp = self.client.embeddings.create(
-                    model="text-embedding-3-small",
-                    input=batch,
-                )
-                embeddings.extend([d.embedding for d in resp.data])
-
-            return embeddings
-        # Fallback deterministic embedding (no external dependency)
-        vectors: List[List[float]] = []
-        dim = 256
-        for text in inputs:
-            h = hashlib.sha256(text.encode("utf-8")).digest()
-            # Expand hash deterministically
-            rnd = random.Random(h)
-            vec = [rnd.uniform(-1.0, 1.0) for _ in range(dim)]
-            vectors.append(vec)
-        return vectors
+    def embed(self, inputs: List[str]) -> np.ndarray:
+        """Unit-length float32 embeddings of inputs, one row per input."""
+        if not os.getenv("OPENAI_API_KEY"):
+            return self._embed_fallback(inputs)
+        keys, cached, missing = self._lookup_cached_embeddings(inputs)
+        fresh = self._embed_remote(list(missing.values())) if missing else None
+        return self._merge_cached_embeddings(keys, cached, missing, fresh)
+
+    def _lookup_cached_embeddings(self, inputs: List[str]) -> Tuple[List[bytes], Dict[bytes, np.ndarray], Dict[bytes, str]]:
+        """Content keys of inputs, their cached vectors, and the distinct texts still to embed."""
+        # Texts embedded before (re-ingests, shared content) are served from the cache
+        keys = [content_key(t) for t in inputs]
+        cached = load_cached_embeddings(self.db, EMBEDDING_MODEL, keys)
+        missing: Dict[bytes, str] = {}
+        for key, t in zip(keys, inputs):
+            if key not in cached:
+                missing.setdefault(key, t)
+        return keys, cached, missing
+
+    def _merge_cached_embeddings(
+        self, keys: List[bytes], cached: Dict[bytes, np.ndarray], missing: Dict[bytes, str], fresh: Optional[np.ndarray]
+    ) -> np.ndarray:
+        """Store the freshly embedded misses and return every input's vector in order."""
+        if missing:
+            fresh_by_key = dict(zip(missing, fresh))
+            store_embeddings(self.db, EMBEDDING_MODEL, fresh_by_key)
+            cached.update(fresh_by_key)
+        if not keys:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([cached[key] for key in keys])
+
+    @staticmethod
+    def _embed_fallback(inputs: List[str]) -> np.ndarray:
+        """Deterministic embedding without an external dependency (no OPENAI_API_KEY)."""
+        # Sized like the real model's vectors so they fit the pgvector column and Qdrant collection
+        dim = EMBEDDING_DIM
+        vectors = np.empty((len(inputs), dim), dtype=np.float64)
+        for i, text in enumerate(inputs):
+            # Each text seeds its own generator, so its vector doesn't depend on the rest of the batch
+            seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+            vectors[i] = np.random.default_rng(seed).uniform(-1.0, 1.0, size=dim)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors.astype(np.float32)
+
+    def _embed_remote(self, inputs: List[str]) -> np.ndarray:
+        """Embed inputs with the OpenAI API, in order, as unit-length float32 rows."""
+        # Batch requests to respect OpenAI per-request token limits
+        enc = _get_embedding_encoding()
+        # The 4-chars-per-token estimate can under-count, so it keeps more headroom
+        max_batch_tokens = EMBED_MAX_BATCH_TOKENS if enc is not None else 280_000
+        batches: List[List[str]] = []
+        batch: List[str] = []
+        tokens_in_batch = 0
+        for t in inputs:
+            if enc is not None:
+                # Each text is encoded once; the count drives both truncation and batch packing
+                ids = enc.encode(t, disallowed_special=())
+                if len(ids) > EMBED_MAX_INPUT_TOKENS:
+                    ids = ids[:EMBED_MAX_INPUT_TOKENS]
+                    t = enc.decode(ids)
+                t_tokens = len(ids)
+            else:
+                t_tokens = max(1, len(t) // 4)
+            if batch and (tokens_in_batch + t_tokens > max_batch_tokens or len(batch) >= EMBED_MAX_BATCH_INPUTS):
+                batches.append(batch)
+                batch = []
+                tokens_in_batch = 0
+            batch.append(t)
+            tokens_in_batch += t_tokens
+        if batch:
+            batches.append(batch)
+
+        def create(texts: List[str]) -> np.ndarray:
+            resp = self.client.embeddings.create(
+                model=EMBEDDING_MODEL,
+                input=texts,
+            )
+            # Packed once at the API boundary instead of carrying a PyFloat per dimension
+            return np.asarray([d.embedding for d in resp.data], dtype=np.float32)
+
+        if len(batches) > 1:
+            # Large ingests send their batches in parallel; map keeps results in batch order
+            with ThreadPoolExecutor(max_workers=min(EMBED_CONCURRENCY, len(batches))) as pool:
+                results = list(pool.map(create, batches))
+        else:
+            results = [create(b) for b in batches]
+        embeddings = np.concatenate(results) if len(results) > 1 else results[0]
+
+        # Stored unit-length so query-time cosine is a plain dot product
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.where(norms > 0, norms, 1.0)
+
+    def _index_chunks_and_commit(
+        self, tenant_id: str, doc: Document, texts: List[str], metas: List[Dict[str, Any]]
+    ) -> Tuple[str, int]:
+        """Embed and insert the document's chunks batch by batch, then commit the ingest.
+
+        Only two batches of embeddings are alive at a time: while one batch's rows are
+        inserted (and upserted to Qdrant), the next batch is being embedded. Qdrant points
+        written for a document whose transaction then fails are deleted again.
+        """
+        n = len(texts)
+        use_qdrant: Optional[bool] = None
+        qdrant_written = False
+        remote = bool(os.getenv("OPENAI_API_KEY"))
+        try:
+            with ThreadPoolExecutor(max_workers=1) as prefetch:
+                # The prefetch thread only computes vectors; cache reads and writes stay on
+                # this thread, since self.db must not be used from two threads at once
+                def start_batch(batch: List[str]):
+                    if not remote:
+                        return None, None, None, prefetch.submit(self._embed_fallback, batch)
+                    keys, cached, missing = self._lookup_cached_embeddings(batch)
+                    fut = prefetch.submit(self._embed_remote, list(missing.values())) if missing else None
+                    return keys, cached, missing, fut
+
+                def finish_batch(state) -> np.ndarray:
+                    keys, cached, missing, fut = state
+                    if keys is None:
+                        return fut.result()
+                    return self._merge_cached_embeddings(keys, cached, missing, fut.result() if fut else None)
+
+                pending = start_batch(texts[:EMBED_STREAM_BATCH])
+                for start in range(0, n, EMBED_STREAM_BATCH):
+                    embeddings = finish_batch(pending)
+                    stop = min(start + EMBED_STREAM_BATCH, n)
+                    if stop < n:
+                        pending = start_batch(texts[stop:stop + EMBED_STREAM_BATCH])
+
+                    chunk_rows: List[Dict[str, Any]] = []
+                    qdrant_payload: List[Dict[str, Any]] = []
+                    for idx, emb in zip(range(start, stop), embeddings):
+                        chunk_id = uuid.uuid4()
+                        meta = metas[idx]
+                        emb_i8, emb_scale = quantize_embedding(emb)
+                        chunk_rows.append({
+                            "id": chunk_id,
+                            "document_id": doc.id,
+                            "content": texts[idx],
+                            "chunk_index": idx,
+                            "embedding": emb,
+                            "embedding_i8": emb_i8,
+                            "embedding_scale": emb_scale,
+                            "meta": meta,
+                        })
+                        qdrant_payload.append({
+                            "id": str(chunk_id),
+                            "embedding": emb,
+                            "document_id": str(doc.id),
+                            "content": texts[idx],
+                            "chunk_index": idx,
+                            "chapter_num": meta.get("chapter_num"),
+                            "chapter_title": meta.get("chapter_title"),
+                            "page": meta.get("page"),
+                        })
+                    # One executemany INSERT per batch instead of a KnowledgeChunk instance per row
+                    self.db.execute(insert(KnowledgeChunk), chunk_rows)
+
+                    # Best-effort: Qdrant only takes the 1536-d OpenAI vectors, and after a
+                    # failed upsert the rest of this ingest stays SQL-only
+                    try:
+                        if use_qdrant is None:
+                            use_qdrant = embeddings.shape[1] == 1536
+                            if use_qdrant:
+                                qdrant_service.create_collection()
+                            else:
+                                logging.getLogger(__name__).info("Skipping Qdrant upsert due to embedding dimension mismatch")
+                        if use_qdrant:
+                            use_qdrant = bool(qdrant_service.upsert_knowledge_chunks(tenant_id, qdrant_payload))
+                            qdrant_written = qdrant_written or use_qdrant
+                    except Exception as e:
+                        # Never fail ingestion due to vector store issues
+                        use_qdrant = False
+                        logging.getLogger(__name__).warning(f"Qdrant upsert skipped: {e}")
+
+            doc.status = "INDEXED"
+            doc.chunk_count = n
+            doc_id = str(doc.id)
+            # KB, document and chunks land in one transaction: a single commit per ingest
+            self.db.commit()
+            return doc_id, n
+        except Exception:
+            if qdrant_written:
+                qdrant_service.delete_document_chunks(tenant_id, str(doc.id))
+            raise
 
     def process_and_store(self, tenant_id: str, title: str, content: str, knowledge_base_id: str) -> Tuple[str, int]:
         try:
-            # Validate tenant_id is a valid UUID
-            import uuid
+            # Validate tenant_id is a valid UUID; parsed once and passed down
             try:
-                uuid.UUID(tenant_id)
+                tenant_uuid = uuid.UUID(tenant_id)
             except ValueError:
                 raise ValueError(f"Invalid tenant_id: {tenant_id}. Must be a valid UUID.")
             
             # Ensure a knowledge base exists for this tenant
-            kb_id = self._get_or_create_knowledge_base(tenant_id, knowledge_base_id)
+            kb_id = self._get_or_create_knowledge_base(tenant_uuid, knowledge_base_id)
 
             # Create document
             doc = Document(title=title, content=content, knowledge_base_id=kb_id, status="PROCESSING")
             self.db.add(doc)
-            self.db.commit()
-            self.db.refresh(doc)
+            # Assigns doc.id for the chunk rows; everything commits once, below
+            self.db.flush()
 
-            # Chunk and embed (sentence-aware, chapter-aware)
+            # Chunk (sentence-aware, chapter-aware); embedding happens batch by batch below
             chunk_pairs = self._build_chunks_with_metadata(content)
-            chunks = [t for (t, _m) in chunk_pairs]
-            metas = [m for (_t, m) in chunk_pairs]
-            if not chunks:
+            if not chunk_pairs:
                 raise ValueError("No chunks could be created from the content")
-            
-            embeddings = self.embed(chunks)
-
-            # Store chunks
-            qdrant_payload: List[Dict[str, Any]] = []
-            for idx, ((chunk_text_val, meta_chunk), emb) in enumerate(zip(chunk_pairs, embeddings)):
-                # Ensure a concrete UUID is assigned before using the ID
-                import uuid as _uuid
-                chunk_id = _uuid.uuid4()
+            chunks: List[str] = []
+            metas: List[Dict[str, Any]] = []
+            for chunk_text_val, meta_chunk in chunk_pairs:
                 # Merge auto-headline detection with chunk-derived meta
-                chapter_meta = self._extract_chapter_info(chunk_text_val)
                 merged_meta = dict(meta_chunk)
-                for k, v in chapter_meta.items():
+                for k, v in self._extract_chapter_info(chunk_text_val).items():
                     if v and k not in merged_meta:
                         merged_meta[k] = v
-                kc = KnowledgeChunk(
-                    id=chunk_id,
-                    document_id=doc.id,
-                    content=chunk_text_val,
-                    chunk_index=idx,
-                    embedding=emb,
-                    meta=merged_meta or {},
-                )
-                self.db.add(kc)
-                # SQLAlchemy default UUID is assigned on instantiation; id is available before commit
-                try:
-                    qdrant_payload.append({
-                        "id": str(chunk_id),
-                        "embedding": emb,
-                        "document_id": str(doc.id),
-                        "content": chunk_text_val,
-                        "chunk_index": idx,
-                        "chapter_num": merged_meta.get("chapter_num"),
-                        "chapter_title": merged_meta.get("chapter_title"),
-                        "page": merged_meta.get("page"),
-                    })
-                except Exception:
-                    pass
-            doc.status = "INDEXED"
-            doc.chunk_count = len(chunks)
-            self.db.add(doc)
-            self.db.commit()
+                chunks.append(chunk_text_val)
+                metas.append(merged_meta)
+
+            doc_id, chunk_count = self._index_chunks_and_commit(tenant_id, doc, chunks, metas)
+            invalidate_tenant_corpus(tenant_id)
+            semantic_cache.invalidate_tenant(tenant_id)
 
-            # Best-effort: upsert vectors to Qdrant when dimensions match (OpenAI = 1536)
-            try:
-                if qdrant_payload and isinstance(qdrant_payload[0].get("embedding"), list):
-                    dim = len(qdrant_payload[0]["embedding"]) if qdrant_payload[0].get("embedding") else 0
-                    if dim == 1536:
-                        try:
-                            qdrant_service.create_collection()
-                        except Exception:
-                            # Collection may already exist or service may be unavailable
-                            pass
-                        try:
-                            qdrant_service.upsert_knowledge_chunks(tenant_id, qdrant_payload)
-                        except Exception as e:
-                            logging.getLogger(__name__).warning(f"Qdrant upsert skipped: {e}")
-                    else:
-                        logging.getLogger(__name__).info("Skipping Qdrant upsert due to embedding dimension mismatch")
-            except Exception:
-                # Never fail ingestion due to vector store issues
-                pass
-            
             # Write metadata.json for downstream processing
             metadata: Dict[str, Any] = {
                 "tenant_id": tenant_id,
-                "document_id": str(doc.id),
+                "document_id": doc_id,
                 "knowledge_base_id": kb_id,
                 "title": title,
-                "chunk_count": doc.chunk_count,
-                "status": doc.status,
+                "chunk_count": chunk_count,
+                "status": "INDEXED",
             }
             base_path = os.getenv("DOCUMENT_STORAGE_PATH", os.path.join(os.getcwd(), "storage"))
             try:
-                write_metadata(base_path, tenant_id, str(doc.id), metadata)
+                write_metadata(base_path, tenant_id, doc_id, metadata)
             except Exception as e:
                 # Log but don't fail if metadata write fails
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.warning(f"Failed to write metadata: {e}")
+                logging.getLogger(__name__).warning(f"Failed to write metadata: {e}")
             
-            return str(doc.id), len(chunks)
+            return doc_id, len(chunks)
         except Exception as e:
             # If there's an error, rollback the transaction
             self.db.rollback()
             raise
 
-    def _get_or_create_knowledge_base(self, tenant_id: str, provided_kb_id: str) -> str:
-        import uuid
-        
-        # Validate tenant_id
-        try:
-            tenant_uuid = uuid.UUID(tenant_id)
-        except ValueError:
-            raise ValueError(f"Invalid tenant_id format: {tenant_id}")
-        
+    def _get_or_create_knowledge_base(self, tenant_uuid: uuid.UUID, provided_kb_id: str) -> str:
+        # Back-to-back ingests for a tenant resolve the same KB; skip both lookups
+        cache_key = (str(tenant_uuid), provided_kb_id or "")
+        with _kb_cache_lock:
+            cached_kb_id = _kb_cache.get(cache_key)
+        if cached_kb_id is not None:
+            return cached_kb_id
+
         # Ensure tenant exists; if missing, create a default record (dev-friendly)
         try:
             existing_tenant = self.db.get(Tenant, tenant_uuid)
@@ -328,7 +489,8 @@ class DocumentService:
                 # Create a minimal tenant to satisfy FK; name/domain deterministic for the given UUID
                 t = Tenant(id=tenant_uuid, name="Seeded Tenant", domain="seeded", settings={})
                 self.db.add(t)
-                self.db.commit()
+                # Commits with the ingest; flushed now so a conflict surfaces before any other writes
+                self.db.flush()
         except Exception:
             # Best-effort; if this fails, the subsequent KB creation will surface the error
             self.db.rollback()
@@ -339,7 +501,7 @@ class DocumentService:
                 kb_uuid = uuid.UUID(provided_kb_id)
                 kb = self.db.get(KnowledgeBase, kb_uuid)
                 if kb:
-                    return str(kb.id)
+                    return _remember_kb(cache_key, str(kb.id))
             except ValueError:
                 # Invalid UUID format, skip
                 pass
@@ -352,106 +514,45 @@ class DocumentService:
             .first()
         )
         if kb:
-            return str(kb.id)
+            return _remember_kb(cache_key, str(kb.id))
 
-        # Create a new knowledge base for this tenant
+        # Create a new knowledge base for this tenant; not cached until a later lookup
+        # finds it committed, since this ingest may still roll it back
         new_kb = KnowledgeBase(tenant_id=tenant_uuid, name="Default", status="ACTIVE", document_count=0)
         self.db.add(new_kb)
-        self.db.commit()
-        self.db.refresh(new_kb)
+        # The id is assigned client-side; the KB commits with the document that needs it
+        self.db.flush()
         return str(new_kb.id)
 
-    def extract_text_from_file(self, filename: str, data: bytes) -> str:
-        name = filename.lower()
-        if name.endswith('.txt') or name.endswith('.csv'):
-            try:
-                return data.decode('utf-8')
-            except Exception:
-                return data.decode('latin-1', errors='ignore')
-        if name.endswith('.docx'):
-            buf = io.BytesIO(data)
-            d = DocxDocument(buf)
-            return '\n'.join(p.text for p in d.paragraphs)
-        if name.endswith('.pptx'):
-            buf = io.BytesIO(data)
-            prs = Presentation(buf)
-            texts: List[str] = []
-            for slide in prs.slides:
-                for shape in slide.shapes:
-                    if hasattr(shape, 'text'):
-                        texts.append(shape.text)
-            return '\n'.join(texts)
-        if name.endswith('.xlsx'):
-            buf = io.BytesIO(data)
-            wb = load_workbook(buf, data_only=True)
-            texts: List[str] = []
-            for ws in wb.worksheets:
-                for row in ws.iter_rows(values_only=True):
-                    texts.append('\t'.join('' if v is None else str(v) for v in row))
-            return '\n'.join(texts)
-        # PDF handled by PyPDF2
-        if name.endswith('.pdf'):
-            from PyPDF2 import PdfReader
-            buf = io.BytesIO(data)
-            reader = PdfReader(buf)
-            texts: List[str] = []
-            for i, page in enumerate(reader.pages, start=1):
-                texts.append(f"[[PAGE:{i}]]\n" + (page.extract_text() or ''))
-            return '\n'.join(texts)
-        # Fallback raw decode
-        try:
-            return data.decode('utf-8')
-        except Exception:
-            return data.decode('latin-1', errors='ignore')
+    def extract_text_from_file(self, filename: str, data: Union[bytes, BinaryIO]) -> str:
+        return extract_text(filename, data)
 
-    def extract_rows_from_file(self, filename: str, data: bytes) -> List[str]:
-        name = filename.lower()
-        rows: List[str] = []
-        if name.endswith('.csv'):
-            try:
-                text = data.decode('utf-8-sig', errors='ignore')
-            except Exception:
-                text = data.decode('latin-1', errors='ignore')
-            reader = csv.reader(io.StringIO(text))
-            # Re-serialize each row via csv.writer to preserve quoting and commas inside fields
-            for r in reader:
-                buf = io.StringIO()
-                writer = csv.writer(buf)
-                writer.writerow(r)
-                rows.append(buf.getvalue().strip('\n'))
-        elif name.endswith('.xlsx'):
-            buf = io.BytesIO(data)
-            wb = load_workbook(buf, data_only=True)
-            for ws in wb.worksheets:
-                for r in ws.iter_rows(values_only=True):
-                    # Use csv.writer to serialize each row consistently
-                    buf_row = io.StringIO()
-                    writer = csv.writer(buf_row)
-                    writer.writerow(['' if v is None else v for v in r])
-                    rows.append(buf_row.getvalue().strip('\n'))
-        return rows
+    def extract_rows_from_file(self, filename: str, data: Union[bytes, BinaryIO]) -> List[str]:
+        return extract_rows(filename, data)
 
     def process_rows_and_store(self, tenant_id: str, title: str, rows: List[str], knowledge_base_id: str) -> Tuple[str, int]:
         try:
-            # Validate tenant_id
-            import uuid
+            # Validate tenant_id; parsed once and passed down
             try:
-                uuid.UUID(tenant_id)
+                tenant_uuid = uuid.UUID(tenant_id)
             except ValueError:
                 raise ValueError(f"Invalid tenant_id: {tenant_id}. Must be a valid UUID.")
             
             if not rows:
                 raise ValueError("No rows provided to process")
             
-            kb_id = self._get_or_create_knowledge_base(tenant_id, knowledge_base_id)
+            kb_id = self._get_or_create_knowledge_base(tenant_uuid, knowledge_base_id)
             preview = '\n'.join(rows[:5]) + ('\n...' if len(rows) > 5 else '')
             doc = Document(title=title, content=preview, knowledge_base_id=kb_id, status="PROCESSING")
             
             # Capture header columns if present (first row)
             if rows:
                 try:
-                    header_reader = csv.reader(io.StringIO(rows[0]))
-                    header = next(header_reader)
+                    # Rows are csv.writer output, so a header without quotes has no quoted commas
+                    if '"' not in rows[0]:
+                        header = rows[0].split(',')
+                    else:
+                        header = next(csv.reader(io.StringIO(rows[0])))
                     doc.meta = {"columns": [h.strip().lower() for h in header]}
                     # If first row is header, skip it for chunk storage
                     data_rows = rows[1:]
@@ -464,70 +565,30 @@ class DocumentService:
                 raise ValueError("No data rows found after header extraction")
             
             self.db.add(doc)
-            self.db.commit()
-            self.db.refresh(doc)
-
-            embeddings = self.embed(data_rows)
-            qdrant_payload: List[Dict[str, Any]] = []
-            for idx, (row_text, emb) in enumerate(zip(data_rows, embeddings)):
-                import uuid as _uuid
-                chunk_id = _uuid.uuid4()
-                # Tabular rows do not carry chapter info
-                kc = KnowledgeChunk(id=chunk_id, document_id=doc.id, content=row_text, chunk_index=idx, embedding=emb)
-                self.db.add(kc)
-                try:
-                    qdrant_payload.append({
-                        "id": str(chunk_id),
-                        "embedding": emb,
-                        "document_id": str(doc.id),
-                        "content": row_text,
-                        "chunk_index": idx,
-                        "chapter_num": None,
-                        "chapter_title": None,
-                    })
-                except Exception:
-                    pass
-            doc.status = "INDEXED"
-            doc.chunk_count = len(data_rows)
-            self.db.add(doc)
-            self.db.commit()
+            # Assigns doc.id for the chunk rows; everything commits once, below
+            self.db.flush()
 
-            # Best-effort: upsert to Qdrant when dimensions match expected size
-            try:
-                if qdrant_payload and isinstance(qdrant_payload[0].get("embedding"), list):
-                    dim = len(qdrant_payload[0]["embedding"]) if qdrant_payload[0].get("embedding") else 0
-                    if dim == 1536:
-                        try:
-                            qdrant_service.create_collection()
-                        except Exception:
-                            pass
-                        try:
-                            qdrant_service.upsert_knowledge_chunks(tenant_id, qdrant_payload)
-                        except Exception as e:
-                            logging.getLogger(__name__).warning(f"Qdrant upsert skipped: {e}")
-                    else:
-                        logging.getLogger(__name__).info("Skipping Qdrant upsert due to embedding dimension mismatch")
-            except Exception:
-                pass
+            # Tabular rows do not carry chapter info
+            doc_id, chunk_count = self._index_chunks_and_commit(tenant_id, doc, data_rows, [{} for _ in data_rows])
+            invalidate_tenant_corpus(tenant_id)
+            semantic_cache.invalidate_tenant(tenant_id)
 
             metadata: Dict[str, Any] = {
                 "tenant_id": tenant_id,
-                "document_id": str(doc.id),
+                "document_id": doc_id,
                 "knowledge_base_id": kb_id,
                 "title": title,
-                "chunk_count": doc.chunk_count,
-                "status": doc.status,
+                "chunk_count": chunk_count,
+                "status": "INDEXED",
             }
             base_path = os.getenv("DOCUMENT_STORAGE_PATH", os.path.join(os.getcwd(), "storage"))
             try:
-                write_metadata(base_path, tenant_id, str(doc.id), metadata)
+                write_metadata(base_path, tenant_id, doc_id, metadata)
             except Exception as e:
                 # Log but don't fail if metadata write fails
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.warning(f"Failed to write metadata: {e}")
+                logging.getLogger(__name__).warning(f"Failed to write metadata: {e}")
             
-            return str(doc.id), len(rows)
+            return doc_id, len(rows)
         except Exception as e:
             # Rollback on error
             self.db.rollback()
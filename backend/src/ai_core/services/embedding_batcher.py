@@ -0,0 +1,50 @@
+"""
+Micro-batching for query embeddings.
+
+Each query needs one embedding. Instead of one OpenAI request per query,
+callers enqueue their text and a background task sends everything that
+arrived within max_wait_ms (up to max_batch texts) as a single embeddings
+request, then hands each caller its own vector.
+"""
+from typing import Callable, List, Optional, Sequence
+import asyncio
+import concurrent.futures
+import logging
+from ai_core.services.micro_batcher import MicroBatcher
+
+logger = logging.getLogger(__name__)
+
+EmbedFn = Callable[[List[str]], Optional[Sequence[Optional[List[float]]]]]
+
+
+class EmbeddingBatcher:
+    def __init__(self, embed_fn: EmbedFn, max_batch: int = 32, max_wait_ms: int = 50):
+        # embed_fn is blocking; it runs in a worker thread once per batch
+        self.embed_fn = embed_fn
+        self._batcher = MicroBatcher(self._flush, max_batch, max_wait_ms)
+
+    async def embed(self, text: str) -> Optional[List[float]]:
+        """Embedding for text, or None if the embedding call is unavailable or failed."""
+        return await self._batcher.submit(text)
+
+    def embed_threadsafe(self, text: str, loop: asyncio.AbstractEventLoop, timeout: float = 30.0) -> Optional[List[float]]:
+        """Blocking embed() for code running in a worker thread of loop; None on timeout or failure."""
+        fut = asyncio.run_coroutine_threadsafe(self.embed(text), loop)
+        try:
+            return fut.result(timeout)
+        except concurrent.futures.TimeoutError:
+            # Drops the caller's slot; a batch already in flight just discards this result
+            fut.cancel()
+            logger.warning(f"Query embedding timed out after {timeout}s")
+            return None
+        except Exception as e:
+            logger.warning(f"Query embedding failed: {e}")
+            return None
+
+    async def _flush(self, texts: List[str]) -> List[Optional[List[float]]]:
+        try:
+            vectors = await asyncio.to_thread(self.embed_fn, texts)
+        except Exception as e:
+            logger.warning(f"Batched embedding of {len(texts)} queries failed: {e}")
+            vectors = None
+        return [vectors[i] if vectors and i < len(vectors) else None for i in range(len(texts))]
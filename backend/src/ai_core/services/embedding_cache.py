@@ -0,0 +1,88 @@
+"""
+Persistent embedding cache keyed by (model, SHA-256 of the input text).
+
+Re-ingesting a document, or overlapping content across documents, produces
+chunks that were already embedded. DocumentService.embed looks their vectors
+up here in one query per batch of keys and only sends the misses to OpenAI.
+Vectors are stored as little-endian float32 bytes, exactly as embed returns them.
+
+Both functions run on the ingest's own session. A second session would share
+SQLite's single StaticPool connection, and closing it would roll back the
+ingest's flushed rows.
+"""
+from typing import Dict, Sequence
+import hashlib
+import logging
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from shared.database.models import EmbeddingCacheEntry
+
+logger = logging.getLogger(__name__)
+
+# Keys per IN (...) lookup; stays under SQLite's bound-parameter limit
+_LOOKUP_CHUNK = 500
+_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def content_key(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+def load_cached_embeddings(
+    db: Session, model: str, keys: Sequence[bytes]
+) -> Dict[bytes, np.ndarray]:
+    """Cached vectors for the keys that have one; empty on any database error."""
+    found: Dict[bytes, np.ndarray] = {}
+    unique = list(dict.fromkeys(keys))
+    if not unique:
+        return found
+    try:
+        # Savepoint, so a failed lookup (e.g. table not migrated yet) doesn't abort the
+        # ingest on PostgreSQL
+        with db.begin_nested():
+            for i in range(0, len(unique), _LOOKUP_CHUNK):
+                stmt = (
+                    select(
+                        EmbeddingCacheEntry.content_sha256,
+                        EmbeddingCacheEntry.embedding,
+                    )
+                    .where(EmbeddingCacheEntry.model == model)
+                    .where(
+                        EmbeddingCacheEntry.content_sha256.in_(
+                            unique[i : i + _LOOKUP_CHUNK]
+                        )
+                    )
+                )
+                for key, blob in db.execute(stmt):
+                    found[bytes(key)] = np.frombuffer(blob, dtype="<f4")
+    except Exception as e:
+        logger.warning(f"Embedding cache lookup failed: {e}")
+    return found
+
+
+def store_embeddings(db: Session, model: str, entries: Dict[bytes, np.ndarray]) -> None:
+    """Insert new vectors, ignoring keys another ingest stored first; best-effort.
+
+    The rows commit with the caller's transaction; a failed insert only rolls back its
+    savepoint.
+    """
+    if not entries:
+        return
+    insert = _INSERTS.get(db.get_bind().dialect.name)
+    if insert is None:
+        return
+    rows = [
+        {
+            "model": model,
+            "content_sha256": key,
+            "embedding": np.asarray(vec, dtype="<f4").tobytes(),
+        }
+        for key, vec in entries.items()
+    ]
+    try:
+        with db.begin_nested():
+            db.execute(insert(EmbeddingCacheEntry).on_conflict_do_nothing(), rows)
+    except Exception as e:
+        logger.warning(f"Embedding cache write failed: {e}")
@@ -9,15 +9,17 @@ from ai_core.models.rbac import has_permission, Permission
 
 
 class InternalKnowledgeService:
+    # Built once; projects only the listed columns instead of loading full Document rows
+    _list_stmt = select(Document.id, Document.title, Document.status).where(Document.knowledge_base_id.isnot(None))
+
     def __init__(self, db: Session):
         self.db = db
 
     def list_documents(self, tenant_id: str, role: str) -> List[Dict[str, Any]]:
         if not has_permission(role, Permission.KB_VIEW):
             raise PermissionError("Insufficient permissions to view knowledge base")
-        stmt = select(Document).where(Document.knowledge_base_id.isnot(None))
-        docs = self.db.execute(stmt).scalars().all()
-        return [{"id": str(d.id), "title": d.title, "status": d.status} for d in docs]
+        rows = self.db.execute(self._list_stmt).all()
+        return [{"id": str(doc_id), "title": title, "status": doc_status} for doc_id, title, doc_status in rows]
 
     def update_document(self, role: str, document_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
         if not has_permission(role, Permission.KB_EDIT):
@@ -30,8 +32,9 @@ class InternalKnowledgeService:
         if "content" in updates:
             doc.content = updates["content"]
         self.db.add(doc)
+        # Read before committing, which expires the instance and would cost a reload
+        result = {"id": str(doc.id), "title": doc.title, "status": doc.status}
         self.db.commit()
-        self.db.refresh(doc)
-        return {"id": str(doc.id), "title": doc.title, "status": doc.status}
+        return result
 
 
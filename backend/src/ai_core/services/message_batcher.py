@@ -0,0 +1,44 @@
+"""
+Micro-batching for conversation log writes.
+
+Replies are logged after the response has been sent. Instead of one
+transaction per message, callers enqueue a row and a background task writes
+everything that arrived within max_wait_ms (up to max_batch rows) as one
+multi-row INSERT and a single commit.
+"""
+from typing import Any, Callable, Dict, List
+import asyncio
+import logging
+from ai_core.services.micro_batcher import MicroBatcher
+
+logger = logging.getLogger(__name__)
+
+WriteFn = Callable[[List[Dict[str, Any]]], None]
+
+
+class MessageBatcher:
+    def __init__(self, write_fn: WriteFn, max_batch: int = 100, max_wait_ms: int = 20):
+        # write_fn is blocking; it runs in a worker thread once per batch
+        self.write_fn = write_fn
+        self._batcher = MicroBatcher(self._flush, max_batch, max_wait_ms)
+
+    async def add(self, conversation_id, sender_type: str, content: str, message_type: str = "TEXT") -> bool:
+        """Queue one message row; resolves once its batch is committed (False if the write failed)."""
+        row = {
+            "conversation_id": conversation_id,
+            "sender_type": sender_type,
+            "content": content,
+            "message_type": message_type,
+            "meta": {},
+        }
+        return await self._batcher.submit(row)
+
+    async def _flush(self, rows: List[Dict[str, Any]]) -> List[bool]:
+        try:
+            await asyncio.to_thread(self.write_fn, rows)
+            ok = True
+        except Exception as e:
+            # The replies were already sent; a lost log entry must not surface as an error
+            logger.warning(f"Batched write of {len(rows)} messages failed: {e}")
+            ok = False
+        return [ok] * len(rows)
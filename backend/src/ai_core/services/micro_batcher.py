@@ -0,0 +1,70 @@
+"""
+Generic micro-batching on an asyncio event loop.
+
+Callers submit one item and await its result. A background task collects
+everything that arrived within max_wait_ms (up to max_batch items) and hands
+the batch to a flush coroutine, which returns one result per item.
+EmbeddingBatcher and MessageBatcher configure it for query embeddings and
+conversation log writes.
+"""
+from typing import Any, Awaitable, Callable, List, Optional, Set, Tuple
+import asyncio
+
+FlushFn = Callable[[List[Any]], Awaitable[List[Any]]]
+
+
+class MicroBatcher:
+    def __init__(self, flush: FlushFn, max_batch: int, max_wait_ms: int):
+        self.flush = flush
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # The loop only keeps weak references to tasks; in-flight flushes are held here
+        self._flushes: Set[asyncio.Task] = set()
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item; resolves to its entry in the flush result once its batch is flushed."""
+        self._ensure_worker()
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, fut))
+        return await fut
+
+    def _ensure_worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run(self._queue))
+
+    async def _run(self, queue: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            # Flush concurrently so a slow flush doesn't hold up the next batch
+            task = loop.create_task(self._flush_batch(batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _flush_batch(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        try:
+            results = await self.flush([item for item, _fut in batch])
+        except Exception as e:
+            for _item, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        # Callers that gave up (cancelled futures) just miss their result
+        for (_item, fut), result in zip(batch, results):
+            if not fut.done():
+                fut.set_result(result)
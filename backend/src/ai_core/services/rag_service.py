@@ -3,8 +3,9 @@ RAG service with hybrid retrieval (BM25 + dense vectors) and RRF fusion,
 augmented with OpenAI chat generation using a strict prompt to avoid
 hallucinations.
 """
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Sequence
 from collections import defaultdict
+import heapq
 import math
 import re
 import os
@@ -15,6 +16,11 @@ from shared.cache.redis import redis_cache
 from openai import OpenAI
 from shared.vector.qdrant import qdrant_service
 
+# Patterns used on every answer, compiled once at import
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[\.!?])\s+|\n+|;\s+")
+_SMALL_NUMBER_RE = re.compile(r"\b(\d{1,3})\b")
+_CHAPTER_SUMMARY_RE = re.compile(r"summary\s+of\s+chapter\s+(\d+)")
+
 # Placeholder lightweight BM25 implementation using term frequency
 class BM25Lite:
     def __init__(self, docs: List[str]):
@@ -52,7 +58,10 @@ class HybridRetriever:
         self.corpus = documents[:]
         self.bm25 = BM25Lite(self.corpus)
 
-    def dense_search(self, query: str, top_k: int = 5) -> List[int]:
+    def dense_search(self, query: str, top_k: int = 5, ranking: Optional[Sequence[int]] = None) -> List[int]:
+        # A precomputed embedding ranking (corpus positions, best first) takes precedence
+        if ranking is not None:
+            return list(ranking[:top_k])
         # Improved scoring with both length and content similarity
         q_len = len(query)
         query_lower = query.lower()
@@ -75,8 +84,8 @@ class HybridRetriever:
             score = (jaccard * 2.0) + length_sim
             scored.append((i, score))
         
-        scored.sort(key=lambda x: x[1], reverse=True)
-        return [i for i, _ in scored[:top_k]]
+        # Partial selection keeps only top_k in a heap; ties keep corpus order as a sort would
+        return [i for i, _ in heapq.nlargest(top_k, scored, key=lambda x: x[1])]
 
     def keyword_search(self, query: str, top_k: int = 5) -> List[int]:
         if not self.bm25:
@@ -101,18 +110,24 @@ class HybridRetriever:
                 if matching_terms > 0:
                     scores[i] += matching_terms * 1.0
         
-        ranked = sorted(enumerate(scores), key=lambda x: x[1], reverse=True)
-        return [i for i, _ in ranked[:top_k]]
+        return [i for i, _ in heapq.nlargest(top_k, enumerate(scores), key=lambda x: x[1])]
 
     def rrf_fuse(self, lists: List[List[int]], k: int = 60, top_k: int = 5) -> List[int]:
         ranks: Dict[int, float] = defaultdict(float)
         for idx_list in lists:
             for rank, doc_id in enumerate(idx_list, start=1):
                 ranks[doc_id] += 1.0 / (k + rank)
-        fused = sorted(ranks.items(), key=lambda x: x[1], reverse=True)
-        return [i for i, _ in fused[:top_k]]
+        return [i for i, _ in heapq.nlargest(top_k, ranks.items(), key=lambda x: x[1])]
 
     def retrieve(self, query: str, top_k: int = 6) -> List[str]:
+        return [self.corpus[i] for i in self.retrieve_indices(query, top_k=top_k)]
+
+    def retrieve_indices(self, query: str, top_k: int = 6, dense_ranking: Optional[Sequence[int]] = None) -> List[int]:
+        """Like retrieve(), but returns positions in the indexed corpus.
+
+        dense_ranking, when given, lists corpus positions by embedding
+        similarity (best first) and replaces the lexical dense_search heuristic.
+        """
         if not self.corpus:
             return []
         
@@ -127,7 +142,7 @@ class HybridRetriever:
         if exact_matches:
             # Still do hybrid search but boost exact matches
             kw = self.keyword_search(query, top_k=max(top_k * 2, 15))
-            dn = self.dense_search(query, top_k=max(top_k, 10))
+            dn = self.dense_search(query, top_k=max(top_k, 10), ranking=dense_ranking)
             
             # Ensure exact matches appear in both lists for higher RRF score
             kw_set = set(kw)
@@ -142,10 +157,10 @@ class HybridRetriever:
         else:
             # Standard hybrid retrieval
             kw = self.keyword_search(query, top_k=max(top_k, 10))
-            dn = self.dense_search(query, top_k=top_k)
+            dn = self.dense_search(query, top_k=top_k, ranking=dense_ranking)
             fused_ids = self.rrf_fuse([kw, dn], top_k=top_k)
         
-        return [self.corpus[i] for i in fused_ids]
+        return fused_ids
 
 
 class RAGService:
@@ -277,21 +292,26 @@ class RAGService:
             pass
         return contexts[:top_k]
 
-    def _embed_query(self, text: str) -> Optional[list[float]]:
-        """Embed query with OpenAI if available for Qdrant search."""
-        if not self.openai_client:
+    def embed_queries(self, texts: List[str]) -> Optional[list[list[float]]]:
+        """Embed several queries in one OpenAI request; None if unavailable."""
+        if not self.openai_client or not texts:
             return None
         try:
             resp = self.openai_client.embeddings.create(
                 model=os.getenv("RAG_EMBED_MODEL", "text-embedding-3-small"),
-                input=[text],
+                input=texts,
             )
-            return resp.data[0].embedding
+            return [d.embedding for d in sorted(resp.data, key=lambda d: d.index)]
         except Exception:
             return None
 
-    def _qdrant_contexts(self, query: str, tenant_id: str, top_k: int = 6) -> list[str]:
-        emb = self._embed_query(query)
+    def embed_query(self, text: str) -> Optional[list[float]]:
+        """Embed query with OpenAI if available for Qdrant search."""
+        vectors = self.embed_queries([text])
+        return vectors[0] if vectors else None
+
+    def _qdrant_contexts(self, query: str, tenant_id: str, top_k: int = 6, emb: Optional[list[float]] = None) -> list[str]:
+        emb = emb or self.embed_query(query)
         if not emb:
             return []
         try:
@@ -306,17 +326,27 @@ class RAGService:
         except Exception:
             return []
 
-    def answer(self, query: str, preselected_contexts: Optional[List[str]] = None, tenant_id: str = "global", db: Optional[Session] = None) -> Dict[str, Any]:
+    def answer(
+        self,
+        query: str,
+        preselected_contexts: Optional[List[str]] = None,
+        tenant_id: str = "global",
+        db: Optional[Session] = None,
+        retriever: Optional[HybridRetriever] = None,
+        query_embedding: Optional[List[float]] = None,
+    ) -> Dict[str, Any]:
         # Cache by query text across tenants in a simple way; tenant aware cache keys should be added at call site if needed
         cache_key = f"rag:answer:{tenant_id}:{hash(query)}"
         cached = redis_cache.get_tenant_key(tenant_id, cache_key)
         if isinstance(cached, dict) and cached.get("response"):
             return cached
 
-        contexts = preselected_contexts if preselected_contexts is not None else self.retriever.retrieve(query, top_k=12)
+        # Callers may pass a tenant-scoped retriever; the shared one serves load_documents()
+        retriever = retriever or self.retriever
+        contexts = preselected_contexts if preselected_contexts is not None else retriever.retrieve(query, top_k=12)
         # Augment with vector search (Qdrant) when embeddings are available
         try:
-            vector_hits = self._qdrant_contexts(query, tenant_id=tenant_id, top_k=8)
+            vector_hits = self._qdrant_contexts(query, tenant_id=tenant_id, top_k=8, emb=query_embedding)
         except Exception:
             vector_hits = []
         if vector_hits:
@@ -334,7 +364,7 @@ class RAGService:
         # If policy-like question, extract precise sentences as a shortcut answer
         ql = query.lower()
         def split_sentences(text: str) -> List[str]:
-            parts = re.split(r"(?<=[\.!?])\s+|\n+|;\s+", text)
+            parts = _SENTENCE_SPLIT_RE.split(text)
             return [p.strip() for p in parts if p and len(p.strip()) > 2]
 
         def score_sentence(sent: str, terms: List[str]) -> float:
@@ -447,7 +477,7 @@ class RAGService:
         if ("chapter" in ql_simple) and ("title" in ql_simple or "titles" in ql_simple or "list" in ql_simple):
             # Extract desired count if specified
             desired_n = None
-            mnum = re.search(r"\b(\d{1,3})\b", ql_simple)
+            mnum = _SMALL_NUMBER_RE.search(ql_simple)
             if mnum:
                 try:
                     desired_n = max(1, int(mnum.group(1)))
@@ -494,7 +524,7 @@ class RAGService:
                 pass
 
         # Chapter summary request (e.g., "summary of chapter 1")
-        m_sum = re.search(r"summary\s+of\s+chapter\s+(\d+)", ql_simple)
+        m_sum = _CHAPTER_SUMMARY_RE.search(ql_simple)
         if m_sum:
             try:
                 ch = int(m_sum.group(1))
@@ -588,7 +618,7 @@ class RAGService:
             if expansions:
                 expanded_contexts: List[str] = []
                 for q2 in expansions[:4]:
-                    expanded_contexts.extend(self.retriever.retrieve(q2, top_k=8))
+                    expanded_contexts.extend(retriever.retrieve(q2, top_k=8))
                     try:
                         expanded_contexts.extend(self._qdrant_contexts(q2, tenant_id=tenant_id, top_k=6))
                     except Exception:
@@ -0,0 +1,144 @@
+"""
+Semantic cache for generated RAG answers.
+
+Rephrasings of the same question embed to nearly the same vector, but the
+answer cache in RAGService is keyed by exact query text. Here each tenant (and
+requested field) keeps the unit-length embeddings of its recent questions in
+one bounded matrix; a lookup is a single matrix-vector product and the
+nearest stored question is served if it clears a cosine threshold. An exact
+top-1 search over at most MAX_ENTRIES_PER_TENANT rows is cheaper than one
+embeddings request and, unlike hashed buckets, never misses a close neighbour.
+
+Each tenant's entries carry the corpus fingerprint they were answered from.
+A lookup with another fingerprint is a miss, so workers that did not run an
+ingest (and never saw its invalidate_tenant) stop serving answers from the
+old corpus once their fingerprint refreshes.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import threading
+import time
+import numpy as np
+from cachetools import LRUCache
+
+SIMILARITY_THRESHOLD = 0.95
+CACHE_TTL_SECONDS = 300
+# Live questions kept per tenant; the oldest is overwritten beyond this
+MAX_ENTRIES_PER_TENANT = 1000
+MAX_TENANTS = 1024
+
+
+class _Entries:
+    """Unit query embeddings, their fields, answers and expiry times for one tenant."""
+
+    def __init__(self, dim: int, capacity: int, fingerprint: Any):
+        self.fingerprint = fingerprint
+        self.capacity = capacity
+        self.size = 0
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.expires = np.zeros(0, dtype=np.float64)
+        self.fields = np.empty(0, dtype=object)
+        self.results: List[Optional[Dict[str, Any]]] = []
+
+    def search(
+        self, field: Optional[str], unit: np.ndarray, now: float, threshold: float
+    ) -> Optional[Dict[str, Any]]:
+        if not self.size:
+            return None
+        sims = self.vectors[: self.size] @ unit
+        sims[
+            (self.expires[: self.size] <= now) | (self.fields[: self.size] != field)
+        ] = -np.inf
+        best = int(np.argmax(sims))
+        return self.results[best] if sims[best] >= threshold else None
+
+    def add(
+        self,
+        field: Optional[str],
+        unit: np.ndarray,
+        result: Dict[str, Any],
+        now: float,
+        expires: float,
+    ) -> None:
+        # Reuse an expired slot (or, when full, the oldest one) before growing
+        slot = int(np.argmin(self.expires[: self.size])) if self.size else -1
+        if slot < 0 or (self.expires[slot] > now and self.size < self.capacity):
+            if self.size == self.vectors.shape[0]:
+                self._grow()
+            slot = self.size
+            self.size += 1
+        self.vectors[slot] = unit
+        self.expires[slot] = expires
+        self.fields[slot] = field
+        self.results[slot] = result
+
+    def _grow(self) -> None:
+        new_cap = min(self.capacity, max(16, 2 * self.vectors.shape[0]))
+        extra = new_cap - self.vectors.shape[0]
+        self.vectors = np.vstack(
+            [self.vectors, np.zeros((extra, self.vectors.shape[1]), dtype=np.float32)]
+        )
+        self.expires = np.concatenate([self.expires, np.zeros(extra, dtype=np.float64)])
+        self.fields = np.concatenate([self.fields, np.empty(extra, dtype=object)])
+        self.results.extend([None] * extra)
+
+
+class SemanticCache:
+    def __init__(
+        self,
+        threshold: float = SIMILARITY_THRESHOLD,
+        ttl: int = CACHE_TTL_SECONDS,
+        capacity: int = MAX_ENTRIES_PER_TENANT,
+        max_tenants: int = MAX_TENANTS,
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.capacity = capacity
+        self._entries: LRUCache = LRUCache(maxsize=max_tenants)
+        self._lock = threading.Lock()
+
+    def _unit(self, embedding: List[float]) -> np.ndarray:
+        v = np.array(embedding, dtype=np.float32)
+        v /= max(float(np.linalg.norm(v)), 1e-9)
+        return v
+
+    def _key(self, tenant_id, unit: np.ndarray) -> Tuple[str, int]:
+        return (str(tenant_id), unit.shape[0])
+
+    def get(
+        self, tenant_id, fingerprint, field: Optional[str], embedding: List[float]
+    ) -> Optional[Dict[str, Any]]:
+        unit = self._unit(embedding)
+        key = self._key(tenant_id, unit)
+        with self._lock:
+            entries = self._entries.get(key)
+            if entries is None or entries.fingerprint != fingerprint:
+                return None
+            return entries.search(field, unit, time.monotonic(), self.threshold)
+
+    def put(
+        self,
+        tenant_id,
+        fingerprint,
+        field: Optional[str],
+        embedding: List[float],
+        result: Dict[str, Any],
+    ) -> None:
+        unit = self._unit(embedding)
+        key = self._key(tenant_id, unit)
+        now = time.monotonic()
+        with self._lock:
+            entries = self._entries.get(key)
+            if entries is None or entries.fingerprint != fingerprint:
+                # Answers from an older corpus are dropped, not kept beside the new ones
+                entries = _Entries(unit.shape[0], self.capacity, fingerprint)
+                self._entries[key] = entries
+            entries.add(field, unit, result, now, now + self.ttl)
+
+    def invalidate_tenant(self, tenant_id) -> None:
+        tenant_key = str(tenant_id)
+        with self._lock:
+            for key in [k for k in list(self._entries.keys()) if k[0] == tenant_key]:
+                self._entries.pop(key, None)
+
+
+semantic_cache = SemanticCache()
@@ -0,0 +1,582 @@
+"""
+Per-tenant corpus cache for the query path.
+
+Loading a tenant's chunks and indexing them for hybrid retrieval is O(N) work
+that used to run on every query. Entries are kept in a process-level LRU and
+validated against a cheap fingerprint (chunk count + latest created_at) so a
+warm tenant skips both the corpus fetch and the re-index. Ingestion calls
+invalidate_tenant_corpus() so the local process rebuilds immediately; other
+processes pick up changes through the fingerprint. The fingerprint itself is
+memoized for RAG_CORPUS_FINGERPRINT_TTL seconds, so back-to-back queries for a
+warm tenant don't touch the database at all.
+
+The corpus query projects only the columns the extraction pass reads; the
+large embedding column is fetched by chunk id on first use and kept as one
+L2-normalized float32 matrix so dense scoring is a single matrix-vector
+product. Ingest stores unit-length vectors (unit_embedding), so only older rows
+are rescaled when the matrix is built. With RAG_DENSE_INT8 enabled the corpus
+instead loads the int8 codes stored at ingest (quantize_embedding) and scores
+rows with an int8 dot product. With RAG_DENSE_FLOAT16 enabled and simsimd
+installed, the scan reads a float16 copy (half the memory traffic) through
+simsimd's SIMD dot-product kernels. Otherwise, when faiss is installed, top-k
+search goes through an exact inner-product index (IndexFlatIP) built once per
+corpus; on unit vectors inner product is cosine similarity.
+
+Person lookups on a cold cache can use find_rows_by_name(), a full-text
+prefilter on PostgreSQL, instead of loading the corpus.
+"""
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import csv
+import io
+import os
+import re
+import threading
+from functools import lru_cache
+import numpy as np
+from cachetools import LRUCache, TTLCache
+from sqlalchemy import func, literal_column, select, text
+from sqlalchemy.orm import Session
+from shared.database.models import KnowledgeChunk, Document, KnowledgeBase
+from ai_core.services.rag_service import HybridRetriever
+
+try:
+    import faiss
+except ImportError:  # optional; top-k falls back to numpy argpartition
+    faiss = None
+
+try:
+    import simsimd
+except ImportError:  # optional; RAG_DENSE_FLOAT16 is ignored without it
+    simsimd = None
+
+CORPUS_ROW_LIMIT = 2000
+CORPUS_CACHE_SIZE = 64
+CORPUS_FETCH_BATCH = 500
+EMBEDDING_FETCH_BATCH = 500
+DENSE_INT8 = os.getenv("RAG_DENSE_INT8", "false").lower() == "true"
+DENSE_FLOAT16 = (
+    os.getenv("RAG_DENSE_FLOAT16", "false").lower() == "true" and simsimd is not None
+)
+NAME_LOOKUP_LIMIT = 2000
+NAME_LOOKUP_BATCH = 200
+# How stale another process's view of a tenant's chunks may be; 0 checks on every query
+FINGERPRINT_TTL_SECONDS = float(os.getenv("RAG_CORPUS_FINGERPRINT_TTL", "5"))
+
+_cache: LRUCache = LRUCache(maxsize=CORPUS_CACHE_SIZE)
+_cache_lock = threading.Lock()
+_fingerprints: Optional[TTLCache] = (
+    TTLCache(maxsize=1024, ttl=FINGERPRINT_TTL_SECONDS)
+    if FINGERPRINT_TTL_SECONDS > 0
+    else None
+)
+# Bumped on invalidation so a fingerprint read before an ingest commit isn't kept
+_generations: Dict[str, int] = {}
+_content_tsv_available: Optional[bool] = None
+
+
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+
+
+def norm_col(s: str) -> str:
+    return _NON_ALNUM_RE.sub("_", s.strip().lower().replace("\ufeff", "")).strip("_")
+
+
+def norm_name(s: str) -> str:
+    return " ".join(s.lower().replace("\ufeff", "").split())
+
+
+def row_name_keys(row_text: str) -> set:
+    """norm_name() of every cell of a CSV row.
+
+    Lowercasing and BOM removal never touch quotes, commas or newlines, so they run
+    once on the whole row before parsing; each cell then only needs its whitespace
+    collapsed.
+    """
+    return {
+        " ".join(cell.split())
+        for cell in parse_csv_row(row_text.lower().replace("\ufeff", ""))
+    }
+
+
+def parse_csv_row(row_text: str) -> List[str]:
+    # Unquoted single-line rows split identically to csv.reader, without a reader
+    if '"' not in row_text and "\n" not in row_text and "\r" not in row_text:
+        return row_text.split(",")
+    return next(csv.reader(io.StringIO(row_text)), [])
+
+
+class TenantCorpus:
+    """The most recent chunks of one tenant, indexed for retrieval."""
+
+    def __init__(
+        self,
+        fingerprint: Tuple[int, Any],
+        chunk_ids: List[Any],
+        contents: List[str],
+        columns: List[Optional[Tuple[str, ...]]],
+    ):
+        self.fingerprint = fingerprint
+        self.chunk_ids = chunk_ids
+        self.contents = contents
+        # Normalized column names per row (tabular uploads only), else None
+        self.columns = columns
+        self.retriever = HybridRetriever()
+        self.retriever.index(contents)
+        self._embeddings: Optional[List[Any]] = None
+        self._embeddings_lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None
+        self._quantized: Optional[Tuple[np.ndarray, ...]] = None
+        self._faiss_index = None
+        self._half: Optional[np.ndarray] = None
+        self._row_values: Dict[int, List[str]] = {}
+        self._name_index: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._field_columns: Dict[str, List[str]] = {}
+        self._column_set: Optional[frozenset] = None
+
+    def row_values(self, i: int) -> List[str]:
+        """CSV cells of row i, parsed once per corpus."""
+        values = self._row_values.get(i)
+        if values is None:
+            values = parse_csv_row(self.contents[i])
+            self._row_values[i] = values
+        return values
+
+    def field_column(self, key: str) -> List[str]:
+        """Cell of normalized column key for every row ('' where absent).
+
+        Built once per corpus.
+        """
+        column = self._field_columns.get(key)
+        if column is None:
+            column = []
+            for i, cols in enumerate(self.columns):
+                j = column_index(cols).get(key) if cols else None
+                values = self.row_values(i) if j is not None else None
+                column.append(
+                    values[j] if values is not None and j < len(values) else ""
+                )
+            self._field_columns[key] = column
+        return column
+
+    def cell(self, i: int, key: str) -> str:
+        return self.field_column(key)[i]
+
+    def present_columns(self, keys) -> List[str]:
+        """The normalized keys, in order, that are a column of some row.
+
+        The header union is built once per corpus.
+        """
+        if self._column_set is None:
+            # Rows of one upload share a header tuple, so this walks a handful of
+            # distinct headers rather than every row
+            self._column_set = frozenset(
+                c for cols in set(self.columns) if cols for c in cols
+            )
+        return [k for k in keys if k in self._column_set]
+
+    def rows_matching_names(self, names) -> List[int]:
+        """Rows with a cell equal to one of the normalized names, in corpus order."""
+        if self._name_index is None:
+            # Every cell is indexed: a name may sit in any column, not only the name
+            # columns. Keys are kept as sorted 64-bit hashes with their row ids, about a
+            # fifth of the memory of a str-keyed dict for a cached corpus.
+            hashes: List[int] = []
+            row_ids: List[int] = []
+            for i, cols in enumerate(self.columns):
+                if not cols:
+                    continue
+                for key in row_name_keys(self.contents[i]):
+                    hashes.append(hash(key))
+                    row_ids.append(i)
+            keys = np.array(hashes, dtype=np.int64)
+            order = np.argsort(keys, kind="stable")
+            self._name_index = (keys[order], np.array(row_ids, dtype=np.int32)[order])
+        keys, row_ids = self._name_index
+        rows = set()
+        for name in names:
+            h = hash(name)
+            lo = int(np.searchsorted(keys, h, side="left"))
+            hi = int(np.searchsorted(keys, h, side="right"))
+            for i in row_ids[lo:hi].tolist():
+                # Confirm the cell, since distinct names can share a hash
+                if i not in rows and name in row_name_keys(self.contents[i]):
+                    rows.add(i)
+        return sorted(rows)
+
+    def embeddings(self, db: Session) -> List[Any]:
+        """Row-aligned embeddings, loaded lazily; only the RAG fallback uses them."""
+        if self._embeddings is None:
+            with self._embeddings_lock:
+                if self._embeddings is None:
+                    by_id = {}
+                    for start in range(0, len(self.chunk_ids), EMBEDDING_FETCH_BATCH):
+                        batch = self.chunk_ids[start : start + EMBEDDING_FETCH_BATCH]
+                        rows = (
+                            db.query(KnowledgeChunk.id, KnowledgeChunk.embedding)
+                            .filter(KnowledgeChunk.id.in_(batch))
+                            .all()
+                        )
+                        by_id.update({chunk_id: emb for (chunk_id, emb) in rows})
+                    self._embeddings = [
+                        by_id.get(chunk_id) for chunk_id in self.chunk_ids
+                    ]
+        return self._embeddings
+
+    def embedding_matrix(self, db: Session) -> Optional[np.ndarray]:
+        """(N, D) float32 unit-length row embeddings; rows without one are zero."""
+        if self._matrix is None:
+            embeddings = self.embeddings(db)
+            dims = [
+                len(e) for e in embeddings if isinstance(e, (list, tuple, np.ndarray))
+            ]
+            if not dims:
+                return None
+            # Use the dominant dimension; mixed dims come from the dev hash fallback
+            dim = max(set(dims), key=dims.count)
+            matrix = np.zeros((len(embeddings), dim), dtype=np.float32)
+            for i, e in enumerate(embeddings):
+                if isinstance(e, (list, tuple, np.ndarray)) and len(e) == dim:
+                    matrix[i] = e
+            # Ingest stores unit-length vectors; only older and zero rows need rescaling
+            norms = np.sqrt(np.einsum("ij,ij->i", matrix, matrix))
+            off = np.abs(norms - 1.0) > 1e-3
+            if off.any():
+                matrix[off] /= norms[off, None].clip(min=1e-9)
+            self._matrix = np.ascontiguousarray(matrix)
+        return self._matrix
+
+    def int8_matrix(self, db: Session) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(N, D) int8 codes and per-row scales of the unit-length embeddings.
+
+        Rows without an embedding are zero. Codes stored at ingest (embedding_i8) are
+        read instead of the float column, so the fetch and the cached matrix are a
+        quarter of the size. Older rows are quantized on load.
+        """
+        if self._quantized is None:
+            with self._embeddings_lock:
+                if self._quantized is None:
+                    # () marks a corpus without embeddings so it isn't fetched again
+                    self._quantized = self._load_int8(db)
+        return self._quantized or None
+
+    def _load_int8(self, db: Session) -> Tuple[np.ndarray, ...]:
+        codes: Dict[Any, Tuple[Optional[bytes], Optional[float]]] = {}
+        for start in range(0, len(self.chunk_ids), EMBEDDING_FETCH_BATCH):
+            batch = self.chunk_ids[start : start + EMBEDDING_FETCH_BATCH]
+            rows = (
+                db.query(
+                    KnowledgeChunk.id,
+                    KnowledgeChunk.embedding_i8,
+                    KnowledgeChunk.embedding_scale,
+                )
+                .filter(KnowledgeChunk.id.in_(batch))
+                .all()
+            )
+            codes.update(
+                {
+                    chunk_id: (code, scale)
+                    for (chunk_id, code, scale) in rows
+                    if code is not None
+                }
+            )
+        missing = [chunk_id for chunk_id in self.chunk_ids if chunk_id not in codes]
+        for start in range(0, len(missing), EMBEDDING_FETCH_BATCH):
+            batch = missing[start : start + EMBEDDING_FETCH_BATCH]
+            rows = (
+                db.query(KnowledgeChunk.id, KnowledgeChunk.embedding)
+                .filter(KnowledgeChunk.id.in_(batch))
+                .all()
+            )
+            codes.update(
+                {chunk_id: quantize_embedding(emb) for (chunk_id, emb) in rows}
+            )
+        dims = [len(code) for (code, _scale) in codes.values() if code]
+        if not dims:
+            return ()
+        # Use the dominant dimension; mixed dims come from the dev hash fallback
+        dim = max(set(dims), key=dims.count)
+        rows_i8 = np.zeros((len(self.chunk_ids), dim), dtype=np.int8)
+        scales = np.ones(len(self.chunk_ids), dtype=np.float32)
+        for i, chunk_id in enumerate(self.chunk_ids):
+            code, scale = codes.get(chunk_id, (None, None))
+            if code and len(code) == dim and scale:
+                rows_i8[i] = np.frombuffer(code, dtype=np.int8)
+                scales[i] = scale
+        return rows_i8, scales
+
+    def dense_scores(
+        self, db: Session, query_embedding: List[float]
+    ) -> Optional[np.ndarray]:
+        """Cosine similarity of the query to every row; None if dimensions differ."""
+        if DENSE_INT8:
+            return self._int8_scores(db, query_embedding)
+        matrix = self.embedding_matrix(db)
+        if matrix is None or len(query_embedding) != matrix.shape[1]:
+            return None
+        q = np.array(query_embedding, dtype=np.float32)
+        q /= max(float(np.linalg.norm(q)), 1e-9)
+        if DENSE_FLOAT16:
+            return self._float16_scores(matrix, q)
+        return matrix @ q
+
+    def dense_top_k(
+        self, db: Session, query_embedding: List[float], k: int
+    ) -> Optional[List[int]]:
+        """Positions of the top-k rows, best first; None if dimensions differ."""
+        if faiss is not None and not (DENSE_INT8 or DENSE_FLOAT16):
+            matrix = self.embedding_matrix(db)
+            if matrix is None or len(query_embedding) != matrix.shape[1]:
+                return None
+            k = min(k, matrix.shape[0])
+            if k <= 0:
+                return []
+            q = np.array([query_embedding], dtype=np.float32)
+            q /= max(float(np.linalg.norm(q)), 1e-9)
+            _scores, ids = self._get_faiss_index(matrix).search(q, k)
+            return [int(i) for i in ids[0] if i >= 0]
+        scores = self.dense_scores(db, query_embedding)
+        if scores is None:
+            return None
+        k = min(k, scores.shape[0])
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top], kind="stable")].tolist()
+
+    def _get_faiss_index(self, matrix: np.ndarray):
+        if self._faiss_index is None:
+            with self._embeddings_lock:
+                if self._faiss_index is None:
+                    index = faiss.IndexFlatIP(matrix.shape[1])
+                    index.add(matrix)
+                    self._faiss_index = index
+        return self._faiss_index
+
+    def _float16_scores(self, matrix: np.ndarray, q: np.ndarray) -> np.ndarray:
+        if self._half is None:
+            self._half = np.ascontiguousarray(matrix, dtype=np.float16)
+        sims = simsimd.cdist(q.astype(np.float16)[None, :], self._half, metric="dot")
+        return np.asarray(sims, dtype=np.float32)[0]
+
+    def _int8_scores(
+        self, db: Session, query_embedding: List[float]
+    ) -> Optional[np.ndarray]:
+        quantized = self.int8_matrix(db)
+        if quantized is None or len(query_embedding) != quantized[0].shape[1]:
+            return None
+        rows_i8, scales = quantized
+        q_code, q_scale = quantize_embedding(query_embedding)
+        if q_code is None:
+            return np.zeros(rows_i8.shape[0], dtype=np.float32)
+        q_i8 = np.frombuffer(q_code, dtype=np.int8)
+        if simsimd is not None:
+            raw = np.asarray(
+                simsimd.cdist(q_i8[None, :], rows_i8, metric="dot"), dtype=np.float32
+            )[0]
+        else:
+            # Accumulate in int32: 127 * 127 * D overflows int16 at embedding sizes
+            raw = (rows_i8 @ q_i8.astype(np.int32)).astype(np.float32)
+        return raw * (scales * q_scale)
+
+
+def unit_embedding(embedding):
+    """The embedding scaled to unit length, as stored at ingest.
+
+    Unusable input is returned unchanged.
+    """
+    if not isinstance(embedding, (list, tuple, np.ndarray)) or len(embedding) == 0:
+        return embedding
+    v = np.asarray(embedding, dtype=np.float64)
+    norm = float(np.linalg.norm(v))
+    if norm == 0.0:
+        return embedding
+    return (v / norm).tolist()
+
+
+def quantize_embedding(embedding) -> Tuple[Optional[bytes], Optional[float]]:
+    """int8 codes and scale of the unit-length embedding (unit ≈ codes * scale).
+
+    (None, None) if the embedding is unusable.
+    """
+    if not isinstance(embedding, (list, tuple, np.ndarray)) or len(embedding) == 0:
+        return None, None
+    # A copy: v is normalised in place and the caller's array must stay untouched
+    v = np.array(embedding, dtype=np.float32)
+    norm = float(np.linalg.norm(v))
+    if norm == 0.0:
+        return None, None
+    v /= norm
+    # Symmetric per-vector scale so the largest component maps to +/-127
+    scale = float(np.abs(v).max()) / 127.0
+    return np.round(v / scale).astype(np.int8).tobytes(), scale
+
+
+def _tenant_chunks(db: Session, *entities):
+    return (
+        db.query(*entities)
+        .join(Document, KnowledgeChunk.document_id == Document.id)
+        .join(KnowledgeBase, Document.knowledge_base_id == KnowledgeBase.id)
+    )
+
+
+def _query_fingerprint(db: Session, tenant_uuid) -> Tuple[int, Any]:
+    count, latest = (
+        _tenant_chunks(
+            db, func.count(KnowledgeChunk.id), func.max(KnowledgeChunk.created_at)
+        )
+        .filter(KnowledgeBase.tenant_id == tenant_uuid)
+        .one()
+    )
+    return int(count or 0), latest
+
+
+def corpus_fingerprint(db: Session, tenant_uuid) -> Tuple[int, Any]:
+    """(chunk count, latest created_at), memoized for FINGERPRINT_TTL_SECONDS."""
+    if _fingerprints is None:
+        return _query_fingerprint(db, tenant_uuid)
+    key = str(tenant_uuid)
+    with _cache_lock:
+        cached = _fingerprints.get(key)
+        generation = _generations.get(key, 0)
+    if cached is not None:
+        return cached
+    fingerprint = _query_fingerprint(db, tenant_uuid)
+    with _cache_lock:
+        if _generations.get(key, 0) == generation:
+            _fingerprints[key] = fingerprint
+    return fingerprint
+
+
+@lru_cache(maxsize=256)
+def _normalize_columns(raw: Tuple[str, ...]) -> Tuple[str, ...]:
+    return tuple(norm_col(c) for c in raw)
+
+
+@lru_cache(maxsize=256)
+def column_index(cols: Tuple[str, ...]) -> Dict[str, int]:
+    """Position of each normalized column; shared by every row with the same header.
+
+    Do not mutate.
+    """
+    return {c: j for j, c in enumerate(cols)}
+
+
+# Only the header list is read from document metadata, not the whole JSON document
+_META_COLUMNS = Document.meta["columns"].label("meta_columns")
+
+
+def _meta_columns(raw) -> Optional[Tuple[str, ...]]:
+    # Rows of one upload share a header, so normalization runs once per distinct header
+    if isinstance(raw, list):
+        return _normalize_columns(tuple(str(c) for c in raw))
+    return None
+
+
+def _load_corpus(
+    db: Session, tenant_uuid, fingerprint: Tuple[int, Any]
+) -> TenantCorpus:
+    query = (
+        _tenant_chunks(db, KnowledgeChunk.id, KnowledgeChunk.content, _META_COLUMNS)
+        .filter(KnowledgeBase.tenant_id == tenant_uuid)
+        .order_by(KnowledgeChunk.created_at.desc())
+        .limit(CORPUS_ROW_LIMIT)
+        .yield_per(CORPUS_FETCH_BATCH)
+    )
+    chunk_ids: List[Any] = []
+    contents: List[str] = []
+    columns: List[Optional[Tuple[str, ...]]] = []
+    for chunk_id, content, raw_columns in query:
+        chunk_ids.append(chunk_id)
+        contents.append(content)
+        columns.append(_meta_columns(raw_columns))
+    return TenantCorpus(fingerprint, chunk_ids, contents, columns)
+
+
+def peek_tenant_corpus(
+    tenant_uuid, fingerprint: Tuple[int, Any]
+) -> Optional[TenantCorpus]:
+    """The cached corpus if it is still current, without loading anything."""
+    with _cache_lock:
+        cached = _cache.get(str(tenant_uuid))
+    if cached is not None and cached.fingerprint == fingerprint:
+        return cached
+    return None
+
+
+def get_tenant_corpus(
+    db: Session, tenant_uuid, fingerprint: Optional[Tuple[int, Any]] = None
+) -> TenantCorpus:
+    """Return the tenant's indexed corpus, rebuilt only when its chunks changed."""
+    if fingerprint is None:
+        fingerprint = corpus_fingerprint(db, tenant_uuid)
+    cached = peek_tenant_corpus(tenant_uuid, fingerprint)
+    if cached is not None:
+        return cached
+    corpus = _load_corpus(db, tenant_uuid, fingerprint)
+    if corpus.contents:
+        with _cache_lock:
+            _cache[str(tenant_uuid)] = corpus
+    return corpus
+
+
+def invalidate_tenant_corpus(tenant_id) -> None:
+    key = str(tenant_id)
+    with _cache_lock:
+        _cache.pop(key, None)
+        if _fingerprints is not None:
+            _fingerprints.pop(key, None)
+            _generations[key] = _generations.get(key, 0) + 1
+
+
+def has_content_tsv(db: Session) -> bool:
+    """Whether knowledge_chunks has content_tsv (PostgreSQL, migrated); checked once."""
+    global _content_tsv_available
+    if _content_tsv_available is None:
+        available = False
+        if db.get_bind().dialect.name == "postgresql":
+            # to_regclass resolves the unqualified name through search_path, as the FTS
+            # query does; content_tsv in another schema's knowledge_chunks doesn't count
+            available = (
+                db.execute(
+                    text(
+                        "SELECT 1 FROM pg_attribute "
+                        "WHERE attrelid = to_regclass('knowledge_chunks') "
+                        "AND attname = 'content_tsv' AND NOT attisdropped"
+                    )
+                ).first()
+                is not None
+            )
+        _content_tsv_available = available
+    return _content_tsv_available
+
+
+def find_rows_by_name(
+    db: Session, tenant_uuid, person_name: str
+) -> Iterator[Tuple[str, Optional[Tuple[str, ...]]]]:
+    """(content, normalized columns) of tabular rows containing every token of the name.
+
+    This is a full-text prefilter; callers still check for an exact cell match. Rows
+    are streamed in batches so a caller that stops early never materializes the rest;
+    close the generator (e.g. with contextlib.closing) to release the cursor when
+    stopping early.
+    """
+    stmt = (
+        select(KnowledgeChunk.content, _META_COLUMNS)
+        .join(Document, KnowledgeChunk.document_id == Document.id)
+        .join(KnowledgeBase, Document.knowledge_base_id == KnowledgeBase.id)
+        .where(KnowledgeBase.tenant_id == tenant_uuid)
+        .where(
+            literal_column("knowledge_chunks.content_tsv").op("@@")(
+                func.plainto_tsquery("simple", person_name)
+            )
+        )
+        .order_by(KnowledgeChunk.created_at.desc())
+        .limit(NAME_LOOKUP_LIMIT)
+        .execution_options(yield_per=NAME_LOOKUP_BATCH)
+    )
+    result = db.execute(stmt)
+    try:
+        for content, raw_columns in result:
+            yield content, _meta_columns(raw_columns)
+    finally:
+        result.close()
@@ -0,0 +1,244 @@
+"""
+Plain-text and row extraction from uploaded documents (DOCX, PPTX, XLSX, PDF,
+CSV, text), dispatched on the file extension.
+
+Extraction is pure CPU, so the pages of long PDFs are spread over a process
+pool. This module imports only the parsers, which keeps spawned workers free
+of the database and cache setup.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Union
+import asyncio
+import csv
+import io
+import multiprocessing
+import os
+import threading
+from docx import Document as DocxDocument
+from pptx import Presentation
+from pptx.enum.shapes import MSO_SHAPE_TYPE
+from openpyxl import load_workbook
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # optional; PDFs fall back to PyPDF2's pure-Python extractor
+    pdfium = None
+
+# Worker processes for split PDFs (0 or unset = one per CPU)
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "0")) or (os.cpu_count() or 1)
+# Larger files are parsed in-process rather than pickled to a worker
+EXTRACT_POOL_MAX_BYTES = 32 * 1024 * 1024
+# Minimum pages per worker task when a single PDF is split across the pool
+PDF_PAGES_PER_TASK = 50
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def binary_stream(data: Union[bytes, BinaryIO]) -> BinaryIO:
+    """Wrap raw bytes, or rewind an already-open upload, for the extractors."""
+    if isinstance(data, (bytes, bytearray)):
+        return io.BytesIO(data)
+    data.seek(0)
+    return data
+
+
+def _pptx_shape_texts(shapes) -> Iterator[str]:
+    """Non-empty shape texts in slide order, descending into group shapes."""
+    for shape in shapes:
+        if shape.shape_type == MSO_SHAPE_TYPE.GROUP:
+            yield from _pptx_shape_texts(shape.shapes)
+        # Pictures, charts and other frames have no text attribute
+        elif (text := getattr(shape, 'text', '')):
+            yield text
+
+
+def file_suffix(filename: str) -> str:
+    """Lower-cased extension including the dot ('' if none); matches name.endswith checks exactly."""
+    name = filename.lower()
+    dot = name.rfind('.')
+    return name[dot:] if dot >= 0 else ''
+
+
+def _docx_text(buf: BinaryIO) -> str:
+    d = DocxDocument(buf)
+    return '\n'.join(p.text for p in d.paragraphs)
+
+
+def _pptx_text(buf: BinaryIO) -> str:
+    prs = Presentation(buf)
+    return '\n'.join(t for slide in prs.slides for t in _pptx_shape_texts(slide.shapes))
+
+
+def _xlsx_text(buf: BinaryIO) -> str:
+    wb = load_workbook(buf, data_only=True, read_only=True)
+    texts: List[str] = []
+    try:
+        for ws in wb.worksheets:
+            for row in ws.iter_rows(values_only=True):
+                texts.append('\t'.join('' if v is None else str(v) for v in row))
+    finally:
+        wb.close()
+    return '\n'.join(texts)
+
+
+def _pdf_text(buf: BinaryIO) -> str:
+    # PDFium (pypdfium2), or PyPDF2 when it isn't installed
+    pages = _pdf_page_texts(buf)
+    return '\n'.join(f"[[PAGE:{i}]]\n" + text for i, text in enumerate(pages, start=1))
+
+
+def _raw_text(buf: BinaryIO) -> str:
+    raw = buf.read()
+    try:
+        return raw.decode('utf-8')
+    except Exception:
+        return raw.decode('latin-1', errors='ignore')
+
+
+# .txt, .csv and anything else not listed: raw decode
+_TEXT_EXTRACTORS: Dict[str, Callable[[BinaryIO], str]] = {
+    '.docx': _docx_text,
+    '.pptx': _pptx_text,
+    '.xlsx': _xlsx_text,
+    '.pdf': _pdf_text,
+}
+
+
+def extract_text(filename: str, data: Union[bytes, BinaryIO]) -> str:
+    return _TEXT_EXTRACTORS.get(file_suffix(filename), _raw_text)(binary_stream(data))
+
+
+def _csv_rows(buf: BinaryIO) -> List[str]:
+    rows: List[str] = []
+    # Decode incrementally so the file is never held as one str
+    text = io.TextIOWrapper(buf, encoding='utf-8-sig', errors='ignore', newline='')
+    try:
+        reader = csv.reader(text)
+        # Re-serialize each row via csv.writer to preserve quoting and commas inside fields
+        out = io.StringIO()
+        writer = csv.writer(out)
+        for r in reader:
+            out.seek(0)
+            out.truncate()
+            writer.writerow(r)
+            # Drop the writer's "\r\n" terminator (it also makes embedded newlines get quoted)
+            rows.append(out.getvalue()[:-2])
+    finally:
+        # Leave the caller's file open
+        text.detach()
+    return rows
+
+
+def _xlsx_rows(buf: BinaryIO) -> List[str]:
+    rows: List[str] = []
+    # read_only streams sheet XML instead of building every cell object up front
+    wb = load_workbook(buf, data_only=True, read_only=True)
+    try:
+        out = io.StringIO()
+        writer = csv.writer(out)
+        for ws in wb.worksheets:
+            for r in ws.iter_rows(values_only=True):
+                # Use csv.writer to serialize each row consistently
+                out.seek(0)
+                out.truncate()
+                writer.writerow(['' if v is None else v for v in r])
+                rows.append(out.getvalue()[:-2])
+    finally:
+        wb.close()
+    return rows
+
+
+_ROW_EXTRACTORS: Dict[str, Callable[[BinaryIO], List[str]]] = {
+    '.csv': _csv_rows,
+    '.xlsx': _xlsx_rows,
+}
+
+
+def extract_rows(filename: str, data: Union[bytes, BinaryIO]) -> List[str]:
+    """CSV-serialized rows of a tabular file; [] for file types without rows."""
+    extractor = _ROW_EXTRACTORS.get(file_suffix(filename))
+    return extractor(binary_stream(data)) if extractor is not None else []
+
+
+def _open_pdf(source: Union[bytes, BinaryIO]):
+    if pdfium is not None:
+        return pdfium.PdfDocument(source)
+    from PyPDF2 import PdfReader
+    return PdfReader(io.BytesIO(source) if isinstance(source, bytes) else source)
+
+
+def _pdf_page_count(pdf) -> int:
+    return len(pdf) if pdfium is not None else len(pdf.pages)
+
+
+def _pdf_pages_text(pdf, start: int, stop: int) -> List[str]:
+    if pdfium is None:
+        return [pdf.pages[i].extract_text() or '' for i in range(start, stop)]
+    texts: List[str] = []
+    for i in range(start, stop):
+        page = pdf[i]
+        textpage = page.get_textpage()
+        # PDFium ends lines with \r\n
+        texts.append(textpage.get_text_bounded().replace('\r\n', '\n'))
+        textpage.close()
+        page.close()
+    return texts
+
+
+def _close_pdf(pdf) -> None:
+    if pdfium is not None:
+        pdf.close()
+
+
+def _pdf_page_range(data: bytes, start: int, stop: int) -> List[str]:
+    pdf = _open_pdf(data)
+    try:
+        return _pdf_pages_text(pdf, start, stop)
+    finally:
+        _close_pdf(pdf)
+
+
+def _pdf_page_texts(buf: BinaryIO) -> List[str]:
+    """Page texts in order; long PDFs are split into page ranges across the worker pool."""
+    pdf = _open_pdf(buf)
+    try:
+        n = _pdf_page_count(pdf)
+        # Pool workers (parent_process set) and small files stay sequential; neither
+        # backend can share one open document across threads. Waiting on pool futures
+        # would also stall an event loop, so the split only runs on worker threads
+        if (
+            n <= PDF_PAGES_PER_TASK
+            or EXTRACT_WORKERS < 2
+            or multiprocessing.parent_process() is not None
+            or _on_event_loop()
+        ):
+            return _pdf_pages_text(pdf, 0, n)
+        buf.seek(0)
+        data = buf.read()
+        if len(data) > EXTRACT_POOL_MAX_BYTES:
+            return _pdf_pages_text(pdf, 0, n)
+    finally:
+        _close_pdf(pdf)
+    # Every task re-parses the file, so use as few ranges as keep the workers busy
+    per_task = max(PDF_PAGES_PER_TASK, -(-n // EXTRACT_WORKERS))
+    pool = _get_pool()
+    futures = [pool.submit(_pdf_page_range, data, start, min(start + per_task, n)) for start in range(0, n, per_task)]
+    return [text for fut in futures for text in fut.result()]
+
+
+def _on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a multi-threaded server process can copy held locks into the child
+            _pool = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
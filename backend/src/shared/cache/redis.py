@@ -24,6 +24,8 @@ class RedisCache:
         self._client: Optional[Union[Redis, RedisCluster]] = None
         self._disabled: bool = False
         self._warned: bool = False
+        # Registered Lua scripts by source; redis-py runs them with EVALSHA and reloads on NOSCRIPT
+        self._scripts: dict = {}
 
     def get_client(self) -> Union[Redis, RedisCluster]:
         """Get or create Redis client."""
@@ -154,6 +156,27 @@ class RedisCache:
                 self._warned = True
             return False
 
+    def is_cluster(self) -> bool:
+        """True when connected to a Redis Cluster (multi-key scripts must then stay within one slot)."""
+        return isinstance(self.get_client(), RedisCluster)
+
+    def run_script(self, script: str, keys: list, args: list) -> Optional[Any]:
+        """Run a Lua script in one round trip; None when Redis is disabled or the call fails."""
+        if self._disabled or self.get_client() is None:
+            return None
+        try:
+            registered = self._scripts.get(script)
+            if registered is None:
+                registered = self.get_client().register_script(script)
+                self._scripts[script] = registered
+            value = registered(keys=keys, args=args)
+            return value.decode('utf-8') if isinstance(value, bytes) else value
+        except Exception as e:
+            if not self._warned:
+                logger.warning(f"Failed to run cache script: {e}")
+                self._warned = True
+            return None
+
     def ping(self) -> bool:
         """Test Redis connection."""
         if self._disabled or self.get_client() is None:
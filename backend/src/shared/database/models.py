@@ -1,12 +1,13 @@
 """
 SQLAlchemy data models for the Omnichannel Enterprise RAG Chatbot Platform.
 """
-from sqlalchemy import Column, String, Text, DateTime, Boolean, Integer, JSON, ForeignKey, Index
+from sqlalchemy import Column, String, Text, DateTime, Boolean, Integer, Float, LargeBinary, JSON, ForeignKey, Index
 from sqlalchemy.types import TypeDecorator, CHAR
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 import uuid
+import numpy as np
 from sqlalchemy.dialects import postgresql
 
 Base = declarative_base()
@@ -42,6 +43,44 @@ class GUID(TypeDecorator):
             return value
         return uuid.UUID(str(value))
 
+
+# JSON documents are stored as binary JSONB on PostgreSQL, plain JSON elsewhere
+JSONType = JSON().with_variant(postgresql.JSONB(), "postgresql")
+
+EMBEDDING_DIM = 1536  # text-embedding-3-small
+
+
+class EmbeddingVector(TypeDecorator):
+    """Embedding column type.
+
+    Uses a pgvector VECTOR column on PostgreSQL, otherwise stores a JSON array.
+    pgvector cannot store a vector whose dimension differs from the column, so
+    binding one raises instead of silently writing NULL.
+    """
+
+    impl = JSON
+    cache_ok = True
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        super().__init__()
+        self.dim = dim
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            from pgvector.sqlalchemy import Vector
+            return dialect.type_descriptor(Vector(self.dim))
+        return dialect.type_descriptor(JSON())
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return value
+        if dialect.name == "postgresql":
+            if len(value) != self.dim:
+                raise ValueError(f"Embedding has {len(value)} dimensions, column expects {self.dim}")
+            # pgvector binds numpy arrays directly
+            return value
+        return value.tolist() if isinstance(value, np.ndarray) else value
+
 class Tenant(Base):
     """Tenant model representing an organization."""
     __tablename__ = "tenants"
@@ -50,7 +89,7 @@ class Tenant(Base):
     name = Column(String(255), nullable=False)
     domain = Column(String(255), unique=True, nullable=False)
     subscription_tier = Column(String(50), default="BASIC")
-    settings = Column(JSON, default=dict)
+    settings = Column(JSONType, default=dict)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
@@ -71,7 +110,7 @@ class User(Base):
     external_id = Column(String(255))  # Channel-specific user identifier
     user_type = Column(String(50), nullable=False)  # INTERNAL_STAFF or EXTERNAL_CUSTOMER
     role = Column(String(50), default="END_USER")  # ADMIN, MANAGER, AGENT, END_USER
-    preferences = Column(JSON, default=dict)
+    preferences = Column(JSONType, default=dict)
     last_active_at = Column(DateTime, default=func.now())
     created_at = Column(DateTime, default=func.now())
 
@@ -91,12 +130,20 @@ class Conversation(Base):
     user_id = Column(GUID(), ForeignKey("users.id"), nullable=False)
     channel = Column(String(50), nullable=False)  # whatsapp, wechat, line, telegram, web, teams
     status = Column(String(50), default="ACTIVE")  # ACTIVE, COMPLETED, ESCALATED
-    context = Column(JSON, default=dict)  # Conversation state and metadata
-    channel_context = Column(JSON, default=dict)  # Per-channel identifiers and state
+    context = Column(JSONType, default=dict)  # Conversation state and metadata
+    channel_context = Column(JSONType, default=dict)  # Per-channel identifiers and state
     started_at = Column(DateTime, default=func.now())
     last_message_at = Column(DateTime, default=func.now())
     completed_at = Column(DateTime)
 
+    __table_args__ = (
+        # At most one ACTIVE conversation per user and channel; the upsert in ConversationService targets it
+        Index(
+            "uq_conversations_active", "tenant_id", "user_id", "channel", unique=True,
+            postgresql_where=text("status = 'ACTIVE'"), sqlite_where=text("status = 'ACTIVE'"),
+        ),
+    )
+
     # Relationships
     tenant = relationship("Tenant", back_populates="conversations")
     user = relationship("User", back_populates="conversations")
@@ -114,10 +161,15 @@ class Message(Base):
     sender_type = Column(String(50), nullable=False)  # USER, SYSTEM, HUMAN_AGENT
     content = Column(Text, nullable=False)
     message_type = Column(String(50), default="TEXT")  # TEXT, IMAGE, FILE, BUTTON_RESPONSE
-    meta = Column('metadata', JSON, default=dict)  # Channel-specific message data
+    meta = Column('metadata', JSONType, default=dict)  # Channel-specific message data
     timestamp = Column(DateTime, default=func.now())
     is_processed = Column(Boolean, default=False)  # Whether RAG processing completed
 
+    __table_args__ = (
+        # Serves get_recent_messages' per-conversation "latest N" walk
+        Index("ix_messages_conversation_id_timestamp", "conversation_id", timestamp.desc()),
+    )
+
     # Relationships
     conversation = relationship("Conversation", back_populates="messages")
 
@@ -153,7 +205,7 @@ class Document(Base):
     title = Column(String(255), nullable=False)
     content = Column(Text, nullable=False)
     source_url = Column(String(500))
-    meta = Column('metadata', JSON, default=dict)  # Author, publish_date, tags, etc.
+    meta = Column('metadata', JSONType, default=dict)  # Author, publish_date, tags, etc.
     status = Column(String(50), default="PROCESSING")  # PROCESSING, INDEXED, FAILED
     chunk_count = Column(Integer, default=0)
     created_at = Column(DateTime, default=func.now())
@@ -174,12 +226,32 @@ class KnowledgeChunk(Base):
     document_id = Column(GUID(), ForeignKey("documents.id"), nullable=False)
     content = Column(Text, nullable=False)  # Chunk text content (~700 characters)
     chunk_index = Column(Integer, nullable=False)  # Position within document
-    embedding = Column(JSON)  # Vector embedding stored as JSON array
-    meta = Column('metadata', JSON, default=dict)  # Chunk-level metadata
+    embedding = Column(EmbeddingVector())  # pgvector on PostgreSQL, JSON array elsewhere
+    # int8 codes of the unit-length embedding (one byte per dimension); unit ≈ codes * scale
+    embedding_i8 = Column(LargeBinary)
+    embedding_scale = Column(Float)
+    meta = Column('metadata', JSONType, default=dict)  # Chunk-level metadata
     created_at = Column(DateTime, default=func.now())
 
+    __table_args__ = (
+        # Serves the per-tenant "most recent chunks" scan in the query path
+        Index("ix_knowledge_chunks_document_id_created_at", "document_id", created_at.desc()),
+    )
+
     # Relationships
     document = relationship("Document", back_populates="chunks")
 
     def __repr__(self):
         return f"<KnowledgeChunk(id={self.id}, document_id={self.document_id}, chunk_index={self.chunk_index})>"
+
+class EmbeddingCacheEntry(Base):
+    """Embedding of a text under a given model, reused across ingests."""
+    __tablename__ = "embedding_cache"
+
+    model = Column(String(100), primary_key=True)
+    content_sha256 = Column(LargeBinary(32), primary_key=True)  # SHA-256 of the UTF-8 input text
+    embedding = Column(LargeBinary, nullable=False)  # little-endian float32 values
+    created_at = Column(DateTime, default=func.now())
+
+    def __repr__(self):
+        return f"<EmbeddingCacheEntry(model={self.model}, content_sha256={self.content_sha256.hex()})>"
@@ -11,6 +11,7 @@ from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import StaticPool
 from .models import Base
+import orjson
 import os
 import time
 import logging
@@ -20,6 +21,15 @@ logger = logging.getLogger(__name__)
 # Database URL from environment
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
 
+# Schema initialization mode: "sync" runs it during startup (default), "async" runs
+# it in the background after the app starts serving, and "skip" leaves it to an
+# out-of-band `alembic upgrade head` (e.g. a Kubernetes Job or initContainer).
+MIGRATION_MODE = os.getenv("MIGRATION_MODE", "sync").lower()
+
+def _json_serializer(value) -> str:
+    """Serialize JSON/JSONB column values with orjson (SQLAlchemy expects str)."""
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+
 def _create_engine_for_url(url: str):
     """Create a SQLAlchemy engine appropriate for the given URL."""
     if url.startswith("sqlite"):
@@ -28,12 +38,16 @@ def _create_engine_for_url(url: str):
             poolclass=StaticPool,
             connect_args={"check_same_thread": False},
             echo=True,  # Set to False in production
+            json_serializer=_json_serializer,
+            json_deserializer=orjson.loads,
         )
     # Non-SQLite: use default pooling and pre_ping
     return create_engine(
         url,
         echo=True,  # Set to False in production
         pool_pre_ping=True,
+        json_serializer=_json_serializer,
+        json_deserializer=orjson.loads,
     )
 
 def _try_connect(test_engine, attempts: int = 10, delay_seconds: float = 1.0) -> bool:
@@ -72,7 +86,8 @@ def _ensure_sqlite_migrations() -> None:
     if not DATABASE_URL.startswith("sqlite"):
         return
     try:
-        with engine.connect() as conn:
+        # One transaction, committed on exit, so the duplicate cleanup is kept
+        with engine.begin() as conn:
             # Check conversations table exists
             result = conn.execute(text("SELECT name FROM sqlite_master WHERE type='table' AND name='conversations'"))
             if result.fetchone() is None:
@@ -82,6 +97,19 @@ def _ensure_sqlite_migrations() -> None:
             col_names = {row[1] for row in cols}
             if 'channel_context' not in col_names:
                 conn.execute(text("ALTER TABLE conversations ADD COLUMN channel_context JSON"))
+            # Target of the conversation upsert. Duplicates left by the old SELECT-then-INSERT
+            # path would fail the unique index: keep each group's most recently started one
+            conn.execute(text(
+                "UPDATE conversations SET status = 'COMPLETED', "
+                "completed_at = COALESCE(completed_at, CURRENT_TIMESTAMP) "
+                "WHERE id IN (SELECT id FROM (SELECT id, row_number() OVER ("
+                "PARTITION BY tenant_id, user_id, channel ORDER BY started_at DESC, id"
+                ") AS rn FROM conversations WHERE status = 'ACTIVE') WHERE rn > 1)"
+            ))
+            conn.execute(text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS uq_conversations_active "
+                "ON conversations (tenant_id, user_id, channel) WHERE status = 'ACTIVE'"
+            ))
     except Exception:
         # Do not block app start on shim failure
         pass
@@ -91,7 +119,7 @@ _initialized = False
 def get_db() -> Session:
     """Get database session."""
     global _initialized
-    if not _initialized:
+    if not _initialized and MIGRATION_MODE == "sync":
         try:
             _ensure_sqlite_migrations()
             Base.metadata.create_all(bind=engine)
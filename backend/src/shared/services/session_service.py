@@ -6,27 +6,68 @@ from typing import Optional, Dict, Any
 from shared.cache.redis import redis_cache
 
 
+SESSION_TTL_SECONDS = 86400
+
+# Session lookup-or-create plus channel mapping update in one round trip. The mapping key
+# depends on the session id, so it is built inside the script from the prefix in ARGV[2].
+_SESSION_AND_MAP_SCRIPT = """
+local sid = redis.call('GET', KEYS[1])
+if not sid then
+    sid = ARGV[1]
+    redis.call('SETEX', KEYS[1], ARGV[5], sid)
+end
+local map_key = ARGV[2] .. sid
+local data = {}
+local raw = redis.call('GET', map_key)
+if raw then
+    local ok, decoded = pcall(cjson.decode, raw)
+    if ok and type(decoded) == 'table' then
+        data = decoded
+    end
+end
+data[ARGV[3]] = ARGV[4]
+redis.call('SETEX', map_key, ARGV[5], cjson.encode(data))
+return sid
+"""
+
+
 class SessionService:
     def __init__(self):
         self.cache = redis_cache
 
-    def get_or_create_session(self, tenant_id: str, user_id: str) -> str:
+    def get_or_create_session(self, tenant_id: uuid.UUID, user_id: str) -> str:
         key = f"conv:{tenant_id}:{user_id}"
         sess = self.cache.get_tenant_key(tenant_id, key)
         if sess:
             return sess
         session_id = str(uuid.uuid4())
-        self.cache.set_tenant_key(tenant_id, key, session_id, ttl=86400)
+        self.cache.set_tenant_key(tenant_id, key, session_id, ttl=SESSION_TTL_SECONDS)
         return session_id
 
-    def set_channel_mapping(self, tenant_id: str, session_id: str, channel: str, identifier: str) -> bool:
+    def set_channel_mapping(self, tenant_id: uuid.UUID, session_id: str, channel: str, identifier: str) -> bool:
         key = f"convmap:{session_id}"
         data = self.cache.get_tenant_key(tenant_id, key) or {}
         data[channel] = identifier
-        return bool(self.cache.set_tenant_key(tenant_id, key, data, ttl=86400))
+        return bool(self.cache.set_tenant_key(tenant_id, key, data, ttl=SESSION_TTL_SECONDS))
+
+    def get_or_create_and_map(self, tenant_id: uuid.UUID, channel: str, identifier: str) -> str:
+        """get_or_create_session + set_channel_mapping for identifier, as one script call when possible."""
+        # The script touches a key it computes itself, which a cluster may place on another node
+        if not self.cache.is_cluster():
+            sid = self.cache.run_script(
+                _SESSION_AND_MAP_SCRIPT,
+                keys=[f"tenant:{tenant_id}:conv:{tenant_id}:{identifier}"],
+                args=[str(uuid.uuid4()), f"tenant:{tenant_id}:convmap:", channel, identifier, SESSION_TTL_SECONDS],
+            )
+            if sid:
+                return sid
+        session_id = self.get_or_create_session(tenant_id, identifier)
+        self.set_channel_mapping(tenant_id, session_id, channel, identifier)
+        return session_id
 
-    def get_channel_mapping(self, tenant_id: str, session_id: str) -> Optional[Dict[str, Any]]:
+    def get_channel_mapping(self, tenant_id: uuid.UUID, session_id: str) -> Optional[Dict[str, Any]]:
         key = f"convmap:{session_id}"
         return self.cache.get_tenant_key(tenant_id, key)
 
 
+session_service = SessionService()
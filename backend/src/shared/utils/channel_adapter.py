@@ -1,23 +1,46 @@
 """
 Channel adapter: normalize and map identifiers across channels.
 """
-from typing import Dict, Any
+from typing import Any, Callable, Dict
+
+Extractor = Callable[[Dict[str, Any]], str]
+
+
+def _extract_whatsapp(payload: Dict[str, Any]) -> str:
+    entry = payload.get("entry", [{}])[0]
+    changes = entry.get("changes", [{}])[0]
+    value = changes.get("value", {})
+    messages = value.get("messages", [{}])
+    msg = messages[0] if messages else {}
+    return msg.get("from", "")
+
+
+def _extract_teams(payload: Dict[str, Any]) -> str:
+    return payload.get("from", {}).get("id", "")
+
+
+def _extract_telegram(payload: Dict[str, Any]) -> str:
+    return str(payload.get("message", {}).get("from", {}).get("id", ""))
+
+
+def _extract_none(payload: Dict[str, Any]) -> str:
+    return ""
 
 
 class ChannelAdapter:
+    # One dict lookup per call instead of a chain of channel comparisons
+    _EXTRACTORS: Dict[str, Extractor] = {
+        "whatsapp": _extract_whatsapp,
+        "teams": _extract_teams,
+        "telegram": _extract_telegram,
+    }
+
+    def extractor(self, channel: str) -> Extractor:
+        """Identifier extractor for channel; webhooks resolve theirs once at import."""
+        return self._EXTRACTORS.get(channel.lower(), _extract_none)
+
     def extract_identifier(self, channel: str, payload: Dict[str, Any]) -> str:
-        c = channel.lower()
-        if c == "whatsapp":
-            entry = payload.get("entry", [{}])[0]
-            changes = entry.get("changes", [{}])[0]
-            value = changes.get("value", {})
-            messages = value.get("messages", [{}])
-            msg = messages[0] if messages else {}
-            return msg.get("from", "")
-        if c == "teams":
-            return payload.get("from", {}).get("id", "")
-        if c == "telegram":
-            return str(payload.get("message", {}).get("from", {}).get("id", ""))
-        return ""
+        return self.extractor(channel)(payload)
 
 
+channel_adapter = ChannelAdapter()
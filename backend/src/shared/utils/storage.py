@@ -2,7 +2,7 @@
 Utilities for writing document metadata to disk.
 """
 import os
-import json
+import orjson
 from typing import Dict, Any
 
 
@@ -15,8 +15,9 @@ def write_metadata(base_path: str, tenant_id: str, document_id: str, metadata: D
     dir_path = os.path.join(base_path, f"tenant_{tenant_id}", "documents", str(document_id))
     os.makedirs(dir_path, exist_ok=True)
     file_path = os.path.join(dir_path, "metadata.json")
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(metadata, f, ensure_ascii=False, indent=2)
+    # Same layout as json.dump(..., ensure_ascii=False, indent=2), encoded straight to UTF-8 bytes
+    with open(file_path, "wb") as f:
+        f.write(orjson.dumps(metadata, option=orjson.OPT_INDENT_2))
     return file_path
 
 
@@ -82,14 +82,15 @@ class QdrantService:
             # Degrade gracefully; caller may retry later
             logger.warning(f"Failed to create Qdrant collection (will retry later): {e}")
 
-    def upsert_knowledge_chunks(self, tenant_id: str, chunks: List[Dict[str, Any]]) -> None:
-        """Upsert knowledge chunks for a specific tenant."""
+    def upsert_knowledge_chunks(self, tenant_id: str, chunks: List[Dict[str, Any]]) -> bool:
+        """Upsert knowledge chunks for a specific tenant; False if the upsert failed."""
         try:
             points = []
             for chunk in chunks:
+                vector = chunk["embedding"]
                 point = PointStruct(
                     id=chunk["id"],
-                    vector=chunk["embedding"],
+                    vector=vector.tolist() if isinstance(vector, np.ndarray) else vector,
                     payload={
                         "tenant_id": tenant_id,
                         "document_id": chunk["document_id"],
@@ -112,10 +113,12 @@ class QdrantService:
                     points=points
                 )
                 logger.info(f"Upserted {len(points)} knowledge chunks for tenant {tenant_id}")
+            return True
 
         except Exception as e:
             # Degrade gracefully; embeddings remain available in SQL, upsert can be retried later
             logger.warning(f"Failed to upsert knowledge chunks for tenant {tenant_id} (will retry later): {e}")
+            return False
 
     def search_similar_chunks(
         self,
@@ -187,6 +190,29 @@ class QdrantService:
             logger.error(f"Failed to delete chunks for tenant {tenant_id}: {e}")
             return False
 
+    def delete_document_chunks(self, tenant_id: str, document_id: str) -> bool:
+        """Delete the knowledge chunks of one document for a specific tenant."""
+        try:
+            filter_condition = Filter(
+                must=[
+                    FieldCondition(key="tenant_id", match=MatchValue(value=tenant_id)),
+                    FieldCondition(key="document_id", match=MatchValue(value=document_id)),
+                ]
+            )
+
+            self._with_retries(
+                self.client.delete,
+                collection_name=self.collection_name,
+                points_selector=filter_condition
+            )
+
+            logger.info(f"Deleted knowledge chunks of document {document_id} for tenant {tenant_id}")
+            return True
+
+        except Exception as e:
+            logger.error(f"Failed to delete chunks of document {document_id} for tenant {tenant_id}: {e}")
+            return False
+
     def get_collection_info(self) -> Dict[str, Any]:
         """Get information about the knowledge chunks collection."""
         try:
@@ -62,3 +62,100 @@ def test_query_endpoint_invalid_channel():
     response = client.post("/v1/query", json=request_data)
     # Should still process (no validation on channel in current implementation)
     assert response.status_code == 200
+
+def test_whatsapp_signature_verification():
+    """Test WhatsApp signature check against raw and malformed headers."""
+    import hashlib
+    import hmac
+    from ai_core.api.webhooks.whatsapp import verify_signature
+
+    secret = b"app-secret"
+    body = b'{"entry": []}'
+    digest = hmac.new(secret, body, hashlib.sha256).hexdigest()
+
+    assert verify_signature(body, f"sha256={digest}", secret)
+    assert verify_signature(body, digest.upper(), secret)
+    assert not verify_signature(body + b" ", f"sha256={digest}", secret)
+    assert not verify_signature(body, "sha256=not-hex", secret)
+    assert not verify_signature(body, "", secret)
+
+def test_webhooks_reject_non_string_tenant_id():
+    """Malformed tenantId values are client errors, not 500s."""
+    for path in ("/webhooks/teams", "/webhooks/telegram"):
+        for tenant_id in (123, ["a"], {"id": "x"}, "not-a-uuid"):
+            response = client.post(path, json={"tenantId": tenant_id})
+            assert response.status_code == 400, (path, tenant_id)
+        assert client.post(path, json=["not", "an", "object"]).status_code == 400
+        response = client.post(path, content=b"{not json", headers={"Content-Type": "application/json"})
+        assert response.status_code == 400, path
+
+def test_readiness_after_failed_sync_initialization(monkeypatch):
+    """A failed create_tables is logged at startup; in sync mode the service still reports ready."""
+    import ai_core.main as main
+
+    monkeypatch.setattr(main, "MIGRATION_STATUS", "failed")
+    monkeypatch.setattr(main, "MIGRATION_MODE", "sync")
+    response = client.get("/healthz")
+    assert response.status_code == 200
+    assert response.json()["migrations"] == "failed"
+
+    monkeypatch.setattr(main, "MIGRATION_MODE", "async")
+    assert client.get("/healthz").status_code == 503
+
+def test_metrics_gzip_negotiation():
+    """gzip is only sent when Accept-Encoding allows it, honouring q-values."""
+    from ai_core.main import _accepts_gzip
+
+    assert _accepts_gzip("gzip")
+    assert _accepts_gzip("br, gzip;q=0.5")
+    assert _accepts_gzip("*")
+    assert not _accepts_gzip("gzip;q=0")
+    assert not _accepts_gzip("gzip; q=0.0, *;q=1")
+    assert not _accepts_gzip("identity")
+    assert not _accepts_gzip("")
+
+    response = client.get("/metrics", headers={"Accept-Encoding": "gzip;q=0"})
+    assert "content-encoding" not in response.headers
+    response = client.get("/metrics", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+
+def test_parse_bearer_whitespace():
+    """Any whitespace may follow the scheme; whitespace inside the token is rejected."""
+    import pytest
+    from fastapi import HTTPException
+    from ai_core.api.v1.internal import parse_bearer
+
+    assert parse_bearer("Bearer abc") == "abc"
+    assert parse_bearer("bearer\tabc ") == "abc"
+    assert parse_bearer("Bearer   abc") == "abc"
+    for header in ("Bearerabc", "Bearer ", "Bearer a\tb", "Bearer a\nb", "Basic abc"):
+        with pytest.raises(HTTPException):
+            parse_bearer(header)
+
+def test_token_cache_keyed_by_digest(monkeypatch):
+    """The token cache holds SHA-256 digests, never the raw bearer token."""
+    import hashlib
+    import time
+    from ai_core.api.v1 import internal
+
+    token = "raw.jwt.token"
+    payload = {"sub": "u1", "exp": time.time() + 3600}
+    monkeypatch.setattr(internal.jwt_service, "verify_token", lambda t: payload)
+    internal._token_cache.clear()
+    assert internal.verify_token_cached(token) == payload
+    assert token not in internal._token_cache
+    assert hashlib.sha256(token.encode()).digest() in internal._token_cache
+    internal._token_cache.clear()
+
+def test_query_endpoint_malformed_ids():
+    """Malformed tenantId/userId are rejected with 400 before the handler runs."""
+    valid = {"tenantId": "00000000-0000-0000-0000-000000000001", "message": "Hi", "channel": "web"}
+    response = client.post("/v1/query", json={**valid, "tenantId": "not-a-uuid"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid tenantId UUID"
+    response = client.post("/v1/query", json={**valid, "userId": "bad"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid userId UUID"
+    assert client.post("/v1/query", json={**valid, "tenantId": 5}).status_code == 400
+    # Other validation errors keep FastAPI's 422
+    assert client.post("/v1/query", json={"tenantId": valid["tenantId"]}).status_code == 422
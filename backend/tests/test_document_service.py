@@ -0,0 +1,191 @@
+"""
+Tests for document ingestion: extraction, chunking, embedding cache and the ingest transaction.
+"""
+import asyncio
+import csv
+import inspect
+import io
+import sys
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Ensure src is in path
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+sys.path.insert(0, str(SRC))
+
+from shared.database.models import (  # noqa: E402
+    EMBEDDING_DIM, Base, Document, EmbeddingCacheEntry, EmbeddingVector, KnowledgeChunk,
+)
+from ai_core.api.v1.tenant import upload_document_file  # noqa: E402
+from ai_core.services import document_service, text_extraction  # noqa: E402
+from ai_core.services.document_service import DocumentService, chunk_text  # noqa: E402
+from ai_core.services.embedding_cache import content_key, load_cached_embeddings, store_embeddings  # noqa: E402
+from ai_core.services.text_extraction import extract_rows, extract_text, file_suffix  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    """A session on an in-memory SQLite engine, pooled like the app's (one shared connection)."""
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+@pytest.fixture
+def remote_embeddings(monkeypatch, tmp_path):
+    """Route embed() through the OpenAI path with a fake API; returns the batch sizes sent."""
+    calls = []
+
+    def fake_remote(self, texts):
+        calls.append(len(texts))
+        vectors = np.ones((len(texts), 1536), dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("DOCUMENT_STORAGE_PATH", str(tmp_path))
+    monkeypatch.setattr(DocumentService, "_embed_remote", fake_remote)
+    monkeypatch.setattr(document_service.qdrant_service, "create_collection", lambda: None)
+    monkeypatch.setattr(document_service.qdrant_service, "upsert_knowledge_chunks", lambda tenant_id, chunks: True)
+    return calls
+
+
+def test_embedding_cache_roundtrip(db):
+    """Stored vectors come back as float32 arrays; a repeated key is ignored, not an error."""
+    key = content_key("hello")
+    vec = np.arange(4, dtype=np.float32)
+    store_embeddings(db, "model-a", {key: vec})
+    store_embeddings(db, "model-a", {key: vec + 1})
+
+    found = load_cached_embeddings(db, "model-a", [key, key, content_key("other")])
+    assert list(found) == [key]
+    assert found[key].dtype == np.float32
+    assert np.array_equal(found[key], vec)
+    assert load_cached_embeddings(db, "model-b", [key]) == {}
+
+
+def test_embedding_vector_rejects_wrong_dimension_on_postgres():
+    """A mismatched vector used to be stored as NULL on pgvector; it now fails loudly."""
+    column = EmbeddingVector()
+    dialect = postgresql.dialect()
+    assert len(column.process_bind_param(np.zeros(EMBEDDING_DIM, dtype=np.float32), dialect)) == EMBEDDING_DIM
+    with pytest.raises(ValueError):
+        column.process_bind_param([0.0] * 256, dialect)
+    # The offline fallback fits the column
+    assert DocumentService._embed_fallback(["hello"]).shape == (1, EMBEDDING_DIM)
+
+
+@pytest.mark.parametrize("stream_batch", [2048, 3])
+def test_ingest_with_embedding_cache_on_shared_connection(db, remote_embeddings, monkeypatch, stream_batch):
+    """Cache I/O runs on the ingest session, so it can't roll back the ingest's flushed rows."""
+    monkeypatch.setattr(document_service, "EMBED_STREAM_BATCH", stream_batch)
+    tenant_id = str(uuid.uuid4())
+    text = " ".join(f"Sentence number {i} is Here." for i in range(400))
+
+    doc_id, chunk_count = DocumentService(db).process_and_store(tenant_id, "First", text, "")
+    sent = sum(remote_embeddings)
+    assert sent == chunk_count
+    assert db.get(Document, uuid.UUID(doc_id)).status == "INDEXED"
+
+    # Re-ingesting the same content is served entirely from the cache
+    DocumentService(db).process_and_store(tenant_id, "Second", text, "")
+    assert sum(remote_embeddings) == sent
+    assert db.query(Document).count() == 2
+    assert db.query(KnowledgeChunk).count() == 2 * chunk_count
+    assert db.query(EmbeddingCacheEntry).count() == chunk_count
+
+
+def test_chunk_text_windows_overlap_and_cover_text():
+    text = "".join(chr(ord("a") + i % 26) for i in range(1650))
+    chunks = chunk_text(text, chunk_size=700, overlap=100)
+    assert [len(c) for c in chunks] == [700, 700, 450]
+    assert chunks[0][-100:] == chunks[1][:100]
+    assert chunks[-1] == text[1200:]
+    assert chunk_text(text[:700]) == [text[:700]]
+    assert chunk_text("") == []
+    with pytest.raises(ValueError):
+        chunk_text(text, chunk_size=100, overlap=100)
+
+
+def test_file_suffix():
+    assert file_suffix("Report.PDF") == ".pdf"
+    assert file_suffix("archive.tar.gz") == ".gz"
+    assert file_suffix("README") == ""
+
+
+def test_csv_rows_keep_quoting_without_terminator():
+    """Rows are csv.writer-serialized (commas/newlines in cells stay quoted) with no trailing "\r\n"."""
+    data = 'Employee_Name,Notes\r\n"Akinkuolie, Sarah","line one\nline two"\r\nSmith,plain\r\n'.encode("utf-8-sig")
+    rows = extract_rows("staff.CSV", data)
+    assert rows == [
+        "Employee_Name,Notes",
+        '"Akinkuolie, Sarah","line one\nline two"',
+        "Smith,plain",
+    ]
+    assert next(csv.reader(io.StringIO(rows[1]))) == ["Akinkuolie, Sarah", "line one\nline two"]
+
+
+def test_extract_dispatch_by_suffix():
+    """Unknown suffixes are read as text; only tabular types have rows."""
+    assert extract_text("notes.md", "héllo\nworld".encode("utf-8")) == "héllo\nworld"
+    assert extract_rows("notes.md", b"a,b") == []
+    buf = io.BytesIO(b"a,b\n1,2\n")
+    assert extract_rows("t.csv", buf) == ["a,b", "1,2"]
+    # The caller's stream is left open
+    assert not buf.closed
+
+
+def test_pptx_text_includes_group_shapes():
+    from pptx import Presentation
+    from pptx.util import Inches
+
+    prs = Presentation()
+    slide = prs.slides.add_slide(prs.slide_layouts[6])
+    slide.shapes.add_textbox(Inches(1), Inches(1), Inches(2), Inches(1)).text_frame.text = "Top level"
+    group = slide.shapes.add_group_shape()
+    group.shapes.add_textbox(Inches(1), Inches(3), Inches(2), Inches(1)).text_frame.text = "Grouped"
+    out = io.BytesIO()
+    prs.save(out)
+
+    text = extract_text("deck.pptx", out.getvalue())
+    assert "Top level" in text
+    assert "Grouped" in text
+
+
+def test_upload_file_route_runs_off_the_event_loop():
+    """A sync route runs in FastAPI's threadpool, so extraction and embedding never block the loop."""
+    assert not inspect.iscoroutinefunction(upload_document_file)
+
+
+def test_long_pdf_is_not_split_across_pool_on_event_loop(monkeypatch):
+    pdfium = pytest.importorskip("pypdfium2")
+    pdf = pdfium.PdfDocument.new()
+    for _ in range(3):
+        pdf.new_page(200, 200)
+    out = io.BytesIO()
+    pdf.save(out)
+    pdf.close()
+
+    def no_pool():
+        raise AssertionError("the process pool must not be awaited on an event-loop thread")
+
+    monkeypatch.setattr(text_extraction, "PDF_PAGES_PER_TASK", 1)
+    monkeypatch.setattr(text_extraction, "EXTRACT_WORKERS", 2)
+    monkeypatch.setattr(text_extraction, "_get_pool", no_pool)
+
+    async def extract_on_loop():
+        return extract_text("long.pdf", out.getvalue())
+
+    assert asyncio.run(extract_on_loop()).count("[[PAGE:") == 3
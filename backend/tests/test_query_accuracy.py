@@ -1,234 +1,147 @@
 """
 Test cases to verify chatbot accuracy for employee queries.
 """
-import pytest
+import asyncio
+import sys
 import uuid
+from pathlib import Path
 from unittest.mock import MagicMock, patch
+
+import pytest
 from sqlalchemy.orm import Session
-from ai_core.api.v1.query import post_query
-from ai_core.models.message import QueryRequest, QueryResponse
-from shared.database.models import KnowledgeChunk, Document, KnowledgeBase
 
+# Ensure src is in path
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+sys.path.insert(0, str(SRC))
 
-def test_employee_salary_query_exact_match():
-    """Test that querying for a specific employee returns their correct data."""
-    
-    # Mock database session
+from ai_core.api.v1.query import is_sensitive_query, post_query  # noqa: E402
+from ai_core.models.message import QueryRequest  # noqa: E402
+from ai_core.services.tenant_corpus import TenantCorpus  # noqa: E402
+
+EMPLOYEE_COLUMNS = ("employee_name", "department", "salary", "manager", "status")
+
+
+def run_query(rows, message):
+    """Answer message over a tenant corpus of CSV rows (as stored by a file upload), without a database."""
+    fingerprint = (len(rows), "latest")
+    corpus = TenantCorpus(fingerprint, [uuid.uuid4() for _ in rows], list(rows), [EMPLOYEE_COLUMNS] * len(rows))
     mock_db = MagicMock(spec=Session)
-    
-    # Create test data
-    tenant_id = uuid.uuid4()
-    kb_id = uuid.uuid4()
-    doc_id = uuid.uuid4()
-    
-    # Mock employee data (CSV format)
-    employee_data = [
-        # Headers
-        "Employee_Name,Department,Salary,Manager,Status",
-        # Employee 1: Akinkuolie, Sarah
-        "Akinkuolie, Sarah,Engineering,95000,John Smith,Active",
-        # Employee 2: Houlihan, Debra
-        "Houlihan, Debra,Sales,180000,Janet King,Active",
-        # Employee 3: Smith, John
-        "Smith, John,Management,150000,CEO,Active"
-    ]
-    
-    # Mock knowledge chunks with embeddings
-    chunks = []
-    for i, row in enumerate(employee_data[1:]):  # Skip header
-        chunk = MagicMock()
-        chunk.content = row
-        chunk.embedding = [0.1] * 256  # Mock embedding
-        chunks.append((row, chunk.embedding, {"columns": ["employee_name", "department", "salary", "manager", "status"]}))
-    
-    # Mock the database query
-    mock_db.query.return_value.join.return_value.join.return_value.filter.return_value.order_by.return_value.limit.return_value.all.return_value = chunks
-    
-    # Mock conversation service
-    with patch('ai_core.api.v1.query.ConversationService') as MockConversationService:
-        mock_conv_service = MagicMock()
-        MockConversationService.return_value = mock_conv_service
-        mock_conversation = MagicMock()
-        mock_conversation.id = uuid.uuid4()
+    mock_conversation = MagicMock()
+    mock_conversation.id = uuid.uuid4()
+    mock_conversation.context = {}
+
+    with patch('ai_core.api.v1.query.conversation_service') as mock_conv_service, \
+            patch('ai_core.api.v1.query.corpus_fingerprint', return_value=fingerprint), \
+            patch('ai_core.api.v1.query.peek_tenant_corpus', return_value=None), \
+            patch('ai_core.api.v1.query.has_content_tsv', return_value=False), \
+            patch('ai_core.api.v1.query.get_tenant_corpus', return_value=corpus):
         mock_conv_service.get_or_create_conversation.return_value = mock_conversation
-        
-        # Test query for Akinkuolie, Sarah's salary
         request = QueryRequest(
-            tenant_id=str(tenant_id),
+            tenant_id=str(uuid.uuid4()),
             user_id=str(uuid.uuid4()),
-            message="What is the salary of Akinkuolie, Sarah?",
+            message=message,
             channel="web",
             context={}
         )
-        
-        response = post_query(request, mock_db)
-        
-        # Verify the response
-        assert response.response == "Salary: 95000"
-        assert response.confidence >= 0.9
-        assert not response.requiresHuman
-        assert "Akinkuolie, Sarah" in response.citations[0]["snippet"]
+        response = asyncio.run(post_query(request, mock_db))
+    return response, mock_conversation
+
+
+def test_employee_salary_query_exact_match():
+    """Test that querying for a specific employee returns their correct data."""
+    # Employee rows as csv.writer stores them at upload (header row is kept as document metadata)
+    employee_rows = [
+        '"Akinkuolie, Sarah",Engineering,95000,John Smith,Active',
+        '"Houlihan, Debra",Sales,180000,Janet King,Active',
+        '"Smith, John",Management,150000,CEO,Active',
+    ]
+
+    response, conversation = run_query(employee_rows, "What is the salary of Akinkuolie, Sarah?")
+
+    assert response.response == "The salary of Akinkuolie, Sarah is $95,000."
+    assert response.confidence >= 0.9
+    assert not response.requires_human
+    assert "Akinkuolie, Sarah" in response.citations[0].snippet
+    # Remembered for follow-ups like "what is his manager?"
+    assert conversation.context["last_person"] == "Akinkuolie, Sarah"
 
 
 def test_employee_query_no_match():
     """Test that querying for a non-existent employee returns appropriate error."""
-    
-    # Mock database session
-    mock_db = MagicMock(spec=Session)
-    
-    # Create test data
-    tenant_id = uuid.uuid4()
-    
-    # Mock employee data (CSV format) - without the queried employee
-    employee_data = [
-        # Headers
-        "Employee_Name,Department,Salary,Manager,Status",
-        # Employee 1: Different person
-        "Houlihan, Debra,Sales,180000,Janet King,Active",
-        "Smith, John,Management,150000,CEO,Active"
+    # Employee rows without the queried employee
+    employee_rows = [
+        '"Houlihan, Debra",Sales,180000,Janet King,Active',
+        '"Smith, John",Management,150000,CEO,Active',
     ]
-    
-    # Mock knowledge chunks with embeddings
-    chunks = []
-    for i, row in enumerate(employee_data[1:]):  # Skip header
-        chunk = MagicMock()
-        chunk.content = row
-        chunk.embedding = [0.1] * 256  # Mock embedding
-        chunks.append((row, chunk.embedding, {"columns": ["employee_name", "department", "salary", "manager", "status"]}))
-    
-    # Mock the database query
-    mock_db.query.return_value.join.return_value.join.return_value.filter.return_value.order_by.return_value.limit.return_value.all.return_value = chunks
-    
-    # Mock conversation service
-    with patch('ai_core.api.v1.query.ConversationService') as MockConversationService:
-        mock_conv_service = MagicMock()
-        MockConversationService.return_value = mock_conv_service
-        mock_conversation = MagicMock()
-        mock_conversation.id = uuid.uuid4()
-        mock_conv_service.get_or_create_conversation.return_value = mock_conversation
-        
-        # Test query for non-existent employee
-        request = QueryRequest(
-            tenant_id=str(tenant_id),
-            user_id=str(uuid.uuid4()),
-            message="What is the salary of Akinkuolie, Sarah?",
-            channel="web",
-            context={}
-        )
-        
-        response = post_query(request, mock_db)
-        
-        # Verify the response indicates no match
-        assert "No record found" in response.response or "Akinkuolie, Sarah" in response.response
-        assert response.confidence == 0.0
-        assert response.requiresHuman
+
+    response, _conversation = run_query(employee_rows, "What is the salary of Akinkuolie, Sarah?")
+
+    assert "Akinkuolie, Sarah" in response.response
+    assert "couldn't find any records" in response.response
+    assert response.confidence == 0.0
+    assert response.requires_human
 
 
 def test_employee_department_query():
     """Test that querying for department returns correct information."""
-    
-    # Mock database session
-    mock_db = MagicMock(spec=Session)
-    
-    # Create test data
-    tenant_id = uuid.uuid4()
-    
-    # Mock employee data (CSV format)
-    employee_data = [
-        # Headers
-        "Employee_Name,Department,Salary,Manager,Status",
-        # Employee 1
-        "Akinkuolie, Sarah,Engineering,95000,John Smith,Active",
-        # Employee 2
-        "Houlihan, Debra,Sales,180000,Janet King,Active"
+    employee_rows = [
+        '"Akinkuolie, Sarah",Engineering,95000,John Smith,Active',
+        '"Houlihan, Debra",Sales,180000,Janet King,Active',
     ]
-    
-    # Mock knowledge chunks with embeddings
-    chunks = []
-    for i, row in enumerate(employee_data[1:]):  # Skip header
-        chunk = MagicMock()
-        chunk.content = row
-        chunk.embedding = [0.1] * 256  # Mock embedding
-        chunks.append((row, chunk.embedding, {"columns": ["employee_name", "department", "salary", "manager", "status"]}))
-    
-    # Mock the database query
-    mock_db.query.return_value.join.return_value.join.return_value.filter.return_value.order_by.return_value.limit.return_value.all.return_value = chunks
-    
-    # Mock conversation service
-    with patch('ai_core.api.v1.query.ConversationService') as MockConversationService:
-        mock_conv_service = MagicMock()
-        MockConversationService.return_value = mock_conv_service
-        mock_conversation = MagicMock()
-        mock_conversation.id = uuid.uuid4()
-        mock_conv_service.get_or_create_conversation.return_value = mock_conversation
-        
-        # Test query for department
-        request = QueryRequest(
-            tenant_id=str(tenant_id),
-            user_id=str(uuid.uuid4()),
-            message="What is the department of Houlihan, Debra?",
-            channel="web",
-            context={}
-        )
-        
-        response = post_query(request, mock_db)
-        
-        # Verify the response
-        assert response.response == "Department: Sales"
-        assert response.confidence >= 0.9
-        assert not response.requiresHuman
+
+    response, _conversation = run_query(employee_rows, "What is the department of Houlihan, Debra?")
+
+    assert response.response == "The department of Houlihan, Debra is Sales."
+    assert response.confidence >= 0.9
+    assert not response.requires_human
 
 
 def test_name_variants_matching():
     """Test that different name formats are properly matched."""
-    
-    # Mock database session
-    mock_db = MagicMock(spec=Session)
-    
-    # Create test data
-    tenant_id = uuid.uuid4()
-    
-    # Mock employee data with "Last, First" format
-    employee_data = [
-        # Headers
-        "Employee_Name,Department,Salary,Manager,Status",
-        # Employee with comma-separated name
-        "Akinkuolie, Sarah,Engineering,95000,John Smith,Active"
+    # Stored in "Last, First" format
+    employee_rows = [
+        '"Akinkuolie, Sarah",Engineering,95000,John Smith,Active',
     ]
-    
-    # Mock knowledge chunks
-    chunks = []
-    for i, row in enumerate(employee_data[1:]):  # Skip header
-        chunk = MagicMock()
-        chunk.content = row
-        chunk.embedding = [0.1] * 256  # Mock embedding
-        chunks.append((row, chunk.embedding, {"columns": ["employee_name", "department", "salary", "manager", "status"]}))
-    
-    # Mock the database query
-    mock_db.query.return_value.join.return_value.join.return_value.filter.return_value.order_by.return_value.limit.return_value.all.return_value = chunks
-    
-    # Mock conversation service
-    with patch('ai_core.api.v1.query.ConversationService') as MockConversationService:
-        mock_conv_service = MagicMock()
-        MockConversationService.return_value = mock_conv_service
-        mock_conversation = MagicMock()
-        mock_conversation.id = uuid.uuid4()
-        mock_conv_service.get_or_create_conversation.return_value = mock_conversation
-        
-        # Test query with "First Last" format (reverse of stored format)
-        request = QueryRequest(
-            tenant_id=str(tenant_id),
-            user_id=str(uuid.uuid4()),
-            message="What is the salary of Sarah Akinkuolie?",
-            channel="web",
-            context={}
-        )
-        
-        response = post_query(request, mock_db)
-        
-        # Verify the response matches correctly despite different name format
-        assert response.response == "Salary: 95000"
-        assert response.confidence >= 0.9
+
+    # Queried in "First Last" format
+    response, _conversation = run_query(employee_rows, "What is the salary of Sarah Akinkuolie?")
+
+    assert response.response == "The salary of Akinkuolie, Sarah is $95,000."
+    assert response.confidence >= 0.9
+
+    # And the other way round
+    employee_rows = [
+        'Sarah Akinkuolie,Engineering,95000,John Smith,Active',
+    ]
+    response, _conversation = run_query(employee_rows, "What is the salary of Akinkuolie, Sarah?")
+
+    assert response.response == "The salary of Sarah Akinkuolie is $95,000."
+
+
+@pytest.mark.parametrize("message", [
+    "What is the race of Sarah?",
+    "What races are the staff",
+    "list employee religions",
+    "ethnicities of Bob",
+    "Is Debra religious?",
+    "racial breakdown of the sales team",
+    "How many Hispanics work here?",
+    "What is her sexual orientation?",
+])
+def test_sensitive_attribute_queries_are_flagged(message):
+    """Protected-attribute questions are refused in plural and inflected forms too."""
+    assert is_sensitive_query(message)
+
+
+@pytest.mark.parametrize("message", [
+    "Who owns the racehorse?",
+    "Trace the approval process",
+    "What is the salary of Akinkuolie, Sarah?",
+])
+def test_non_sensitive_queries_are_not_flagged(message):
+    """Words that merely contain a protected term are not refused."""
+    assert not is_sensitive_query(message)
 
 
 if __name__ == "__main__":
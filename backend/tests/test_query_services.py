@@ -0,0 +1,342 @@
+"""
+Tests for the query-path services: micro-batching, caches, the tenant corpus and conversations.
+"""
+import asyncio
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Ensure src is in path
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+sys.path.insert(0, str(SRC))
+
+from shared.database import session as db_session  # noqa: E402
+from shared.database.models import Base, Conversation, Tenant, User  # noqa: E402
+from ai_core.services import conversation_service as conversation_module  # noqa: E402
+from ai_core.services.conversation_service import conversation_service  # noqa: E402
+from ai_core.services.embedding_batcher import EmbeddingBatcher  # noqa: E402
+from ai_core.services.message_batcher import MessageBatcher  # noqa: E402
+from ai_core.services.micro_batcher import MicroBatcher  # noqa: E402
+from ai_core.services.semantic_cache import SemanticCache  # noqa: E402
+from ai_core.services import tenant_corpus as tenant_corpus_module  # noqa: E402
+from ai_core.services.tenant_corpus import (  # noqa: E402
+    TenantCorpus, norm_name, parse_csv_row, quantize_embedding, row_name_keys,
+)
+
+
+@pytest.fixture
+def loop():
+    """An event loop running in a background thread, as the app's loop is for worker threads."""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        yield loop
+    finally:
+        async def cancel_tasks():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(cancel_tasks(), loop).result(timeout=5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        loop.close()
+
+
+def test_embedding_batcher_batches_concurrent_queries(loop):
+    """Queries that arrive together share one embeddings call and each get their own vector."""
+    calls = []
+
+    def embed_fn(texts):
+        calls.append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+    batcher = EmbeddingBatcher(embed_fn, max_wait_ms=100)
+    results = {}
+    threads = [
+        threading.Thread(target=lambda t=t: results.__setitem__(t, batcher.embed_threadsafe(t, loop)))
+        for t in ("a", "bb", "ccc")
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {"a": [1.0], "bb": [2.0], "ccc": [3.0]}
+    assert len(calls) == 1
+
+
+def test_embedding_batcher_timeout_returns_none(loop):
+    """A slow embeddings call degrades to None (no vector) instead of raising into the request."""
+    def slow_embed(texts):
+        time.sleep(1.0)
+        return [[1.0] for _ in texts]
+
+    batcher = EmbeddingBatcher(slow_embed, max_wait_ms=1)
+    started = time.monotonic()
+    assert batcher.embed_threadsafe("hello", loop, timeout=0.1) is None
+    assert time.monotonic() - started < 0.9
+
+
+def test_embedding_batcher_holds_in_flight_flushes(loop):
+    """A flush task stays referenced until it finishes, so it can't be garbage-collected mid-flight."""
+    release = threading.Event()
+
+    def blocking_embed(texts):
+        release.wait(5)
+        return [[1.0] for _ in texts]
+
+    batcher = EmbeddingBatcher(blocking_embed, max_wait_ms=1)
+    result = []
+    thread = threading.Thread(target=lambda: result.append(batcher.embed_threadsafe("hello", loop)))
+    thread.start()
+    deadline = time.monotonic() + 5
+    while not batcher._batcher._flushes and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(batcher._batcher._flushes) == 1
+    release.set()
+    thread.join()
+    assert result == [[1.0]]
+    # Released by the done callback, which runs just after the caller's result is set
+    deadline = time.monotonic() + 5
+    while batcher._batcher._flushes and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not batcher._batcher._flushes
+
+
+def test_embedding_batcher_failure_returns_none(loop):
+    def failing_embed(texts):
+        raise RuntimeError("embeddings unavailable")
+
+    batcher = EmbeddingBatcher(failing_embed, max_wait_ms=1)
+    assert batcher.embed_threadsafe("hello", loop) is None
+
+
+def test_message_batcher_writes_one_batch_per_window():
+    batches = []
+    batcher = MessageBatcher(lambda rows: batches.append(rows), max_wait_ms=50)
+
+    async def send():
+        return await asyncio.gather(*(batcher.add("c1", "AI", f"reply {i}") for i in range(5)))
+
+    assert asyncio.run(send()) == [True] * 5
+    assert len(batches) == 1
+    assert [row["content"] for row in batches[0]] == [f"reply {i}" for i in range(5)]
+    assert batches[0][0]["message_type"] == "TEXT"
+
+
+def test_message_batcher_write_failure_resolves_false():
+    def failing_write(rows):
+        raise RuntimeError("database down")
+
+    batcher = MessageBatcher(failing_write, max_wait_ms=1)
+
+    async def send():
+        return await batcher.add("c1", "AI", "reply")
+
+    assert asyncio.run(send()) is False
+
+
+def test_micro_batcher_flush_errors_reach_callers():
+    async def failing_flush(items):
+        raise RuntimeError("flush failed")
+
+    batcher = MicroBatcher(failing_flush, max_batch=10, max_wait_ms=1)
+
+    async def submit():
+        return await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+
+    results = asyncio.run(submit())
+    assert [type(r) for r in results] == [RuntimeError, RuntimeError]
+
+
+def test_semantic_cache_hits_similar_queries_of_same_tenant_and_field():
+    cache = SemanticCache(threshold=0.95, ttl=60)
+    fp = (3, "latest")
+    result = {"response": "cached"}
+    cache.put("t1", fp, "salary", [1.0, 0.0, 0.0], result)
+
+    assert cache.get("t1", fp, "salary", [0.99, 0.01, 0.0]) == result
+    assert cache.get("t1", fp, "salary", [0.0, 1.0, 0.0]) is None
+    assert cache.get("t1", fp, "department", [1.0, 0.0, 0.0]) is None
+    assert cache.get("t2", fp, "salary", [1.0, 0.0, 0.0]) is None
+    # Embeddings of another model (dimension) never compare against these
+    assert cache.get("t1", fp, "salary", [1.0, 0.0]) is None
+
+    cache.invalidate_tenant("t1")
+    assert cache.get("t1", fp, "salary", [1.0, 0.0, 0.0]) is None
+
+
+def test_semantic_cache_misses_after_corpus_changes():
+    """Another worker's ingest changes the fingerprint; answers from the old corpus stop being served."""
+    cache = SemanticCache(ttl=60)
+    cache.put("t1", (3, "old"), "salary", [1.0, 0.0], {"response": "old corpus"})
+
+    assert cache.get("t1", (4, "new"), "salary", [1.0, 0.0]) is None
+    cache.put("t1", (4, "new"), "salary", [1.0, 0.0], {"response": "new corpus"})
+    assert cache.get("t1", (4, "new"), "salary", [1.0, 0.0]) == {"response": "new corpus"}
+    assert cache.get("t1", (3, "old"), "salary", [1.0, 0.0]) is None
+
+
+def test_semantic_cache_entries_expire():
+    cache = SemanticCache(ttl=0)
+    cache.put("t1", (1, "fp"), None, [1.0, 2.0], {"response": "stale"})
+    time.sleep(0.01)
+    assert cache.get("t1", (1, "fp"), None, [1.0, 2.0]) is None
+
+
+def test_parse_csv_row_and_name_keys():
+    assert parse_csv_row("a,b,c") == ["a", "b", "c"]
+    assert parse_csv_row('"Akinkuolie, Sarah",Sales') == ["Akinkuolie, Sarah", "Sales"]
+    assert row_name_keys('"Akinkuolie,  Sarah",\ufeffSALES') == {"akinkuolie, sarah", "sales"}
+    assert norm_name("  Jane   DOE ") == "jane doe"
+
+
+def _employee_corpus():
+    cols = ("employee_name", "department")
+    return TenantCorpus(
+        (3, "fp"),
+        [uuid.uuid4() for _ in range(3)],
+        ['"Akinkuolie, Sarah",Engineering', "Free text chunk", "Jane Doe,Sales"],
+        [cols, None, cols],
+    )
+
+
+def test_tenant_corpus_name_lookup():
+    corpus = _employee_corpus()
+    assert corpus.rows_matching_names({"jane doe"}) == [2]
+    assert corpus.rows_matching_names({"akinkuolie, sarah", "jane doe"}) == [0, 2]
+    # Non-tabular chunks are never name-matched
+    assert corpus.rows_matching_names({"free text chunk"}) == []
+
+
+def test_tenant_corpus_cells():
+    corpus = _employee_corpus()
+    assert corpus.cell(0, "department") == "Engineering"
+    assert corpus.cell(1, "department") == ""
+    assert corpus.cell(2, "employee_name") == "Jane Doe"
+
+
+def test_tenant_corpus_present_columns():
+    corpus = _employee_corpus()
+    assert corpus.present_columns(["salary", "department", "employee_name"]) == ["department", "employee_name"]
+
+
+def test_has_content_tsv_checks_the_table_the_session_resolves(monkeypatch, db):
+    monkeypatch.setattr(tenant_corpus_module, "_content_tsv_available", None)
+    assert tenant_corpus_module.has_content_tsv(db) is False
+
+    # On PostgreSQL the column is looked up on to_regclass('knowledge_chunks'), not in any schema
+    pg = MagicMock()
+    pg.get_bind.return_value.dialect.name = "postgresql"
+    pg.execute.return_value.first.return_value = (1,)
+    monkeypatch.setattr(tenant_corpus_module, "_content_tsv_available", None)
+    assert tenant_corpus_module.has_content_tsv(pg) is True
+    sql = str(pg.execute.call_args[0][0])
+    assert "to_regclass('knowledge_chunks')" in sql
+    assert "information_schema" not in sql
+
+
+def test_quantize_embedding_roundtrip():
+    v = np.array([3.0, -4.0, 0.5], dtype=np.float32)
+    codes, scale = quantize_embedding(v)
+    unit = v / np.linalg.norm(v)
+    assert np.allclose(np.frombuffer(codes, dtype=np.int8) * scale, unit, atol=scale)
+    # The caller's array is not normalised in place
+    assert v[0] == 3.0
+    assert quantize_embedding([0.0, 0.0]) == (None, None)
+    assert quantize_embedding([]) == (None, None)
+
+
+@pytest.fixture
+def db():
+    """A session on an in-memory SQLite engine, pooled like the app's (one shared connection)."""
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def test_conversation_upsert_reuses_active_conversation(db):
+    tenant = Tenant(name="Acme", domain="acme.test")
+    db.add(tenant)
+    db.commit()
+    user_id = uuid.uuid4()
+
+    first = conversation_service.get_or_create_conversation(db, tenant.id, user_id, "web", context={"k": "v"})
+    second = conversation_service.get_or_create_conversation(db, tenant.id, user_id, "web")
+    other = conversation_service.get_or_create_conversation(db, tenant.id, user_id, "teams")
+    db.commit()
+
+    assert first.id == second.id
+    assert first.context == {"k": "v"}
+    assert other.id != first.id
+    assert db.query(User).filter(User.id == user_id).count() == 1
+    assert db.query(Conversation).count() == 2
+    # create_all builds uq_conversations_active, so the ON CONFLICT path was taken
+    assert conversation_module._active_index_checks[db.get_bind()][0] is True
+
+
+def test_conversation_upsert_falls_back_without_active_index(db):
+    """Before the partial unique index exists, ON CONFLICT would fail; SELECT-then-INSERT is used."""
+    db.execute(text("DROP INDEX uq_conversations_active"))
+    db.commit()
+    tenant = Tenant(name="Acme", domain="acme.test")
+    db.add(tenant)
+    db.commit()
+    user_id = uuid.uuid4()
+
+    first = conversation_service.get_or_create_conversation(db, tenant.id, user_id, "web")
+    second = conversation_service.get_or_create_conversation(db, tenant.id, user_id, "web")
+    db.commit()
+
+    assert first.id == second.id
+    assert conversation_module._active_index_checks[db.get_bind()][0] is False
+
+
+def test_sqlite_shim_closes_duplicate_active_conversations(monkeypatch):
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    tenant_id, user_id = uuid.uuid4().hex, uuid.uuid4().hex
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX uq_conversations_active"))
+        conn.execute(text("INSERT INTO tenants (id, name, domain) VALUES (:t, 'Acme', 'acme.test')"), {"t": tenant_id})
+        conn.execute(
+            text("INSERT INTO users (id, tenant_id, user_type) VALUES (:u, :t, 'EXTERNAL_CUSTOMER')"),
+            {"u": user_id, "t": tenant_id},
+        )
+        for i, started in enumerate(("2025-01-01", "2025-03-01", "2025-02-01")):
+            conn.execute(
+                text(
+                    "INSERT INTO conversations (id, tenant_id, user_id, channel, status, started_at) "
+                    "VALUES (:id, :t, :u, 'web', 'ACTIVE', :s)"
+                ),
+                {"id": f"{i:032x}", "t": tenant_id, "u": user_id, "s": started},
+            )
+    monkeypatch.setattr(db_session, "engine", engine)
+    monkeypatch.setattr(db_session, "DATABASE_URL", "sqlite://")
+
+    db_session._ensure_sqlite_migrations()
+
+    with engine.connect() as conn:
+        active = conn.execute(text("SELECT id FROM conversations WHERE status = 'ACTIVE'")).scalars().all()
+        indexes = conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'")).scalars().all()
+    assert active == [f"{1:032x}"]
+    assert "uq_conversations_active" in indexes
+    engine.dispose()